@@ -2,23 +2,116 @@ import dlib
 import numpy as np
 from PIL import Image
 import os
+import threading
+
+from . import config, lbp
+
+LANDMARK_PROFILES = ("68", "5", "mtcnn")
+PREDICTOR_FILES = {
+    68: "shape_predictor_68_face_landmarks.dat",  # ~100MB: alignment, blink/EAR
+    5: "shape_predictor_5_face_landmarks.dat",    # ~9MB: eye corners and nose, alignment only
+}
+
+# Dlib 68-point indices of the eye contours
+LEFT_EYE = [36, 37, 38, 39, 40, 41]
+RIGHT_EYE = [42, 43, 44, 45, 46, 47]
+
+def eye_aspect_ratios(landmarks) -> np.ndarray:
+    """
+    Mean EAR of both eyes for every frame of an (F, 68, 2) landmark array,
+    computed for all frames at once.
+    """
+    pts = np.asarray(landmarks, dtype=np.float32)
+    eyes = np.stack([pts[:, LEFT_EYE], pts[:, RIGHT_EYE]], axis=1)  # (F, 2 eyes, 6 points, 2)
+    vertical = (np.linalg.norm(eyes[:, :, 1] - eyes[:, :, 5], axis=-1)
+                + np.linalg.norm(eyes[:, :, 2] - eyes[:, :, 4], axis=-1))
+    horizontal = np.linalg.norm(eyes[:, :, 0] - eyes[:, :, 3], axis=-1)
+    ear = np.where(horizontal > 0, vertical / (2.0 * np.maximum(horizontal, 1e-6)), 0.0)
+    return ear.mean(axis=1)
+
+def nonrigid_motion(landmarks) -> np.ndarray:
+    """
+    Landmark movement between consecutive frames once translation, scale
+    and rotation are removed, in units of face size: one value per frame
+    pair. A printed photo or a screen moved in front of the camera moves
+    rigidly and stays near zero; a real face changes shape.
+    """
+    pts = np.asarray(landmarks, dtype=np.float32)
+    pts = pts - pts.mean(axis=1, keepdims=True)
+    pts /= np.maximum(np.sqrt((pts ** 2).sum(axis=(1, 2), keepdims=True)), 1e-6)
+    ref, cur = pts[:-1], pts[1:]
+    # Best rotation of each frame onto the next (2-D Procrustes)
+    theta = np.arctan2(
+        (ref[..., 0] * cur[..., 1] - ref[..., 1] * cur[..., 0]).sum(axis=1),
+        (ref[..., 0] * cur[..., 0] + ref[..., 1] * cur[..., 1]).sum(axis=1),
+    )
+    c, s = np.cos(theta)[:, None], np.sin(theta)[:, None]
+    rotated = np.stack([c * ref[..., 0] - s * ref[..., 1], s * ref[..., 0] + c * ref[..., 1]], axis=-1)
+    return np.sqrt(((cur - rotated) ** 2).sum(axis=(1, 2)))
+
+def _load_predictor(points: int):
+    model_path = os.path.join(os.path.dirname(__file__), PREDICTOR_FILES[points])
+    if not os.path.exists(model_path):
+        print(f"WARNING: Dlib model not found at {model_path}")
+        return None
+    return dlib.shape_predictor(model_path)
 
 class AntiSpoofing:
-    def __init__(self):
-        # Dlib Face Detector
-        self.detector = dlib.get_frontal_face_detector()
-        
+    """
+    Landmarks and liveness checks. LANDMARK_PROFILE picks what alignment
+    uses: the 68-point dlib model, the 5-point dlib model, or MTCNN's own
+    points (no dlib model). Outside the 68 profile the 68-point model is
+    only loaded on the first blink/EAR request, and never with
+    BLINK_FEATURES off.
+    """
+    def __init__(self, profile: str = None):
+        self.profile = profile or config.LANDMARK_PROFILE
+        if self.profile not in LANDMARK_PROFILES:
+            raise ValueError(f"LANDMARK_PROFILE must be one of {', '.join(LANDMARK_PROFILES)}")
+        self._lock = threading.Lock()
+        self._detector = None
+        self._predictor = None
+        self._predictor_tried = False
+
         # Dlib Landmark Predictor
-        model_path = os.path.join(os.path.dirname(__file__), "shape_predictor_68_face_landmarks.dat")
-        if not os.path.exists(model_path):
-             print(f"WARNING: Dlib model not found at {model_path}")
-             self.predictor = None
-        else:
-             self.predictor = dlib.shape_predictor(model_path)
+        if self.profile == "68":
+            self._predictor = _load_predictor(68)
+            self._predictor_tried = True
+        self.predictor_5 = _load_predictor(5) if self.profile == "5" else None
 
         # EAR Thresholds
         self.EAR_THRESHOLD = 0.30 # Increased to make blink detection easier
 
+        # LBP texture model (python -m app.lbp calibrate)
+        self.texture_model = None
+        if config.LBP_MODEL_PATH:
+            if os.path.exists(config.LBP_MODEL_PATH):
+                self.texture_model = lbp.TextureModel.load(config.LBP_MODEL_PATH)
+            else:
+                print(f"WARNING: LBP model not found at {config.LBP_MODEL_PATH}")
+
+    @property
+    def detector(self):
+        # Dlib Face Detector (HOG), created on first use
+        if self._detector is None:
+            self._detector = dlib.get_frontal_face_detector()
+        return self._detector
+
+    @property
+    def predictor(self):
+        """
+        The 68-point predictor, or None when it is missing or not allowed.
+        """
+        if not self._predictor_tried and config.BLINK_FEATURES:
+            with self._lock:
+                if not self._predictor_tried:
+                    self._predictor = _load_predictor(68)
+                    self._predictor_tried = True
+        return self._predictor
+
+    def _missing_predictor_error(self) -> str:
+        return "Model not loaded" if config.BLINK_FEATURES or self.profile == "68" else "Blink features disabled"
+
     def calculate_ear(self, landmarks, indices):
         """
         Calculates Eye Aspect Ratio using Dlib points.
@@ -41,7 +134,7 @@ class AntiSpoofing:
         Returns { "blink": bool, "ear": float }
         """
         if self.predictor is None:
-            return { "blink": False, "ear": 0.0, "error": "Model not loaded" }
+            return { "blink": False, "ear": 0.0, "error": self._missing_predictor_error() }
 
         # Convert PIL to numpy (Grayscale is fine for Dlib)
         img_np = np.array(image.convert('RGB'))
@@ -107,5 +200,81 @@ class AntiSpoofing:
         landmarks = [to_np(i) for i in range(68)]
         return np.array(landmarks)
 
-    def check_texture_lbp(self, image: Image.Image):
-         return True, 1.0, "LBP Bypassed"
+    def get_landmarks_in_box(self, image: Image.Image, box) -> np.ndarray:
+        """
+        Returns 68 face landmarks for a face another detector already found
+        (x1, y1, x2, y2), skipping dlib's own face detection.
+        """
+        if self.predictor is None:
+            return None
+        gray = np.array(image.convert('L'))
+        shape = self.predictor(gray, dlib.rectangle(*(int(v) for v in box)))
+        return np.array([[shape.part(i).x, shape.part(i).y] for i in range(68)])
+
+    def align_detection(self, face_detector, image: Image.Image, box, points, landmarks=None) -> Image.Image:
+        """
+        Aligns one MTCNN detection (box and 5 points) with the landmarks of
+        the profile, falling back to MTCNN's points. Enrollment, recognition
+        and video ingestion all align through here, so stored templates and
+        queries are aligned the same way. `landmarks`: the detection's 68
+        points if already computed (liveness).
+        """
+        if self.profile == "68":
+            if landmarks is None:
+                landmarks = self.get_landmarks_in_box(image, box)
+            if landmarks is not None:
+                return face_detector.align_face(image, landmarks)
+        elif self.profile == "5":
+            eyes = self.get_eye_centers(image, box)
+            if eyes is not None:
+                return face_detector.align_eyes(image, eyes)
+        return face_detector.align_face_5(image, points)
+
+    def get_eye_centers(self, image: Image.Image, box) -> np.ndarray:
+        """
+        (image-left eye, image-right eye) centres from the 5-point model for
+        a face found by MTCNN, or None outside the 5-point profile.
+        """
+        if self.predictor_5 is None:
+            return None
+        gray = np.array(image.convert('L'))
+        shape = self.predictor_5(gray, dlib.rectangle(*(int(v) for v in box)))
+        points = np.array([[shape.part(i).x, shape.part(i).y] for i in range(5)], dtype=np.float32)
+        # Points 0-1 are the corners of the image-right eye, 2-3 of the
+        # image-left eye, 4 is under the nose
+        return np.array([points[2:4].mean(axis=0), points[0:2].mean(axis=0)])
+
+    def check_liveness(self, landmark_series) -> dict:
+        """
+        Liveness from the landmarks of a burst of frames: a blink (EAR dips
+        below the threshold from an open-eye baseline) or non-rigid face
+        motion between frames.
+        """
+        series = [l for l in landmark_series if l is not None]
+        if len(series) < 2:
+            error = self._missing_predictor_error() if self.predictor is None else "Not enough frames with a face"
+            return {"live": False, "blink": False, "frames": len(series), "error": error}
+
+        landmarks = np.stack(series)
+        ears = eye_aspect_ratios(landmarks)
+        blink = bool(ears.min() < self.EAR_THRESHOLD and ears.max() - ears.min() >= config.LIVENESS_EAR_DELTA)
+        motion = float(np.median(nonrigid_motion(landmarks)))
+        return {
+            "live": blink or motion >= config.LIVENESS_MOTION_MIN,
+            "blink": blink,
+            "ear_min": float(ears.min()),
+            "ear_max": float(ears.max()),
+            "motion": motion,
+            "frames": len(series),
+        }
+
+    def check_texture_lbp(self, face_image: Image.Image):
+        """
+        Texture spoof check on an aligned 112x112 face crop.
+        Returns (is_real, score, message); score is P(live).
+        """
+        if self.texture_model is None:
+            return True, 1.0, "LBP Bypassed (no model)"
+        score = self.texture_model.score(face_image)
+        is_real = score >= self.texture_model.threshold
+        return is_real, score, "Live texture" if is_real else "Spoof texture"
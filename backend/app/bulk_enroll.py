@@ -0,0 +1,342 @@
+"""
+Bulk enrollment from an archive (.zip, .tar, .tar.gz) or a local directory:
+
+    names.csv                    enrollment_number,name[,email,phone,enrollment_type,program_id,admission_year]
+    <enrollment_number>/*.jpg    one or more face images per person
+
+The CSV can also be uploaded separately. A job runs on a background thread:
+a thread pool decodes, detects and aligns each person's images, the aligned
+crops of a whole batch of people are embedded in one forward pass, and the
+batch is inserted with a single multi-row INSERT. Progress and per-person
+failures are stored in enrollment_jobs / enrollment_job_errors.
+"""
+import csv
+import io
+import os
+import tarfile
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.exc import StatementError
+
+from . import config, db, models
+from .edgeface import encode_crop
+from .gallery import centroid
+from .ingest import IngestError, decode_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+NAMES_FILE = "names.csv"
+TARGETS = ("student", "user")
+ENROLLMENT_TYPES = tuple(t.value for t in models.EnrollmentType)
+
+# ------------------------------------------------------------
+# Sources
+# ------------------------------------------------------------
+
+def _group_images(paths):
+    """
+    {enrollment_number: [image paths]} from paths like "<number>/<file>",
+    allowing one top-level folder around everything.
+    """
+    people = {}
+    for path in paths:
+        parts = [p for p in path.replace("\\", "/").split("/") if p]
+        if len(parts) < 2 or not parts[-1].lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        people.setdefault(parts[-2], []).append(path)
+    return {number: sorted(images) for number, images in people.items()}
+
+class DirectorySource:
+    def __init__(self, path: str):
+        self.path = path
+
+    def paths(self):
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                yield os.path.relpath(os.path.join(root, name), self.path)
+
+    def size(self, name: str) -> int:
+        return os.path.getsize(os.path.join(self.path, name))
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.path, name), "rb") as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+class ZipSource:
+    def __init__(self, path: str):
+        self.archive = zipfile.ZipFile(path)
+        self._lock = threading.Lock()
+
+    def paths(self):
+        return (info.filename for info in self.archive.infolist() if not info.is_dir())
+
+    def size(self, name: str) -> int:
+        return self.archive.getinfo(name).file_size
+
+    def read(self, name: str) -> bytes:
+        with self._lock:
+            return self.archive.read(name)
+
+    def close(self):
+        self.archive.close()
+
+class TarSource:
+    def __init__(self, path: str):
+        self.archive = tarfile.open(path)
+        self._lock = threading.Lock()
+
+    def paths(self):
+        return (member.name for member in self.archive.getmembers() if member.isfile())
+
+    def size(self, name: str) -> int:
+        return self.archive.getmember(name).size
+
+    def read(self, name: str) -> bytes:
+        # tarfile is not thread-safe
+        with self._lock:
+            return self.archive.extractfile(name).read()
+
+    def close(self):
+        self.archive.close()
+
+def open_source(path: str):
+    if os.path.isdir(path):
+        return DirectorySource(path)
+    if zipfile.is_zipfile(path):
+        return ZipSource(path)
+    if tarfile.is_tarfile(path):
+        return TarSource(path)
+    raise ValueError("Expected a directory, .zip or .tar archive")
+
+def read_names(data: bytes):
+    """
+    {enrollment_number: row} from the names CSV (header row required).
+    """
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    if not reader.fieldnames or not {"enrollment_number", "name"} <= set(reader.fieldnames):
+        raise ValueError(f"{NAMES_FILE} needs enrollment_number and name columns")
+    return {row["enrollment_number"].strip(): row for row in reader if row.get("enrollment_number")}
+
+# ------------------------------------------------------------
+# Job
+# ------------------------------------------------------------
+
+class BulkEnrollment:
+    """
+    Runs one job. `crop_face(image)` returns an aligned face crop or None
+    and `embedder.get_embeddings(crops)` embeds crops in one batch.
+    """
+    def __init__(self, job_id: int, path: str, names_data, target: str, crop_face, embedder, cleanup: bool = False):
+        if target not in TARGETS:
+            raise ValueError(f"target must be one of {', '.join(TARGETS)}")
+        self.job_id = job_id
+        self.path = path
+        self.names_data = names_data
+        self.target = target
+        self.crop_face = crop_face
+        self.embedder = embedder
+        self.cleanup = cleanup
+
+    def start(self):
+        threading.Thread(target=self.run, name=f"bulk-enroll-{self.job_id}", daemon=True).start()
+
+    def _update_job(self, **values):
+        with db.SessionLocal() as session:
+            session.query(models.EnrollmentJob).filter(models.EnrollmentJob.job_id == self.job_id).update(values)
+            session.commit()
+
+    def _record_errors(self, session, errors):
+        if errors:
+            session.execute(insert(models.EnrollmentJobError), [
+                {"job_id": self.job_id, "enrollment_number": number, "error": error, "created_at": datetime.utcnow()}
+                for number, error in errors
+            ])
+
+    def _existing_numbers(self, session, numbers):
+        column = models.Student.enrollment_number if self.target == "student" else models.User.enrollment_number
+        existing = set()
+        numbers = list(numbers)
+        for start in range(0, len(numbers), 1000):
+            existing.update(session.execute(select(column).where(column.in_(numbers[start:start + 1000]))).scalars())
+        return existing
+
+    def _prepare(self, source, number, images):
+        """
+        Decodes and aligns one person's images (runs on the pool), with the
+        same size, format and pixel limits as uploads. Returns the aligned
+        crops, their JPEGs for re-embedding and, when no image was usable,
+        the person's error with each image's reason.
+        """
+        crops, encoded, skipped = [], [], []
+        name = None
+        try:
+            for name in images:
+                if source.size(name) > config.UPLOAD_MAX_PART_BYTES:
+                    skipped.append((name, f"larger than {config.UPLOAD_MAX_PART_BYTES} bytes"))
+                    continue
+                try:
+                    image = decode_image(source.read(name))
+                except IngestError as e:
+                    skipped.append((name, str(e)))
+                    continue
+                crop = self.crop_face(image)
+                if crop is None:
+                    skipped.append((name, "no face detected"))
+                    continue
+                crops.append(crop)
+                encoded.append(encode_crop(crop))
+        # A corrupt archive member (BadZipFile, zlib.error, ...) or a failure
+        # in detection fails this person only, not the whole job
+        except Exception as e:
+            return number, [], [], f"Could not process {os.path.basename(name or '')}: {e}"
+
+        error = None
+        if not crops:
+            error = "No usable image: " + "; ".join(f"{os.path.basename(n)}: {reason}" for n, reason in skipped)
+        return number, crops, encoded, error
+
+    def _embed(self, crops):
+        batches = [
+            self.embedder.get_embeddings(crops[start:start + config.BULK_EMBED_BATCH])
+            for start in range(0, len(crops), config.BULK_EMBED_BATCH)
+        ]
+        return np.vstack(batches) if batches else np.empty((0, 512), dtype=np.float32)
+
+    def _row(self, number, names, embedding):
+        person = names[number]
+        row = {"enrollment_number": number, "name": person["name"].strip(), "embedding": embedding,
+               "embedding_model_version": self.embedder.model_name, "created_at": datetime.utcnow()}
+        if self.target == "student":
+            enrollment_type = (person.get("enrollment_type") or models.EnrollmentType.FT.value).strip()
+            if enrollment_type not in ENROLLMENT_TYPES:
+                raise ValueError(f"enrollment_type must be one of {', '.join(ENROLLMENT_TYPES)}")
+            row.update(
+                email=person.get("email") or None,
+                phone=person.get("phone") or None,
+                enrollment_type=enrollment_type,
+                program_id=int(person["program_id"]) if person.get("program_id") else None,
+                admission_year=int(person["admission_year"]) if person.get("admission_year") else None,
+            )
+        return row
+
+    def _insert(self, session, people):
+        """
+        Inserts [(row, templates, crops)] in one statement per table;
+        returns the number of people stored.
+        """
+        model = models.Student if self.target == "student" else models.User
+        id_column = models.Student.student_id if self.target == "student" else models.User.id
+        ids = session.execute(
+            insert(model).returning(id_column, model.enrollment_number), [row for row, _, _ in people]
+        ).all()
+        by_number = {number: identity_id for identity_id, number in ids}
+        if self.target == "user":
+            session.execute(insert(models.FaceTemplate), [
+                {"user_id": by_number[row["enrollment_number"]], "embedding": template, "source": "enroll",
+                 "embedding_model_version": self.embedder.model_name, "created_at": datetime.utcnow()}
+                for row, templates, _ in people for template in templates
+            ])
+        session.execute(insert(models.FaceCrop), [
+            {"identity_type": self.target, "identity_id": by_number[row["enrollment_number"]],
+             "image": crop, "created_at": datetime.utcnow()}
+            for row, _, crops in people for crop in crops
+        ])
+        return len(ids)
+
+    def _store(self, people):
+        """
+        Bulk insert; if the database rejects the batch (a duplicate email,
+        a value out of range, ...) each person is retried alone in a
+        savepoint so one bad row fails alone.
+        """
+        stored, errors = 0, []
+        with db.SessionLocal() as session:
+            try:
+                stored = self._insert(session, people)
+                session.commit()
+                return stored, errors
+            except StatementError:
+                session.rollback()
+            for person in people:
+                try:
+                    with session.begin_nested():
+                        stored += self._insert(session, [person])
+                # DBAPIError (IntegrityError, DataError, ...) and errors
+                # binding the row's values
+                except StatementError as e:
+                    errors.append((person[0]["enrollment_number"], f"Rejected by the database: {e.orig}"))
+            session.commit()
+        return stored, errors
+
+    def run(self):
+        self._update_job(status="running", started_at=datetime.utcnow())
+        source = None
+        try:
+            source = open_source(self.path)
+            people = _group_images(source.paths())
+            names_data = self.names_data
+            if names_data is None:
+                names_path = next((p for p in source.paths() if os.path.basename(p) == NAMES_FILE), None)
+                if names_path is None:
+                    raise ValueError(f"No {NAMES_FILE} uploaded or found in the archive")
+                names_data = source.read(names_path)
+            names = read_names(names_data)
+
+            numbers = sorted(people)
+            with db.SessionLocal() as session:
+                existing = self._existing_numbers(session, numbers)
+            self._update_job(total=len(numbers))
+
+            processed = succeeded = failed = 0
+            with ThreadPoolExecutor(max_workers=config.BULK_ENROLL_WORKERS) as pool:
+                for start in range(0, len(numbers), config.BULK_ENROLL_BATCH):
+                    batch = numbers[start:start + config.BULK_ENROLL_BATCH]
+                    errors = [(n, "Not listed in names.csv") for n in batch if n not in names]
+                    errors += [(n, "Already enrolled") for n in batch if n in names and n in existing]
+                    todo = [n for n in batch if n in names and n not in existing]
+
+                    prepared = list(pool.map(lambda n: self._prepare(source, n, people[n]), todo))
+                    errors += [(n, error) for n, _, _, error in prepared if error]
+                    prepared = [p[:3] for p in prepared if not p[3]]
+
+                    # One embedding pass for every crop in the batch
+                    embeddings = self._embed([crop for _, crops, _ in prepared for crop in crops])
+                    to_store, offset = [], 0
+                    for number, crops, encoded in prepared:
+                        templates = list(embeddings[offset:offset + len(crops)])
+                        offset += len(crops)
+                        try:
+                            to_store.append((self._row(number, names, centroid(templates)), templates, encoded))
+                        except ValueError as e:
+                            errors.append((number, f"Invalid {NAMES_FILE} row: {e}"))
+
+                    stored = 0
+                    if to_store:
+                        stored, store_errors = self._store(to_store)
+                        errors += store_errors
+                    with db.SessionLocal() as session:
+                        self._record_errors(session, errors)
+                        session.commit()
+
+                    processed += len(batch)
+                    succeeded += stored
+                    failed += len(errors)
+                    self._update_job(processed=processed, succeeded=succeeded, failed=failed)
+
+            self._update_job(status="done", finished_at=datetime.utcnow())
+            print(f"Bulk enrollment {self.job_id}: {succeeded} enrolled, {failed} failed.")
+        except Exception as e:
+            print(f"Bulk enrollment {self.job_id} failed: {e}")
+            self._update_job(status="failed", error=str(e), finished_at=datetime.utcnow())
+        finally:
+            if source is not None:
+                source.close()
+            if self.cleanup:
+                os.remove(self.path)
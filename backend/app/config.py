@@ -0,0 +1,177 @@
+import os
+
+# ------------------------------------------------------------
+# Database pools
+# ------------------------------------------------------------
+# Every gunicorn worker owns its own pools, so the connections a deploy can
+# open are roughly: workers x (sync pool + overflow + async pool + overflow).
+# Keep that under Postgres max_connections (100 by default).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))      # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # drop connections older than this (seconds)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+# Async engine (asyncpg) for the hot endpoints; used when asyncpg is installed.
+DB_ASYNC_ENABLED = os.getenv("DB_ASYNC_ENABLED", "1") == "1"
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "5"))
+DB_ASYNC_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_MAX_OVERFLOW", "2"))
+
+# Read replica for reporting endpoints. Unset = everything goes to the primary.
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "30"))
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", "5"))  # seconds between lag probes
+
+# ------------------------------------------------------------
+# Responses
+# ------------------------------------------------------------
+# gzip responses larger than this many bytes for clients that accept it (0 = off).
+GZIP_MIN_SIZE = int(os.getenv("GZIP_MIN_SIZE", "1024"))
+
+# ------------------------------------------------------------
+# Recognition
+# ------------------------------------------------------------
+RECOGNITION_THRESHOLD = float(os.getenv("RECOGNITION_THRESHOLD", "0.5"))  # min cosine similarity to accept
+
+# Per-session roster galleries (enrolled students' embeddings) kept per worker.
+ROSTER_CACHE_SIZE = int(os.getenv("ROSTER_CACHE_SIZE", "64"))
+ROSTER_CACHE_TTL = float(os.getenv("ROSTER_CACHE_TTL", "300"))  # seconds before a roster is reloaded
+
+# LISTEN/NOTIFY listener that keeps each worker's galleries current.
+GALLERY_LISTEN = os.getenv("GALLERY_LISTEN", "1") == "1"
+
+# Memory-mapped gallery snapshots shared by the workers on a machine
+# (see gallery_snapshot.py). Unset = each worker loads the gallery from the database.
+GALLERY_SNAPSHOT_DIR = os.getenv("GALLERY_SNAPSHOT_DIR")
+GALLERY_SNAPSHOT_POLL = float(os.getenv("GALLERY_SNAPSHOT_POLL", "10"))  # seconds between checks for a new version
+GALLERY_CHANGE_LOG_RETENTION_DAYS = int(os.getenv("GALLERY_CHANGE_LOG_RETENTION_DAYS", "7"))
+# Changes logged up to this many seconds before a snapshot was taken are
+# replayed too: a transaction can take its change seq before the snapshot
+# and commit after it. Must exceed the longest embedding-writing transaction.
+GALLERY_REPLAY_MARGIN = float(os.getenv("GALLERY_REPLAY_MARGIN", "300"))
+
+# First-pass scan precision for galleries: float32 or int8 (per-row scale).
+# int8 re-ranks the best GALLERY_RERANK_K with exact float32 rows read from
+# the snapshot (GALLERY_SNAPSHOT_DIR) or, for galleries loaded from the
+# database, from a temporary file in TMPDIR; only then is memory saved.
+GALLERY_PRECISION = os.getenv("GALLERY_PRECISION", "float32")
+GALLERY_RERANK_K = int(os.getenv("GALLERY_RERANK_K", "32"))
+
+# Multi-template users: the first stage shortlists this many users by
+# centroid, the second takes the best of each shortlisted user's templates.
+TEMPLATE_SHORTLIST = int(os.getenv("TEMPLATE_SHORTLIST", "16"))
+# Keyword arguments for every Gallery, snapshot and shard the app builds
+GALLERY_OPTIONS = {
+    "precision": GALLERY_PRECISION,
+    "rerank_k": GALLERY_RERANK_K,
+    "template_shortlist": TEMPLATE_SHORTLIST,
+}
+# Confident recognitions that still differ from the user's templates are
+# kept as new templates (oldest learned ones are dropped beyond the cap).
+TEMPLATE_LEARNING = os.getenv("TEMPLATE_LEARNING", "1") == "1"
+TEMPLATE_ADD_THRESHOLD = float(os.getenv("TEMPLATE_ADD_THRESHOLD", "0.7"))   # min similarity to learn from
+TEMPLATE_DIVERSITY_MAX = float(os.getenv("TEMPLATE_DIVERSITY_MAX", "0.9"))  # above this it adds nothing new
+MAX_TEMPLATES_PER_USER = int(os.getenv("MAX_TEMPLATES_PER_USER", "10"))
+
+# Sharded users gallery (see gallery_shards.py): comma separated shard
+# addresses, unix socket paths or host:port. Unset = in-process gallery.
+GALLERY_SHARD_ADDRESSES = [a for a in os.getenv("GALLERY_SHARD_ADDRESSES", "").split(",") if a]
+GALLERY_SHARD_AUTHKEY = os.getenv("GALLERY_SHARD_AUTHKEY")
+GALLERY_SHARD_TIMEOUT = float(os.getenv("GALLERY_SHARD_TIMEOUT", "2"))  # seconds to wait for a shard's reply
+
+# Identity types /recognize searches without a session when the request
+# doesn't say: comma separated user, student, faculty, or "all".
+RECOGNITION_IDENTITY_TYPES = os.getenv("RECOGNITION_IDENTITY_TYPES", "user")
+
+# /search limits
+SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", "50"))
+SEARCH_MAX_QUERIES = int(os.getenv("SEARCH_MAX_QUERIES", "100"))
+
+# Duplicate-face check at registration: "reject" (409), "flag" (register and
+# record the match on the user) or "off". Searches DUPLICATE_CHECK_TYPES.
+DUPLICATE_ACTION = os.getenv("DUPLICATE_ACTION", "reject")
+DUPLICATE_THRESHOLD = float(os.getenv("DUPLICATE_THRESHOLD", "0.6"))
+DUPLICATE_CHECK_TYPES = os.getenv("DUPLICATE_CHECK_TYPES", "all")
+
+# Bulk enrollment jobs (see bulk_enroll.py)
+BULK_ENROLL_WORKERS = int(os.getenv("BULK_ENROLL_WORKERS", str(os.cpu_count() or 4)))  # decode/detect threads
+BULK_ENROLL_BATCH = int(os.getenv("BULK_ENROLL_BATCH", "32"))   # people per embedding pass and INSERT
+BULK_EMBED_BATCH = int(os.getenv("BULK_EMBED_BATCH", "64"))     # crops per forward pass
+# Server directory that local-path imports must live under (unset = uploads only).
+BULK_ENROLL_ROOT = os.getenv("BULK_ENROLL_ROOT")
+
+# Classroom mode (/classroom): every face in a few group photos at once
+CLASSROOM_MAX_IMAGES = int(os.getenv("CLASSROOM_MAX_IMAGES", "5"))
+CLASSROOM_MIN_FACE = int(os.getenv("CLASSROOM_MIN_FACE", "24"))             # min face width in pixels
+CLASSROOM_MIN_DETECTION_PROB = float(os.getenv("CLASSROOM_MIN_DETECTION_PROB", "0.9"))
+CLASSROOM_CANDIDATES = int(os.getenv("CLASSROOM_CANDIDATES", "5"))          # roster matches per face
+
+# Face quality (see quality.py)
+QUALITY_FULL_SIZE = float(os.getenv("QUALITY_FULL_SIZE", "112"))    # face width (px) with no size penalty
+QUALITY_SHARPNESS = float(os.getenv("QUALITY_SHARPNESS", "50"))     # Laplacian variance scoring 0.5
+QUALITY_MAX_YAW = float(os.getenv("QUALITY_MAX_YAW", "0.5"))        # nose offset in eye distances scoring 0
+QUALITY_MAX_ROLL = float(os.getenv("QUALITY_MAX_ROLL", "45"))       # degrees
+QUALITY_MAX_PITCH = float(os.getenv("QUALITY_MAX_PITCH", "0.5"))
+# /recognize embeds only the best frames, weighted by quality
+RECOGNITION_BEST_FRAMES = int(os.getenv("RECOGNITION_BEST_FRAMES", "3"))
+RECOGNITION_MIN_QUALITY = float(os.getenv("RECOGNITION_MIN_QUALITY", "0.1"))
+# Progressive /recognize: embed and search frame by frame and stop at the
+# first top match that is at least EARLY_EXIT_SIMILARITY and EARLY_EXIT_MARGIN
+# ahead of the runner-up. Off: score all frames, embed the best in one batch.
+RECOGNITION_EARLY_EXIT = os.getenv("RECOGNITION_EARLY_EXIT", "1") == "1"
+EARLY_EXIT_SIMILARITY = float(os.getenv("EARLY_EXIT_SIMILARITY", "0.65"))
+EARLY_EXIT_MARGIN = float(os.getenv("EARLY_EXIT_MARGIN", "0.1"))
+# Liveness from the /recognize burst itself (request field `liveness`, or on
+# for every request): a blink in the EAR series or non-rigid landmark motion.
+# Requests sending liveness=true are always enforced; LIVENESS_ENFORCE also
+# enforces it for RECOGNITION_LIVENESS (otherwise only reported).
+RECOGNITION_LIVENESS = os.getenv("RECOGNITION_LIVENESS", "0") == "1"
+LIVENESS_ENFORCE = os.getenv("LIVENESS_ENFORCE", "0") == "1"      # fail recognition when not live
+LIVENESS_EAR_DELTA = float(os.getenv("LIVENESS_EAR_DELTA", "0.05"))  # min EAR drop from open eyes for a blink
+LIVENESS_MOTION_MIN = float(os.getenv("LIVENESS_MOTION_MIN", "0.03"))  # median shape change between frames; tune per camera
+# Landmarks used for alignment: "68" (dlib 68-point model), "5" (dlib 5-point
+# model, ~9MB) or "mtcnn" (MTCNN's points, no dlib model). The 68-point model
+# (~100MB per worker) is then loaded only on the first blink/EAR request
+# (/detect-blink, /recognize liveness), and never with BLINK_FEATURES=0.
+LANDMARK_PROFILE = os.getenv("LANDMARK_PROFILE", "68")
+BLINK_FEATURES = os.getenv("BLINK_FEATURES", "1") == "1"
+# Upload limits (see ingest.py). Bodies over the request limit get 413 while
+# they stream in; bulk enrollment archives are spooled to disk and capped by
+# UPLOAD_MAX_ARCHIVE_BYTES instead (0 = no limit). Archive members are held
+# to UPLOAD_MAX_PART_BYTES each.
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(32 * 1024 * 1024)))
+UPLOAD_MAX_PART_BYTES = int(os.getenv("UPLOAD_MAX_PART_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_MAX_ARCHIVE_BYTES = int(os.getenv("UPLOAD_MAX_ARCHIVE_BYTES", str(2 * 1024 * 1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv("UPLOAD_MAX_PIXELS", str(40_000_000)))  # rejected from the header, before decoding
+UPLOAD_MAX_SIDE = int(os.getenv("UPLOAD_MAX_SIDE", "1920"))               # longer sides are downscaled while decoding
+CLASSROOM_MAX_SIDE = int(os.getenv("CLASSROOM_MAX_SIDE", "4096"))         # group photos keep more pixels for small faces
+
+# Binary FRM1 burst upload to /recognize/frames (see frames.py)
+FRAME_MAX_COUNT = int(os.getenv("FRAME_MAX_COUNT", "16"))
+FRAME_MAX_BYTES = int(os.getenv("FRAME_MAX_BYTES", str(1024 * 1024)))               # per frame
+FRAME_MAX_PAYLOAD_BYTES = int(os.getenv("FRAME_MAX_PAYLOAD_BYTES", str(8 * 1024 * 1024)))  # whole request body
+
+# LBP texture spoof check on the aligned crop (see lbp.py). Without a
+# model file the check is bypassed (only logged on /register); with
+# LBP_ENFORCE or LBP_RECOGNIZE set, startup fails instead.
+LBP_MODEL_PATH = os.getenv("LBP_MODEL_PATH")
+LBP_ENFORCE = os.getenv("LBP_ENFORCE", "0") == "1"      # reject instead of logging
+LBP_RECOGNIZE = os.getenv("LBP_RECOGNIZE", "0") == "1"  # also check the frames /recognize embeds
+
+# Video ingestion (see video_ingest.py)
+VIDEO_MIN_INTERVAL = float(os.getenv("VIDEO_MIN_INTERVAL", "0.25"))  # seconds between frames while faces are unresolved
+VIDEO_MAX_INTERVAL = float(os.getenv("VIDEO_MAX_INTERVAL", "2.0"))   # back-off when the scene is static and empty
+VIDEO_DETECT_WIDTH = int(os.getenv("VIDEO_DETECT_WIDTH", "960"))     # frames are downscaled to this for detection
+VIDEO_TRACK_IOU = float(os.getenv("VIDEO_TRACK_IOU", "0.3"))         # min box overlap to continue a track
+VIDEO_TRACK_MAX_AGE = float(os.getenv("VIDEO_TRACK_MAX_AGE", "3.0")) # seconds unseen before a track is closed
+VIDEO_TRACK_MIN_HITS = int(os.getenv("VIDEO_TRACK_MIN_HITS", "2"))   # shorter tracks are treated as false detections
+VIDEO_CROPS_PER_TRACK = int(os.getenv("VIDEO_CROPS_PER_TRACK", "3")) # best crops kept and embedded per track
+VIDEO_EMBED_BATCH = int(os.getenv("VIDEO_EMBED_BATCH", "64"))        # crops per forward pass
+
+# ------------------------------------------------------------
+# Embedding model
+# ------------------------------------------------------------
+# EdgeFace variant for new installs. Afterwards the active version lives in
+# the embedding_model_state table and changes through reembed.py.
+EDGEFACE_MODEL = os.getenv("EDGEFACE_MODEL", "edgeface_s_gamma_05")
+CROP_JPEG_QUALITY = int(os.getenv("CROP_JPEG_QUALITY", "90"))  # stored 112x112 aligned crops
@@ -1,8 +1,24 @@
+from sqlalchemy import literal, func, or_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
+from pgvector.sqlalchemy import Vector
+from geoalchemy2 import Geometry
 from . import models, schemas
 import hashlib
 from datetime import datetime
 
+# ------------------------------------------------------------
+# Column-only list reads (fast serialization path)
+# ------------------------------------------------------------
+def get_rows(db: Session, model, skip: int = 0, limit: int = 100):
+    """
+    Selects the plain columns of `model` as tuples, skipping embeddings and
+    geometries. Returns (keys, rows) for responses.rows_response.
+    """
+    columns = [c for c in model.__table__.columns if not isinstance(c.type, (Vector, Geometry))]
+    rows = db.query(*columns).order_by(*model.__table__.primary_key.columns).offset(skip).limit(limit).all()
+    return [c.name for c in columns], rows
+
 # ------------------------------------------------------------
 # Departments
 # ------------------------------------------------------------
@@ -181,6 +197,30 @@ def create_student(db: Session, student: schemas.StudentCreate, embedding):
     db.refresh(db_student)
     return db_student
 
+# (id column, embedding column) of every table in the identity index
+IDENTITY_COLUMNS = {
+    "user": (models.User.id, models.User.embedding),
+    "student": (models.Student.student_id, models.Student.embedding),
+    "faculty": (models.Faculty.faculty_id, models.Faculty.embedding),
+}
+
+def get_identity_embeddings(db: Session, identity_type: str, ids=None):
+    """
+    (id, embedding) rows of one identity type. With ids, rows without an
+    embedding are included so callers can drop them; without, all rows
+    with an embedding are streamed in id order.
+    """
+    id_column, embedding_column = IDENTITY_COLUMNS[identity_type]
+    query = db.query(id_column, embedding_column)
+    if ids is not None:
+        return query.filter(id_column.in_(ids)).all()
+    return query.filter(embedding_column.isnot(None)).order_by(id_column).yield_per(2048)
+
+def get_student_embeddings(db: Session, ids):
+    return db.query(models.Student.student_id, models.Student.embedding).filter(
+        models.Student.student_id.in_(ids)
+    ).all()
+
 def delete_student(db: Session, student_id: int):
     student = db.query(models.Student).filter(models.Student.student_id == student_id).first()
     if student:
@@ -205,6 +245,57 @@ def create_attendance_record(db: Session, session_id: int, student_id: int, veri
     db.refresh(db_record)
     return db_record
 
+def create_attendance_records(db: Session, session_id: int, matches, verified: bool = True):
+    """
+    Marks several students present in one INSERT, skipping students already
+    marked in the session. `matches` is [(student_id, similarity)]; returns
+    ({student_id: record_id} created, {student_id: record_id} already marked),
+    like crud_async.create_attendance_records.
+    """
+    if not matches:
+        return {}, {}
+    # Same per-(session, student) lock as crud_async.mark_attendance
+    db.execute(text(
+        "SELECT pg_advisory_xact_lock(:session_id, s) FROM unnest(CAST(:ids AS integer[])) AS s ORDER BY s"
+    ), {"session_id": session_id, "ids": sorted({student_id for student_id, _ in matches})})
+    already = {student_id: record_id for student_id, record_id in db.query(
+        models.AttendanceRecord.student_id, models.AttendanceRecord.record_id
+    ).filter(
+        models.AttendanceRecord.session_id == session_id,
+        models.AttendanceRecord.student_id.in_([student_id for student_id, _ in matches])
+    )}
+    rows = [
+        {"session_id": session_id, "student_id": student_id, "present": True, "punch_in": datetime.utcnow(),
+         "face_verified": verified, "face_similarity": similarity}
+        for student_id, similarity in matches if student_id not in already
+    ]
+    if not rows:
+        db.commit()
+        return {}, already
+    result = db.execute(pg_insert(models.AttendanceRecord).on_conflict_do_nothing().returning(
+        models.AttendanceRecord.student_id, models.AttendanceRecord.record_id
+    ), rows)
+    created = {student_id: record_id for student_id, record_id in result}
+    db.commit()
+    return created, already
+
+def get_session_roster(db: Session, session_id: int):
+    """
+    (student_id, embedding) rows for the students enrolled in a session's offering.
+    """
+    offering_id = db.query(models.AttendanceSession.offering_id).filter(
+        models.AttendanceSession.session_id == session_id
+    ).scalar()
+    if offering_id is None:
+        return None
+    return db.query(models.Student.student_id, models.Student.embedding).join(
+        models.Enrollment, models.Enrollment.student_id == models.Student.student_id
+    ).filter(
+        models.Enrollment.offering_id == offering_id,
+        models.Enrollment.status == "active",
+        models.Student.embedding.isnot(None)
+    ).all()
+
 def get_attendance_records(db: Session, student_id: int = None, start_date = None, end_date = None, skip: int = 0, limit: int = 1000):
     query = db.query(models.AttendanceRecord)
     
@@ -234,6 +325,66 @@ def create_adhoc_session(db: Session, offering_id: int):
     db.refresh(db_session)
     return db_session
 
+# ------------------------------------------------------------
+# Gallery change log
+# ------------------------------------------------------------
+def get_max_change_seq(db: Session) -> int:
+    return db.query(func.coalesce(func.max(models.GalleryChange.seq), 0)).scalar()
+
+def get_db_epoch(db: Session) -> float:
+    """
+    The database's now() (transaction start) as epoch seconds.
+    """
+    return float(db.execute(text("SELECT EXTRACT(EPOCH FROM now())")).scalar())
+
+def get_gallery_changes(db: Session, table_name: str, since_seq: int, since_time: datetime = None):
+    """
+    Returns {identity_id: last op} for changes to `table_name` after
+    `since_seq`, or logged at or after `since_time` (naive UTC).
+    """
+    newer = models.GalleryChange.seq > since_seq
+    if since_time is not None:
+        newer = or_(newer, models.GalleryChange.changed_at >= since_time)
+    rows = db.query(models.GalleryChange.identity_id, models.GalleryChange.op).filter(
+        models.GalleryChange.table_name == table_name,
+        newer
+    ).order_by(models.GalleryChange.seq).all()
+    return {identity_id: op for identity_id, op in rows}
+
+def prune_gallery_changes(db: Session, up_to_seq: int, older_than: datetime) -> int:
+    deleted = db.query(models.GalleryChange).filter(
+        models.GalleryChange.seq <= up_to_seq,
+        models.GalleryChange.changed_at < older_than
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+# ------------------------------------------------------------
+# Embedding model
+# ------------------------------------------------------------
+def get_active_model_version(db: Session):
+    return db.query(models.EmbeddingModelState.active_version).filter(
+        models.EmbeddingModelState.id == 1
+    ).scalar()
+
+# ------------------------------------------------------------
+# Bulk enrollment jobs
+# ------------------------------------------------------------
+def create_enrollment_job(db: Session, target: str, source: str):
+    job = models.EnrollmentJob(target=target, source=source, status="queued")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_enrollment_job(db: Session, job_id: int):
+    return db.query(models.EnrollmentJob).filter(models.EnrollmentJob.job_id == job_id).first()
+
+def get_enrollment_job_errors(db: Session, job_id: int, limit: int = 1000):
+    return db.query(models.EnrollmentJobError).filter(
+        models.EnrollmentJobError.job_id == job_id
+    ).order_by(models.EnrollmentJobError.id).limit(limit).all()
+
 # ------------------------------------------------------------
 # Legacy CRUD (Restored for main.py compatibility)
 # ------------------------------------------------------------
@@ -241,13 +392,27 @@ def create_adhoc_session(db: Session, offering_id: int):
 def get_user_by_name(db: Session, name: str):
     return db.query(models.User).filter(models.User.name == name).first()
 
-def create_user(db: Session, user: schemas.UserCreate, embedding):
+def create_user(db: Session, user: schemas.UserCreate, embedding, templates=(), duplicate=None,
+                crops=(), model_version: str = None):
+    """
+    `duplicate` is an optional (identity_type, identity_id, similarity) flag;
+    `crops` are encoded aligned faces kept for re-embedding.
+    """
     db_user = models.User(
         name=user.name, 
         enrollment_number=user.enrollment_number,
-        embedding=embedding
+        embedding=embedding,
+        embedding_model_version=model_version
     )
+    if duplicate is not None:
+        db_user.duplicate_of_type, db_user.duplicate_of_id, db_user.duplicate_similarity = duplicate
     db.add(db_user)
+    db.flush()
+    for template in templates:
+        db.add(models.FaceTemplate(user_id=db_user.id, embedding=template, source="enroll",
+                                   embedding_model_version=model_version))
+    for crop in crops:
+        db.add(models.FaceCrop(identity_type="user", identity_id=db_user.id, image=crop))
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -255,6 +420,29 @@ def create_user(db: Session, user: schemas.UserCreate, embedding):
 def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.User).offset(skip).limit(limit).all()
 
+def get_face_templates(db: Session, user_ids=None):
+    """
+    Returns {user_id: [embedding, ...]} for the given users (all when None).
+    """
+    query = db.query(models.FaceTemplate.user_id, models.FaceTemplate.embedding)
+    if user_ids is not None:
+        query = query.filter(models.FaceTemplate.user_id.in_(user_ids))
+    templates = {}
+    for user_id, embedding in query.yield_per(2048):
+        templates.setdefault(user_id, []).append(embedding)
+    return templates
+
+def get_user_rows(db: Session, skip: int = 0, limit: int = 100):
+    return db.query(
+        models.User.id, models.User.name, models.User.enrollment_number, models.User.created_at
+    ).offset(skip).limit(limit).all()
+
+def get_user_rows_as_students(db: Session, skip: int = 0, limit: int = 100):
+    # Legacy users shaped like the frontend's Student (enrollment_type defaults to FT)
+    return db.query(
+        models.User.id, models.User.name, models.User.enrollment_number, literal("FT")
+    ).offset(skip).limit(limit).all()
+
 def delete_user(db: Session, user_id: int):
     # This might conflict with strict schemas if response model expects something specific
     # Main.py expects returning the deleted user
@@ -294,6 +482,25 @@ def get_attendance(db: Session, user_id: int = None, start_date = None, end_date
         
     return query.order_by(models.Attendance.timestamp.desc()).offset(skip).limit(limit).all()
 
+def get_attendance_export_rows(db: Session, user_id: int = None, start_date = None, end_date = None, skip: int = 0, limit: int = 1000):
+    """
+    (id, user_id, user name, timestamp) for the Excel export, with the user
+    joined in the same query.
+    """
+    query = db.query(
+        models.Attendance.id,
+        models.Attendance.user_id,
+        func.coalesce(models.User.name, "Unknown"),
+        models.Attendance.timestamp,
+    ).outerjoin(models.User, models.User.id == models.Attendance.user_id)
+    if user_id:
+        query = query.filter(models.Attendance.user_id == user_id)
+    if start_date:
+        query = query.filter(models.Attendance.timestamp >= start_date)
+    if end_date:
+        query = query.filter(models.Attendance.timestamp <= end_date)
+    return query.order_by(models.Attendance.timestamp.desc()).offset(skip).limit(limit).all()
+
 # Admin
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
@@ -0,0 +1,289 @@
+from sqlalchemy import select, insert, update, delete, case, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime
+from . import models
+from .gallery import centroid
+from .crud import IDENTITY_COLUMNS
+from .db import AsyncSession
+
+# Async variants of the hot-path CRUD used by /recognize and /attendance.
+# Statements are 2.0-style selects so they run unchanged on an AsyncSession
+# (asyncpg) or, when the async engine is unavailable, on a regular Session
+# in the threadpool.
+
+def _is_async(db) -> bool:
+    return AsyncSession is not None and isinstance(db, AsyncSession)
+
+async def _execute(db, stmt):
+    if _is_async(db):
+        return await db.execute(stmt)
+    return await run_in_threadpool(db.execute, stmt)
+
+async def _commit(db):
+    if _is_async(db):
+        await db.commit()
+    else:
+        await run_in_threadpool(db.commit)
+
+# ------------------------------------------------------------
+# Sessions / Roster
+# ------------------------------------------------------------
+
+async def get_session(db, session_id: int):
+    stmt = select(models.AttendanceSession.session_id, models.AttendanceSession.offering_id).where(
+        models.AttendanceSession.session_id == session_id
+    )
+    result = await _execute(db, stmt)
+    return result.first()
+
+async def get_roster_embeddings(db, offering_id: int):
+    """
+    Returns (student_id, embedding) rows for students actively enrolled in the offering.
+    """
+    stmt = select(models.Student.student_id, models.Student.embedding).join(
+        models.Enrollment, models.Enrollment.student_id == models.Student.student_id
+    ).where(
+        models.Enrollment.offering_id == offering_id,
+        models.Enrollment.status == "active",
+        models.Student.embedding.isnot(None)
+    )
+    result = await _execute(db, stmt)
+    return result.all()
+
+async def get_active_model_version(db):
+    stmt = select(models.EmbeddingModelState.active_version).where(models.EmbeddingModelState.id == 1)
+    result = await _execute(db, stmt)
+    return result.scalar()
+
+async def get_student(db, student_id: int):
+    stmt = select(models.Student.student_id, models.Student.name, models.Student.enrollment_number).where(
+        models.Student.student_id == student_id
+    )
+    result = await _execute(db, stmt)
+    return result.first()
+
+async def get_attendance_record(db, session_id: int, student_id: int):
+    stmt = select(models.AttendanceRecord.record_id, models.AttendanceRecord.punch_in).where(
+        models.AttendanceRecord.session_id == session_id,
+        models.AttendanceRecord.student_id == student_id
+    )
+    result = await _execute(db, stmt)
+    return result.first()
+
+async def _lock_marks(db, session_id: int, student_ids):
+    """
+    Serializes marking each (session, student) until commit, so concurrent
+    bursts cannot both miss the existing record and insert one. Backed by a
+    unique index where attendance_records is not partitioned (0010).
+    """
+    stmt = text(
+        "SELECT pg_advisory_xact_lock(:session_id, s) FROM unnest(CAST(:ids AS integer[])) AS s ORDER BY s"
+    ).bindparams(session_id=session_id, ids=sorted(set(student_ids)))
+    await _execute(db, stmt)
+
+async def mark_attendance(db, session_id: int, student_id: int, verified: bool = True, similarity: float = None):
+    """
+    Marks a student present at most once per session. Returns
+    ((record_id, punch_in), already_marked).
+    """
+    await _lock_marks(db, session_id, [student_id])
+    record = await get_attendance_record(db, session_id, student_id)
+    already_marked = record is not None
+    if not already_marked:
+        stmt = pg_insert(models.AttendanceRecord).values(
+            session_id=session_id,
+            student_id=student_id,
+            present=True,
+            punch_in=datetime.utcnow(),
+            face_verified=verified,
+            face_similarity=similarity
+        ).on_conflict_do_nothing().returning(models.AttendanceRecord.record_id, models.AttendanceRecord.punch_in)
+        result = await _execute(db, stmt)
+        record = result.first()
+        if record is None:
+            already_marked = True
+            record = await get_attendance_record(db, session_id, student_id)
+    await _commit(db)
+    return record, already_marked
+
+async def get_marked_students(db, session_id: int, student_ids):
+    """
+    Returns {student_id: record_id} for students already marked in a session.
+    """
+    stmt = select(models.AttendanceRecord.student_id, models.AttendanceRecord.record_id).where(
+        models.AttendanceRecord.session_id == session_id,
+        models.AttendanceRecord.student_id.in_(list(student_ids))
+    )
+    result = await _execute(db, stmt)
+    return {row[0]: row[1] for row in result.all()}
+
+async def create_attendance_records(db, session_id: int, matches, verified: bool = True):
+    """
+    Marks several students present in one INSERT, skipping students already
+    marked in the session. `matches` is [(student_id, similarity)]; returns
+    ({student_id: record_id} created, {student_id: record_id} already marked).
+    """
+    if not matches:
+        return {}, {}
+    await _lock_marks(db, session_id, [student_id for student_id, _ in matches])
+    already = await get_marked_students(db, session_id, [student_id for student_id, _ in matches])
+    rows = [
+        {"session_id": session_id, "student_id": student_id, "present": True, "punch_in": datetime.utcnow(),
+         "face_verified": verified, "face_similarity": similarity}
+        for student_id, similarity in matches if student_id not in already
+    ]
+    created = {}
+    if rows:
+        stmt = pg_insert(models.AttendanceRecord).values(rows).on_conflict_do_nothing().returning(
+            models.AttendanceRecord.student_id, models.AttendanceRecord.record_id
+        )
+        result = await _execute(db, stmt)
+        created = {row[0]: row[1] for row in result.all()}
+    await _commit(db)
+    return created, already
+
+# ------------------------------------------------------------
+# Legacy Users / Attendance
+# ------------------------------------------------------------
+
+async def get_identity_embeddings(db, identity_type: str):
+    """
+    Returns (id, embedding) rows with an embedding for one identity type.
+    """
+    id_column, embedding_column = IDENTITY_COLUMNS[identity_type]
+    stmt = select(id_column, embedding_column).where(embedding_column.isnot(None))
+    result = await _execute(db, stmt)
+    return result.all()
+
+# (model, id column, number column) for identity lookups; the number is the
+# enrollment or employee number
+IDENTITY_NAME_COLUMNS = {
+    "user": (models.User, models.User.id, models.User.enrollment_number),
+    "student": (models.Student, models.Student.student_id, models.Student.enrollment_number),
+    "faculty": (models.Faculty, models.Faculty.faculty_id, models.Faculty.employee_number),
+}
+
+async def get_identity(db, identity_type: str, identity_id: int):
+    """
+    Returns (name, number) for any identity type.
+    """
+    model, id_column, number_column = IDENTITY_NAME_COLUMNS[identity_type]
+    stmt = select(model.name, number_column.label("number")).where(id_column == identity_id)
+    result = await _execute(db, stmt)
+    return result.first()
+
+async def get_identities(db, identity_type: str, ids):
+    """
+    Returns {id: (name, number)} for several identities of one type.
+    """
+    model, id_column, number_column = IDENTITY_NAME_COLUMNS[identity_type]
+    stmt = select(id_column, model.name, number_column.label("number")).where(id_column.in_(list(ids)))
+    result = await _execute(db, stmt)
+    return {row[0]: row for row in result.all()}
+
+async def get_face_templates(db, user_ids=None):
+    """
+    Returns {user_id: [embedding, ...]} for the given users (all when None).
+    """
+    stmt = select(models.FaceTemplate.user_id, models.FaceTemplate.embedding)
+    if user_ids is not None:
+        stmt = stmt.where(models.FaceTemplate.user_id.in_(user_ids))
+    result = await _execute(db, stmt)
+    templates = {}
+    for user_id, embedding in result.all():
+        templates.setdefault(user_id, []).append(embedding)
+    return templates
+
+async def add_face_template(db, user_id: int, embedding, max_templates: int, model_version: str = None):
+    """
+    Stores a template learned from a recognition, drops the oldest learned
+    templates beyond `max_templates` (enrollment templates are kept) and
+    recomputes the user's centroid. The active model row is read FOR SHARE
+    first, so a model switch (which locks it FOR UPDATE) cannot interleave;
+    an embedding from a model that is no longer active is not learned.
+    """
+    result = await _execute(db, select(models.EmbeddingModelState.active_version).where(
+        models.EmbeddingModelState.id == 1
+    ).with_for_update(read=True))
+    if result.scalar() != model_version:
+        await _commit(db)
+        return False
+
+    await _execute(db, insert(models.FaceTemplate).values(
+        user_id=user_id, embedding=embedding, source="recognition", created_at=datetime.utcnow(),
+        embedding_model_version=model_version
+    ))
+    result = await _execute(db, select(
+        models.FaceTemplate.template_id, models.FaceTemplate.source, models.FaceTemplate.embedding
+    ).where(models.FaceTemplate.user_id == user_id).order_by(models.FaceTemplate.created_at))
+    templates = result.all()
+
+    excess = len(templates) - max_templates
+    dropped = set()
+    for template in templates:
+        if len(dropped) >= excess:
+            break
+        if template.source == "recognition":
+            dropped.add(template.template_id)
+    if dropped:
+        await _execute(db, delete(models.FaceTemplate).where(models.FaceTemplate.template_id.in_(dropped)))
+
+    kept = [t.embedding for t in templates if t.template_id not in dropped]
+    await _execute(db, update(models.User).where(models.User.id == user_id).values(
+        embedding=centroid(kept)
+    ))
+    await _commit(db)
+    return True
+
+async def create_attendance(db, user_id: int):
+    # Snapshot user details alongside the punch
+    result = await _execute(db, select(models.User.name, models.User.enrollment_number).where(models.User.id == user_id))
+    user = result.first()
+
+    stmt = insert(models.Attendance).values(
+        user_id=user_id,
+        name=user.name if user else "Unknown",
+        enrollment_number=user.enrollment_number if user else None
+    ).returning(models.Attendance.id, models.Attendance.timestamp)
+    result = await _execute(db, stmt)
+    row = result.first()
+    await _commit(db)
+    return row
+
+async def get_attendance(db, user_id: int = None, start_date = None, end_date = None, skip: int = 0, limit: int = 1000):
+    """
+    Returns attendance rows joined with the user, already shaped for the
+    /attendance response: (id, user_id, user_name, student_name,
+    enrollment_number, timestamp). The snapshot name/enrollment number win;
+    the join only fills in old records written before snapshots existed.
+    """
+    has_snapshot = func.coalesce(models.Attendance.name, "") != ""
+    name = case(
+        (has_snapshot, models.Attendance.name),
+        else_=func.coalesce(models.User.name, "Unknown")
+    )
+    enrollment_number = case(
+        (has_snapshot, models.Attendance.enrollment_number),
+        (models.User.id.is_(None), "N/A"),
+        else_=models.User.enrollment_number
+    )
+    stmt = select(
+        models.Attendance.id,
+        models.Attendance.user_id,
+        name.label("user_name"),
+        name.label("student_name"), # Compatibility
+        enrollment_number.label("enrollment_number"),
+        models.Attendance.timestamp,
+    ).outerjoin(models.User, models.User.id == models.Attendance.user_id)
+
+    if user_id:
+        stmt = stmt.where(models.Attendance.user_id == user_id)
+    if start_date:
+        stmt = stmt.where(models.Attendance.timestamp >= start_date)
+    if end_date:
+        stmt = stmt.where(models.Attendance.timestamp <= end_date)
+
+    stmt = stmt.order_by(models.Attendance.timestamp.desc()).offset(skip).limit(limit)
+    result = await _execute(db, stmt)
+    return list(result.keys()), result.all()
@@ -4,6 +4,16 @@ import numpy as np
 from typing import List, Tuple, Union
 from skimage import transform as trans
 
+# Standard eye positions for 112x112 alignment
+# Based on ArcFace/InsightFace defaults
+ARCFACE_DST = np.array([
+    [38.2946, 51.6963], # Left Eye
+    [73.5318, 51.5014], # Right Eye
+    [56.0252, 71.7366], # Nose
+    [41.5493, 92.3655], # Mouth Left
+    [70.7299, 92.2041]  # Mouth Right
+], dtype=np.float32)
+
 class FaceDetector:
     def __init__(self):
         # Initialize MTCNN
@@ -43,6 +53,55 @@ class FaceDetector:
         boxes, probs, landmarks = self.mtcnn.detect(image, landmarks=True)
         return landmarks
 
+    def detect_all(self, image: Image.Image, min_prob: float = 0.0, min_size: int = 0):
+        """
+        Every face in one MTCNN pass, for group photos.
+        Returns a list of (bbox, prob, landmarks) with landmarks of shape (5, 2),
+        keeping faces at least `min_size` pixels wide and `min_prob` confident.
+        """
+        boxes, probs, landmarks = self.mtcnn.detect(image, landmarks=True)
+        faces = []
+        if boxes is None:
+            return faces
+        for box, prob, points in zip(boxes, probs, landmarks):
+            if prob < min_prob or box[2] - box[0] < min_size:
+                continue
+            faces.append((tuple(map(int, box)), float(prob), points))
+        return faces
+
+    def _warp(self, image: Image.Image, src: np.ndarray, dst: np.ndarray = ARCFACE_DST) -> Image.Image:
+        tform = trans.SimilarityTransform()
+        tform.estimate(src, dst)
+
+        # We need to apply warp to the image
+        img_np = np.array(image)
+        warped = trans.warp(img_np, tform.inverse, output_shape=(112, 112))
+
+        # trans.warp returns floats in range [0, 1], convert back to [0, 255] uint8
+        warped = (warped * 255).astype(np.uint8)
+
+        return Image.fromarray(warped)
+
+    def align_face_5(self, image: Image.Image, landmarks: np.ndarray) -> Image.Image:
+        """
+        Aligns and crops face based on MTCNN's 5 landmarks
+        (left eye, right eye, nose, mouth left, mouth right).
+        Returns: PIL Image of size (112, 112)
+        """
+        if landmarks is None or len(landmarks) != 5:
+            return None
+        return self._warp(image, np.asarray(landmarks, dtype=np.float32))
+
+    def align_eyes(self, image: Image.Image, eyes: np.ndarray) -> Image.Image:
+        """
+        Aligns and crops face from the two eye centres (left, right) only,
+        for landmark models without mouth points.
+        Returns: PIL Image of size (112, 112)
+        """
+        if eyes is None or len(eyes) != 2:
+            return None
+        return self._warp(image, np.asarray(eyes, dtype=np.float32), ARCFACE_DST[:2])
+
     def align_face(self, image: Image.Image, landmarks: np.ndarray) -> Image.Image:
         """
         Aligns and crops face based on 68 dlib landmarks.
@@ -52,16 +111,6 @@ class FaceDetector:
         if landmarks is None or len(landmarks) < 68:
             return None
 
-        # Standard eye positions for 112x112 alignment
-        # Based on ArcFace/InsightFace defaults
-        dst = np.array([
-            [38.2946, 51.6963], # Left Eye
-            [73.5318, 51.5014], # Right Eye
-            [56.0252, 71.7366], # Nose
-            [41.5493, 92.3655], # Mouth Left
-            [70.7299, 92.2041]  # Mouth Right
-        ], dtype=np.float32)
-
         # Map Dlib 68 landmarks to these 5 points
         # Left Eye: avg of (36 to 41)
         # Right Eye: avg of (42 to 47)
@@ -77,16 +126,5 @@ class FaceDetector:
             landmarks[54]
         ], dtype=np.float32)
 
-        tform = trans.SimilarityTransform()
-        tform.estimate(src, dst)
-        M = tform.params[0:2, :]
-        
-        # We need to apply warp to the image
-        img_np = np.array(image)
-        warped = trans.warp(img_np, tform.inverse, output_shape=(112, 112))
-        
-        # trans.warp returns floats in range [0, 1], convert back to [0, 255] uint8
-        warped = (warped * 255).astype(np.uint8)
-        
-        return Image.fromarray(warped)
+        return self._warp(image, src)
 
@@ -2,8 +2,13 @@ import torch
 import torchvision.transforms as transforms
 import numpy as np
 from PIL import Image
-from typing import Union
+from typing import List, Union
 import ssl
+import io
+
+from . import config
+
+CROP_SIZE = 112
 
 # Bypass SSL verification for torch.hub
 try:
@@ -13,10 +18,26 @@ except AttributeError:
 else:
     ssl._create_default_https_context = _create_unverified_https_context
 
+def encode_crop(face_image: Union[np.ndarray, Image.Image]) -> bytes:
+    """
+    JPEG of an aligned face at the model input size, kept so faces can be
+    re-embedded when the model changes.
+    """
+    if isinstance(face_image, np.ndarray):
+        face_image = Image.fromarray(face_image)
+    buffer = io.BytesIO()
+    face_image.convert('RGB').resize((CROP_SIZE, CROP_SIZE)).save(buffer, format='JPEG', quality=config.CROP_JPEG_QUALITY)
+    return buffer.getvalue()
+
+def decode_crop(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data)).convert('RGB')
+
 class EdgeFaceWrapper:
-    def __init__(self, device='cpu'):
+    def __init__(self, device='cpu', model_name: str = None):
+        # The model name doubles as the embedding_model_version of its vectors
+        self.model_name = model_name or config.EDGEFACE_MODEL
         self.device = torch.device(device)
-        self.model = torch.hub.load('otroshi/edgeface', 'edgeface_s_gamma_05', pretrained=True, trust_repo=True)
+        self.model = torch.hub.load('otroshi/edgeface', self.model_name, pretrained=True, trust_repo=True)
         self.model.to(self.device)
         self.model.eval()
         
@@ -24,11 +45,26 @@ class EdgeFaceWrapper:
         # EdgeFace expects [3, 112, 112] input, range [-1, 1] usually or [0, 1] normalized
         # Based on typical ArcFace/InsightFace pipelines:
         self.transform = transforms.Compose([
-            transforms.Resize((112, 112)),
+            transforms.Resize((CROP_SIZE, CROP_SIZE)),
             transforms.ToTensor(),
             transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5]),
         ])
 
+    def get_embeddings(self, face_images: List[Union[np.ndarray, Image.Image]]) -> np.ndarray:
+        """
+        Embeds several cropped faces in one forward pass.
+        Returns an (N, 512) numpy array.
+        """
+        if not face_images:
+            return np.empty((0, 512), dtype=np.float32)
+        images = [Image.fromarray(f) if isinstance(f, np.ndarray) else f for f in face_images]
+        batch = torch.stack([self.transform(img) for img in images]).to(self.device)
+
+        with torch.no_grad():
+            embeddings = self.model(batch)
+
+        return embeddings.cpu().numpy()
+
     def get_embedding(self, face_image: Union[np.ndarray, Image.Image]) -> np.ndarray:
         """
         Takes a cropped face image (PIL Image or numpy).
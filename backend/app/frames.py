@@ -0,0 +1,130 @@
+"""
+Compact binary upload of a login burst: one request body holding several
+encoded frames, parsed as it streams in instead of as multipart parts.
+
+Layout (big-endian):
+    magic   4 bytes  b"FRM1"
+    count   uint8    number of frames, 1..FRAME_MAX_COUNT
+    width   uint16   pixel size every frame must have (pre-cropped faces),
+    height  uint16   or 0, 0 for frames of any size
+    then per frame:
+        length  uint32   byte length of the frame, 1..FRAME_MAX_BYTES
+        data    JPEG or PNG bytes
+
+Limits are checked on the header and on each length prefix before the
+frame's bytes are buffered, so an oversized payload is cut off early.
+"""
+import struct
+
+from PIL import Image
+
+from . import ingest
+
+MAGIC = b"FRM1"
+HEADER = struct.Struct(">4sBHH")
+LENGTH = struct.Struct(">I")
+FORMATS = ("JPEG", "PNG")
+
+class FrameError(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class FrameParser:
+    """
+    Incremental parser: feed() chunks as they arrive, then close() returns
+    the frames as bytes. Raises FrameError (413 for limits, 400 for
+    malformed payloads) as soon as the problem is visible.
+    """
+    def __init__(self, max_frames: int, max_frame_bytes: int, max_payload_bytes: int):
+        self.max_frames = max_frames
+        self.max_frame_bytes = max_frame_bytes
+        self.max_payload_bytes = max_payload_bytes
+        self.buffer = bytearray()
+        self.received = 0
+        self.count = None
+        self.size = None
+        self.frames = []
+        self._pending = None  # length of the frame being read
+
+    def feed(self, chunk: bytes):
+        self.received += len(chunk)
+        if self.received > self.max_payload_bytes:
+            raise FrameError(f"Frame payload larger than {self.max_payload_bytes} bytes", 413)
+        self.buffer += chunk
+        self._parse()
+
+    def _parse(self):
+        while True:
+            if self.count is None:
+                if len(self.buffer) < HEADER.size:
+                    return
+                magic, count, width, height = HEADER.unpack_from(self.buffer)
+                if magic != MAGIC:
+                    raise FrameError("Not a FRM1 frame payload")
+                if not 1 <= count <= self.max_frames:
+                    raise FrameError(f"Frame count must be 1..{self.max_frames}", 413 if count else 400)
+                if (width == 0) != (height == 0):
+                    raise FrameError("Frame width and height must both be set or both be 0")
+                self.count = count
+                self.size = (width, height) if width else None
+                del self.buffer[:HEADER.size]
+                continue
+
+            if len(self.frames) == self.count:
+                if self.buffer:
+                    raise FrameError("Unexpected bytes after the last frame")
+                return
+
+            if self._pending is None:
+                if len(self.buffer) < LENGTH.size:
+                    return
+                (length,) = LENGTH.unpack_from(self.buffer)
+                if length == 0:
+                    raise FrameError("Empty frame")
+                if length > self.max_frame_bytes:
+                    raise FrameError(f"Frame larger than {self.max_frame_bytes} bytes", 413)
+                self._pending = length
+                del self.buffer[:LENGTH.size]
+
+            if len(self.buffer) < self._pending:
+                return
+            self.frames.append(bytes(self.buffer[:self._pending]))
+            del self.buffer[:self._pending]
+            self._pending = None
+
+    def close(self):
+        if self.count is None or len(self.frames) < self.count:
+            raise FrameError("Truncated frame payload")
+        return self.frames
+
+async def read_frames(stream, max_frames: int, max_frame_bytes: int, max_payload_bytes: int):
+    """
+    Parses an async byte stream (e.g. Request.stream()). Returns
+    (frames, size) with size the declared (width, height) or None.
+    """
+    parser = FrameParser(max_frames, max_frame_bytes, max_payload_bytes)
+    async for chunk in stream:
+        parser.feed(chunk)
+    return parser.close(), parser.size
+
+def encode_frames(frames, size=None) -> bytes:
+    """
+    Builds a payload from encoded frames; the inverse of FrameParser.
+    """
+    width, height = size or (0, 0)
+    parts = [HEADER.pack(MAGIC, len(frames), width, height)]
+    for data in frames:
+        parts.append(LENGTH.pack(len(data)))
+        parts.append(data)
+    return b"".join(parts)
+
+def decode_frame(data: bytes, size=None) -> Image.Image:
+    """
+    Opens a frame with the upload limits of ingest.decode_image, checking
+    format and the declared size on its header before the pixels are decoded.
+    """
+    try:
+        return ingest.decode_image(data, size=size, formats=FORMATS)
+    except ingest.IngestError as e:
+        raise FrameError(str(e), e.status_code)
@@ -0,0 +1,545 @@
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+EMBEDDING_DIM = 512
+
+# Identity index: users, students and faculty share one gallery, keyed by
+# type code << TYPE_SHIFT | row id. Legacy user keys equal their ids.
+IDENTITY_TYPES = ("user", "student", "faculty")
+TYPE_SHIFT = 40
+
+class ModelMismatch(RuntimeError):
+    pass
+
+def identity_key(identity_type: str, identity_id: int) -> int:
+    return (IDENTITY_TYPES.index(identity_type) << TYPE_SHIFT) | int(identity_id)
+
+def split_key(key: int):
+    """
+    Identity key -> (identity_type, row id).
+    """
+    return IDENTITY_TYPES[int(key) >> TYPE_SHIFT], int(key) & ((1 << TYPE_SHIFT) - 1)
+
+def type_codes(types):
+    """
+    Type names -> array of type codes for search filters (None = all types).
+    """
+    if types is None:
+        return None
+    unknown = set(types) - set(IDENTITY_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown identity type(s): {', '.join(sorted(unknown))}")
+    return np.array([IDENTITY_TYPES.index(t) for t in types], dtype=np.int64)
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# float16 was dropped: numpy converts half floats without SIMD, so its scan
+# was ~10x slower than float32
+PRECISIONS = ("float32", "int8")
+
+# Rows converted to float32 per step of a reduced-precision scan; keeps the
+# temporary small enough to stay in cache.
+SCAN_CHUNK_ROWS = 1024
+
+# Upper bound on the queries x rows score matrix of a batch search (floats);
+# larger batches are scored in query chunks.
+BATCH_SCORE_ELEMENTS = 16 * 1024 * 1024
+
+def quantize(matrix: np.ndarray, precision: str):
+    """
+    Reduced-precision copy of normalized rows for the first-pass scan.
+    int8 uses a per-row scale (max |x| / 127). Returns (scan, scales).
+    """
+    if precision == "int8":
+        scales = np.abs(matrix).max(axis=-1) / 127.0
+        scales[scales == 0] = 1.0
+        scan = np.round(matrix / scales[..., None]).astype(np.int8)
+        return scan, scales.astype(np.float32)
+    raise ValueError(f"Unknown gallery precision: {precision}")
+
+def scan_scores(scan: np.ndarray, scales, queries: np.ndarray, n: int) -> np.ndarray:
+    """
+    Approximate (queries x n) similarities against the first n rows of a
+    reduced-precision matrix.
+    """
+    sims = np.empty((len(queries), n), dtype=np.float32)
+    qt = queries.T
+    for start in range(0, n, SCAN_CHUNK_ROWS):
+        end = min(start + SCAN_CHUNK_ROWS, n)
+        sims[:, start:end] = (scan[start:end].astype(np.float32) @ qt).T
+    if scales is not None:
+        sims *= scales[:n]
+    return sims
+
+def centroid(embeddings) -> np.ndarray:
+    """
+    Normalized mean of normalized embeddings, used as an identity's centroid.
+    """
+    return normalize_rows(normalize_rows(np.stack(embeddings)).mean(axis=0))
+
+def top_k(sims: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k largest values, best first.
+    """
+    k = min(k, len(sims))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-sims, k - 1)[:k]
+    return top[np.argsort(-sims[top])]
+
+def top_k_rows(sims: np.ndarray, k: int) -> np.ndarray:
+    """
+    Per-row indices of the k largest values of a 2-D array, best first.
+    """
+    k = min(k, sims.shape[1])
+    if k <= 0:
+        return np.empty((len(sims), 0), dtype=np.int64)
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+def assign_one_to_one(results, threshold: float):
+    """
+    Assigns ids to queries from search_batch results so each id goes to at
+    most one query: the most similar (query, id) pair above `threshold` is
+    taken first. Returns {query index: (id, similarity)}.
+    """
+    pairs = sorted(
+        ((sim, q, identity_id) for q, matches in enumerate(results) for identity_id, sim in matches if sim > threshold),
+        key=lambda p: p[0], reverse=True
+    )
+    assigned, taken = {}, set()
+    for sim, q, identity_id in pairs:
+        if q in assigned or identity_id in taken:
+            continue
+        assigned[q] = (identity_id, sim)
+        taken.add(identity_id)
+    return assigned
+
+class Gallery:
+    """
+    In-memory face gallery for cosine search.
+    Embeddings are stored L2-normalized as one contiguous float32 matrix, so a
+    search is a single matrix-vector product instead of a Python loop.
+
+    A gallery can also sit on top of a read-only base (a memory-mapped
+    snapshot, see gallery_snapshot.py) with sorted ids. The base is never
+    written: removals are tracked in a private mask and upserts go to the
+    small mutable part, so every worker shares the snapshot pages.
+
+    With precision "int8" the first pass scans a reduced-precision copy (4x
+    less memory traffic) and only the best `rerank_k` candidates are
+    re-scored with exact float32 cosine, so results match float32 search
+    unless the true best match falls outside the shortlist. Memory is only
+    saved where the float32 rows are not on the heap: snapshots, and
+    galleries built with from_rows, whose rows are spilled to an unlinked
+    temporary file (in TMPDIR, which must not be a tmpfs). Either way only
+    candidate rows are paged in. Rows upserted later are held in float32 on
+    the heap, bounded by the changes since the last load.
+
+    Identities can also carry several templates (set_templates). Their rows
+    then act as centroids: the scan shortlists `template_shortlist`
+    identities and each is scored by its best-matching template, so more
+    templates per person only cost a few extra dot products.
+    """
+    def __init__(self, ids=None, embeddings=None, dim: int = EMBEDDING_DIM,
+                 precision: str = "float32", rerank_k: int = 32, template_shortlist: int = 16):
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown gallery precision: {precision}")
+        self.dim = dim
+        self.precision = precision
+        self.rerank_k = rerank_k
+        self.template_shortlist = template_shortlist
+        self._lock = threading.RLock()
+        ids = np.asarray(ids if ids is not None else [], dtype=np.int64)
+        matrix = normalize_rows(embeddings) if len(ids) else np.empty((0, dim), dtype=np.float32)
+
+        self._size = len(ids)
+        self._ids = ids.copy()
+        self._matrix = np.ascontiguousarray(matrix.reshape(self._size, dim))
+        self._scan, self._scales = (None, None) if precision == "float32" else quantize(self._matrix, precision)
+        self._row = {int(i): r for r, i in enumerate(self._ids)}
+        self._templates = {}
+
+        # Read-only base (empty unless built from a snapshot)
+        self._base_ids = np.empty(0, dtype=np.int64)
+        self._base_matrix = np.empty((0, dim), dtype=np.float32)
+        self._base_scan = None
+        self._base_scales = None
+        self._base_dead = None
+        self._base_dead_count = 0
+        self.version = None
+        self.change_seq = 0
+        self.built_at = None
+        # Embedding model the rows were computed with (None = unknown/stale)
+        self.model_version = None
+
+    @classmethod
+    def from_rows(cls, rows, dim: int = EMBEDDING_DIM, **kwargs):
+        """
+        Builds a gallery from (id, embedding) rows, skipping rows without an embedding.
+        """
+        rows = [(r[0], r[1]) for r in rows if r[1] is not None]
+        if not rows:
+            return cls(dim=dim, **kwargs)
+        ids, embeddings = zip(*rows)
+        if kwargs.get("precision", "float32") != "float32":
+            return cls._spilled(ids, embeddings, dim, **kwargs)
+        return cls(ids, np.stack([np.asarray(e, dtype=np.float32) for e in embeddings]), dim=dim, **kwargs)
+
+    @classmethod
+    def _spilled(cls, ids, embeddings, dim: int, **kwargs):
+        """
+        A reduced-precision gallery over rows the float32 copy of which is
+        written to an unlinked temporary file and mapped read-only like a
+        snapshot, so only the scan copy stays resident.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids, kind="stable")
+        scan = scales = None
+        with tempfile.TemporaryFile(prefix="gallery-") as f:
+            for start in range(0, len(order), SCAN_CHUNK_ROWS):
+                rows = order[start:start + SCAN_CHUNK_ROWS]
+                chunk = normalize_rows(np.stack([np.asarray(embeddings[i], dtype=np.float32) for i in rows]))
+                f.write(chunk.reshape(len(rows), dim).tobytes())
+                chunk_scan, chunk_scales = quantize(chunk, kwargs["precision"])
+                if scan is None:
+                    scan = np.empty((len(order), dim), dtype=chunk_scan.dtype)
+                    scales = np.empty(len(order), dtype=np.float32) if chunk_scales is not None else None
+                scan[start:start + len(rows)] = chunk_scan
+                if scales is not None:
+                    scales[start:start + len(rows)] = chunk_scales
+            f.flush()
+            # The mapping keeps the file alive after it is closed
+            vectors = np.memmap(f, dtype=np.float32, mode="r", shape=(len(order), dim))
+        return cls.from_base(ids[order], vectors, scan=scan, scales=scales, **kwargs)
+
+    @classmethod
+    def from_base(cls, ids: np.ndarray, matrix: np.ndarray, version=None, change_seq: int = 0,
+                  built_at: float = None, scan=None, scales=None, **kwargs):
+        """
+        Wraps read-only, already normalized rows (e.g. np.memmap) without copying.
+        `ids` must be sorted ascending. A precomputed reduced-precision `scan`
+        (and int8 `scales`) can be passed in; otherwise one is built in memory.
+        """
+        gallery = cls(dim=matrix.shape[1], **kwargs)
+        gallery._base_ids = ids
+        gallery._base_matrix = matrix
+        if gallery.precision != "float32":
+            if scan is None:
+                scan, scales = quantize(np.asarray(matrix), gallery.precision)
+            gallery._base_scan, gallery._base_scales = scan, scales
+        gallery.version = version
+        gallery.change_seq = change_seq
+        gallery.built_at = built_at
+        return gallery
+
+    def reset(self, other: "Gallery"):
+        """
+        Swaps in the contents of another gallery (used for full resyncs).
+        """
+        with self._lock:
+            self.precision, self.rerank_k = other.precision, other.rerank_k
+            self.template_shortlist = other.template_shortlist
+            self._size, self._ids, self._matrix, self._row = other._size, other._ids, other._matrix, other._row
+            self._scan, self._scales = other._scan, other._scales
+            self._templates = other._templates
+            self._base_ids, self._base_matrix = other._base_ids, other._base_matrix
+            self._base_scan, self._base_scales = other._base_scan, other._base_scales
+            self._base_dead, self._base_dead_count = other._base_dead, other._base_dead_count
+            self.version, self.change_seq, self.built_at = other.version, other.change_seq, other.built_at
+            self.model_version = other.model_version
+
+    def apply_changes(self, rows, deleted_ids=(), only_existing: bool = False, templates=None):
+        """
+        Applies (id, embedding) rows and deletions. A None embedding removes
+        the id. With only_existing, ids not already in the gallery are ignored.
+        `templates` maps ids to their full template list.
+        """
+        with self._lock:
+            for identity_id in deleted_ids:
+                self.remove(identity_id)
+            for identity_id, embedding in rows:
+                if only_existing and identity_id not in self:
+                    continue
+                if embedding is None:
+                    self.remove(identity_id)
+                else:
+                    self.upsert(identity_id, embedding)
+            for identity_id, embeddings in (templates or {}).items():
+                if identity_id in self:
+                    self.set_templates(identity_id, embeddings)
+
+    def __len__(self):
+        return self._size + len(self._base_ids) - self._base_dead_count
+
+    def __contains__(self, identity_id):
+        identity_id = int(identity_id)
+        return identity_id in self._row or self._base_index(identity_id) is not None
+
+    @property
+    def resident_bytes(self) -> int:
+        """
+        Heap bytes held by the gallery. Memory-mapped rows (snapshots,
+        spilled float32 rows) are left out: they are paged in on demand and
+        the kernel can drop them again.
+        """
+        arrays = (self._ids, self._matrix, self._scan, self._scales, self._base_ids,
+                  self._base_matrix, self._base_scan, self._base_scales, self._base_dead)
+        heap = sum(a.nbytes for a in arrays if a is not None and not isinstance(a, np.memmap))
+        return heap + sum(m.nbytes for m in self._templates.values())
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Bytes touched by a full first-pass scan.
+        """
+        scan_bytes = lambda m, s: (m.nbytes if m is not None else 0) + (s.nbytes if s is not None else 0)
+        if self.precision == "float32":
+            return self._matrix[:self._size].nbytes + self._base_matrix.nbytes
+        return scan_bytes(self._scan, self._scales) + scan_bytes(self._base_scan, self._base_scales)
+
+    def items(self):
+        """
+        Yields (id, normalized embedding) for every live identity.
+        """
+        with self._lock:
+            for i, identity_id in enumerate(self._base_ids):
+                if self._base_dead is None or not self._base_dead[i]:
+                    yield int(identity_id), self._base_matrix[i]
+            for row in range(self._size):
+                yield int(self._ids[row]), self._matrix[row]
+
+    def _base_index(self, identity_id: int):
+        i = int(np.searchsorted(self._base_ids, identity_id))
+        if i < len(self._base_ids) and self._base_ids[i] == identity_id:
+            if self._base_dead is None or not self._base_dead[i]:
+                return i
+        return None
+
+    def _kill_base(self, identity_id: int) -> bool:
+        i = self._base_index(identity_id)
+        if i is None:
+            return False
+        if self._base_dead is None:
+            self._base_dead = np.zeros(len(self._base_ids), dtype=bool)
+        self._base_dead[i] = True
+        self._base_dead_count += 1
+        return True
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._ids))
+        ids = np.empty(capacity, dtype=np.int64)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        ids[:self._size] = self._ids[:self._size]
+        matrix[:self._size] = self._matrix[:self._size]
+        self._ids, self._matrix = ids, matrix
+        if self._scan is not None:
+            scan = np.empty((capacity, self.dim), dtype=self._scan.dtype)
+            scan[:self._size] = self._scan[:self._size]
+            self._scan = scan
+            if self._scales is not None:
+                scales = np.empty(capacity, dtype=np.float32)
+                scales[:self._size] = self._scales[:self._size]
+                self._scales = scales
+
+    def _set_row(self, row: int, vector: np.ndarray):
+        self._matrix[row] = vector
+        if self._scan is not None:
+            scan, scales = quantize(vector[None, :], self.precision)
+            self._scan[row] = scan[0]
+            if self._scales is not None:
+                self._scales[row] = scales[0]
+
+    def _move_row(self, src: int, dst: int):
+        self._ids[dst] = self._ids[src]
+        self._matrix[dst] = self._matrix[src]
+        if self._scan is not None:
+            self._scan[dst] = self._scan[src]
+            if self._scales is not None:
+                self._scales[dst] = self._scales[src]
+
+    def upsert(self, identity_id: int, embedding):
+        vector = normalize_rows(np.asarray(embedding, dtype=np.float32).reshape(1, self.dim))[0]
+        identity_id = int(identity_id)
+        with self._lock:
+            self._kill_base(identity_id)
+            row = self._row.get(identity_id)
+            if row is None:
+                if self._size == len(self._ids):
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._ids[row] = identity_id
+                self._row[identity_id] = row
+            self._set_row(row, vector)
+
+    def set_templates(self, identity_id: int, embeddings):
+        """
+        Replaces an identity's templates; an empty list falls back to its row.
+        """
+        identity_id = int(identity_id)
+        with self._lock:
+            if embeddings is None or len(embeddings) == 0:
+                self._templates.pop(identity_id, None)
+            else:
+                matrix = np.stack([np.asarray(e, dtype=np.float32) for e in embeddings])
+                self._templates[identity_id] = normalize_rows(matrix.reshape(-1, self.dim))
+
+    def remove(self, identity_id: int) -> bool:
+        identity_id = int(identity_id)
+        with self._lock:
+            self._templates.pop(identity_id, None)
+            if self._kill_base(identity_id):
+                return True
+            row = self._row.pop(identity_id, None)
+            if row is None:
+                return False
+            # Move the last row into the hole to keep the matrix dense
+            last = self._size - 1
+            if row != last:
+                self._move_row(last, row)
+                self._row[int(self._ids[row])] = row
+            self._size = last
+            return True
+
+    def _part_candidates(self, ids, matrix, scan, scales, dead, n, queries, k, codes=None):
+        """
+        Per-query (id, similarity) candidates from one part of the gallery.
+        """
+        if n == 0:
+            return [[] for _ in queries]
+        # Rows of other identity types are masked out of the same scan
+        if codes is not None:
+            excluded = ~np.isin(np.asarray(ids[:n]) >> TYPE_SHIFT, codes)
+            dead = excluded if dead is None else dead | excluded
+
+        if scan is None:
+            # One matrix-matrix product scores every query against every row
+            sims = queries @ matrix[:n].T
+            if dead is not None:
+                sims[:, dead] = -np.inf
+            top = top_k_rows(sims, k)
+            return [
+                [(int(ids[i]), float(row_sims[i])) for i in row_top if row_sims[i] > -np.inf]
+                for row_sims, row_top in zip(sims, top)
+            ]
+
+        approx = scan_scores(scan, scales, queries, n)
+        if dead is not None:
+            approx[:, dead] = -np.inf
+        shortlists = top_k_rows(approx, max(k, self.rerank_k))
+        candidates = []
+        for q, row_approx, shortlist in zip(queries, approx, shortlists):
+            # Exact float32 cosine for the shortlist only; sorted rows keep
+            # page faults on a memory-mapped base sequential
+            shortlist = np.sort(shortlist[row_approx[shortlist] > -np.inf])
+            exact = np.asarray(matrix[shortlist]) @ q
+            candidates.append([(int(ids[shortlist[i]]), float(exact[i])) for i in top_k(exact, k)])
+        return candidates
+
+    def _template_scores(self, candidates, q):
+        """
+        Rescores shortlisted (id, centroid similarity) pairs by each
+        identity's best template, in one product over the stacked templates.
+        """
+        matrices = [self._templates.get(identity_id) for identity_id, _ in candidates]
+        present = [m for m in matrices if m is not None]
+        if not present:
+            return candidates
+        best = np.maximum.reduceat(np.vstack(present) @ q, np.cumsum([0] + [len(m) for m in present[:-1]]))
+        scores = iter(best)
+        return [(identity_id, float(next(scores)) if m is not None else sim)
+                for (identity_id, sim), m in zip(candidates, matrices)]
+
+    def search(self, query, k: int = 1, types=None, model_version: str = None):
+        """
+        Returns up to k (id, cosine similarity) pairs, best first. `types`
+        restricts an identity index to some IDENTITY_TYPES. With
+        `model_version` (the model the query was embedded with), a gallery
+        holding another model's embeddings raises ModelMismatch.
+        """
+        return self.search_batch(np.asarray(query, dtype=np.float32).reshape(1, self.dim), k, types, model_version)[0]
+
+    def search_batch(self, queries, k: int = 1, types=None, model_version: str = None):
+        """
+        search() for several queries at once: one list of matches per query.
+        """
+        queries = normalize_rows(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        codes = type_codes(types)
+        results = []
+        with self._lock:
+            # Checked under the lock reset() swaps contents under
+            if model_version is not None and model_version != self.model_version:
+                raise ModelMismatch(f"Gallery holds {self.model_version} embeddings, query is {model_version}")
+            shortlist = max(k, self.template_shortlist) if self._templates else k
+            step = max(1, BATCH_SCORE_ELEMENTS // max(1, len(self._base_ids) + self._size))
+            for start in range(0, len(queries), step):
+                chunk = queries[start:start + step]
+                base = self._part_candidates(
+                    self._base_ids, self._base_matrix, self._base_scan, self._base_scales,
+                    self._base_dead, len(self._base_ids), chunk, shortlist, codes
+                )
+                dense = self._part_candidates(
+                    self._ids, self._matrix, self._scan, self._scales, None, self._size, chunk, shortlist, codes
+                )
+                for q, base_candidates, dense_candidates in zip(chunk, base, dense):
+                    candidates = base_candidates + dense_candidates
+                    if self._templates:
+                        candidates = self._template_scores(candidates, q)
+                    candidates.sort(key=lambda c: c[1], reverse=True)
+                    results.append(candidates[:k])
+        return results
+
+class GalleryCache:
+    """
+    Small LRU of galleries keyed by e.g. attendance session id, each entry
+    expiring after `ttl` seconds so roster changes are picked up.
+    """
+    def __init__(self, max_entries: int = 64, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            gallery, loaded_at = entry
+            if time.monotonic() - loaded_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return gallery
+
+    def put(self, key, gallery: Gallery):
+        with self._lock:
+            self._entries[key] = (gallery, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def apply_changes(self, rows, deleted_ids=()):
+        """
+        Patches every cached gallery that already holds the changed ids.
+        """
+        with self._lock:
+            galleries = [gallery for gallery, _ in self._entries.values()]
+        for gallery in galleries:
+            gallery.apply_changes(rows, deleted_ids, only_existing=True)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
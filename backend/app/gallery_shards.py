@@ -0,0 +1,381 @@
+"""
+Sharded scatter-gather search for identity indexes larger than one process.
+
+Each shard is a process that owns the identities whose rendezvous hash
+picks it among the configured shard addresses. It loads only those rows,
+keeps them current with its own gallery listener, and answers searches over
+a multiprocessing connection: a unix socket path for local shards, or
+host:port for shards on other machines. Web workers hold a ShardedGallery
+client that sends each query to every shard and merges the per-shard top-k.
+
+Rendezvous hashing means that adding a shard only moves the identities the
+new shard wins. The new shard loads them itself. The existing shards are
+then told the new membership (`reshard`) and drop what they no longer own.
+
+Usage (from the backend directory):
+    python -m app.gallery_shards serve-local [--shards N] [--dir DIR]
+    python -m app.gallery_shards serve --address HOST:PORT --shards A,B,...
+    python -m app.gallery_shards reshard --shards A,B,...,NEW
+    python -m app.gallery_shards stats
+"""
+import argparse
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.connection import Listener, Client, wait
+
+import numpy as np
+
+from . import config, identities
+from .gallery import Gallery, EMBEDDING_DIM, identity_key
+
+def parse_address(address: str):
+    """
+    "host:port" -> (host, port) for TCP, anything else is a unix socket path.
+    """
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and not address.startswith("/"):
+        return (host, int(port))
+    return address
+
+def _score(shard: str, identity_id: int) -> int:
+    digest = hashlib.blake2b(f"{shard}|{identity_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+def shard_for(identity_id: int, shards) -> str:
+    """
+    Rendezvous (highest random weight) owner of an identity.
+    """
+    return max(shards, key=lambda shard: _score(shard, identity_id))
+
+def merge_results(results, k: int):
+    """
+    Merges per-shard (id, similarity) lists. An id can briefly be on two
+    shards during a reshard, so duplicates keep their best score.
+    """
+    best = {}
+    for matches in results:
+        for identity_id, sim in matches:
+            if sim > best.get(identity_id, -np.inf):
+                best[identity_id] = sim
+    return sorted(best.items(), key=lambda m: m[1], reverse=True)[:k]
+
+def shard_authkey() -> bytes:
+    if not config.GALLERY_SHARD_AUTHKEY:
+        raise SystemExit("Set GALLERY_SHARD_AUTHKEY (shared by shards and web workers)")
+    return config.GALLERY_SHARD_AUTHKEY.encode()
+
+# ------------------------------------------------------------
+# Shard server
+# ------------------------------------------------------------
+
+class ShardServer:
+    """
+    One shard: the identities it owns under the current membership, loaded
+    from the database and kept current through LISTEN/NOTIFY.
+    """
+    def __init__(self, address: str, shards, gallery_options=None):
+        self.address = address
+        self.shards = list(shards)
+        self.epoch = 0
+        self.gallery_options = gallery_options or {}
+        self.gallery = Gallery(**self.gallery_options)
+        self._listener = None
+
+    def owns(self, identity_id: int) -> bool:
+        return shard_for(identity_id, self.shards) == self.address
+
+    def load(self):
+        from . import db
+
+        with db.SessionLocal() as session:
+            gallery = identities.load(session, owns=self.owns, **self.gallery_options)
+        self.gallery.reset(gallery)
+        print(f"Gallery shard {self.address}: {len(self.gallery)} faces ({len(self.shards)} shards).")
+
+    def change_handler(self, identity_type: str):
+        def apply_changes(upserted, deleted):
+            from . import db
+
+            owned = [i for i in upserted if self.owns(identity_key(identity_type, i))]
+            with db.SessionLocal() as session:
+                changes = identities.changed_rows(session, identity_type, owned, deleted)
+                if identities.model_changed(self.gallery, session):
+                    return
+            self.gallery.apply_changes(**changes)
+        return apply_changes
+
+    def reshard(self, epoch: int, shards):
+        """
+        Adopts a new membership and drops identities now owned elsewhere.
+        Identities gained (only when shards are removed) need a reload.
+        """
+        if epoch <= self.epoch:
+            return
+        gained = any(shard not in shards for shard in self.shards)
+        self.shards, self.epoch = list(shards), epoch
+        if gained:
+            self.load()
+            return
+        moved = [identity_id for identity_id, _ in self.gallery.items() if not self.owns(identity_id)]
+        self.gallery.apply_changes([], moved)
+        print(f"Gallery shard {self.address}: epoch {epoch}, handed off {len(moved)} faces.")
+
+    def handle(self, message):
+        command = message[0]
+        if command == "search":
+            _, queries, k, types, model_version = message
+            return ("ok", self.epoch, self.gallery.search_batch(queries, k, types, model_version))
+        if command == "membership":
+            return ("ok", self.epoch, self.shards)
+        if command == "reshard":
+            _, epoch, shards = message
+            self.reshard(epoch, shards)
+            return ("ok", self.epoch, self.shards)
+        if command == "stats":
+            return ("ok", self.epoch, {"faces": len(self.gallery), "nbytes": self.gallery.nbytes})
+        return ("error", self.epoch, f"Unknown command {command!r}")
+
+    def _serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    reply = self.handle(message)
+                except Exception as e:
+                    reply = ("error", self.epoch, str(e))
+                conn.send(reply)
+
+    def serve(self, authkey: bytes):
+        from . import db, gallery_sync
+
+        address = parse_address(self.address)
+        if isinstance(address, str) and os.path.exists(address):
+            os.remove(address)
+
+        if config.GALLERY_LISTEN:
+            # The listener loads the shard on connect (and reloads on reconnect)
+            self._listener = gallery_sync.GalleryListener(db.psycopg2_dsn())
+            self._listener.on_resync(self.load)
+            for table, identity_type in identities.TABLE_TYPES.items():
+                self._listener.on_change(table, self.change_handler(identity_type))
+            # `reembed switch`: every embedding was replaced
+            self._listener.on_change("embedding_model_state", lambda upserted, deleted: self.load())
+            self._listener.start()
+        else:
+            self.load()
+
+        with Listener(address, authkey=authkey) as listener:
+            print(f"Gallery shard listening on {self.address}")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+def _run_shard(address: str, shards, authkey: bytes):
+    ShardServer(address, shards, config.GALLERY_OPTIONS).serve(authkey)
+
+# ------------------------------------------------------------
+# Client
+# ------------------------------------------------------------
+
+class ShardsUnavailable(RuntimeError):
+    """
+    A search that did not reach every shard: a missing shard may hold the
+    true best match, so its results must not be read as complete.
+    """
+    def __init__(self, missing):
+        super().__init__(f"Gallery shards unavailable: {', '.join(missing)}")
+        self.missing = missing
+
+class ShardedGallery:
+    """
+    Client side: fans each search out to every shard and merges the top-k.
+    All shards are sent the query before any reply is read, and the replies
+    are collected against one deadline, so latency is the slowest shard's.
+    Concurrent callers (web requests in the threadpool) each check out their
+    own set of connections. A shard that fails or misses the deadline is
+    reported as missing for that query and reconnected on the next.
+    """
+    def __init__(self, addresses, authkey: bytes, timeout: float = config.GALLERY_SHARD_TIMEOUT):
+        self.addresses = list(addresses)
+        self.authkey = authkey
+        self.timeout = timeout
+        self.epoch = 0
+        self._idle = []  # connection sets ({address: conn}) not in use
+        self._lock = threading.Lock()
+
+    def _checkout(self):
+        with self._lock:
+            return self._idle.pop() if self._idle else {}
+
+    def _checkin(self, conns):
+        with self._lock:
+            self._idle.append(conns)
+
+    def _conn(self, conns, address: str):
+        conn = conns.get(address)
+        if conn is None:
+            conn = Client(parse_address(address), authkey=self.authkey)
+            conns[address] = conn
+        return conn
+
+    def _drop(self, conns, address: str, error):
+        print(f"Gallery shard {address} failed: {error}")
+        conn = conns.pop(address, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _scatter(self, message):
+        """
+        Sends `message` to every shard, then collects replies until all
+        arrived or GALLERY_SHARD_TIMEOUT passed. Returns (replies, missing
+        addresses). A shard that missed the deadline is disconnected, since
+        its late reply would otherwise answer the next query.
+        """
+        addresses = list(self.addresses)
+        conns = self._checkout()
+        try:
+            pending, missing = {}, []
+            for address in addresses:
+                try:
+                    conn = self._conn(conns, address)
+                    conn.send(message)
+                    pending[conn] = address
+                except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                    self._drop(conns, address, e)
+                    missing.append(address)
+
+            replies = []
+            deadline = time.monotonic() + self.timeout
+            while pending:
+                ready = wait(list(pending), timeout=max(0.0, deadline - time.monotonic()))
+                if not ready:
+                    break
+                for conn in ready:
+                    address = pending.pop(conn)
+                    try:
+                        status, epoch, payload = conn.recv()
+                    except (OSError, EOFError) as e:
+                        self._drop(conns, address, e)
+                        missing.append(address)
+                        continue
+                    if status != "ok":
+                        print(f"Gallery shard {address}: {payload}")
+                        missing.append(address)
+                        continue
+                    replies.append((address, epoch, payload))
+            for address in pending.values():
+                self._drop(conns, address, f"no reply in {self.timeout}s")
+                missing.append(address)
+            return replies, missing
+        finally:
+            self._checkin(conns)
+
+    def _refresh_membership(self, epoch: int, shards):
+        with self._lock:
+            if epoch <= self.epoch:
+                return
+            self.epoch = epoch
+            for conns in self._idle:
+                for address in set(conns) - set(shards):
+                    self._drop(conns, address, "removed from membership")
+            self.addresses = list(shards)
+
+    def search(self, query, k: int = 1, types=None, model_version: str = None):
+        return self.search_batch(np.asarray(query, dtype=np.float32).reshape(1, EMBEDDING_DIM), k, types, model_version)[0]
+
+    def search_batch(self, queries, k: int = 1, types=None, model_version: str = None):
+        """
+        Gallery.search_batch over all shards; ShardsUnavailable if any shard
+        did not answer.
+        """
+        results, missing = self.search_batch_partial(queries, k, types, model_version)
+        if missing:
+            raise ShardsUnavailable(missing)
+        return results
+
+    def search_batch_partial(self, queries, k: int = 1, types=None, model_version: str = None):
+        """
+        search_batch over the shards that answered: (one match list per
+        query, addresses of the shards that did not). A shard still on
+        another embedding model than `model_version` does not answer.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        replies, missing = self._scatter(("search", queries, k, types, model_version))
+        newest = max((epoch for _, epoch, _ in replies), default=0)
+        if newest > self.epoch:
+            for _, epoch, shards in self._scatter(("membership",))[0]:
+                self._refresh_membership(epoch, shards)
+        if not replies:
+            return [[] for _ in queries], missing
+        # Each reply holds one match list per query
+        per_query = zip(*(matches for _, _, matches in replies))
+        return [merge_results(shard_matches, k) for shard_matches in per_query], missing
+
+    def reshard(self, shards):
+        """
+        Pushes a new membership to every shard in it. Start new shards with
+        the new list first: they load their identities before the others
+        drop them.
+        """
+        self.addresses = list(shards)
+        current = [epoch for _, epoch, _ in self._scatter(("membership",))[0]]
+        self.epoch = max(current + [self.epoch]) + 1
+        return self._scatter(("reshard", self.epoch, self.addresses))[0]
+
+    def stats(self):
+        return {address: payload for address, _, payload in self._scatter(("stats",))[0]}
+
+    def close(self):
+        with self._lock:
+            for conns in self._idle:
+                for address in list(conns):
+                    self._drop(conns, address, "closed")
+            self._idle = []
+
+def main():
+    parser = argparse.ArgumentParser(description="Run and manage gallery shards")
+    parser.add_argument("command", choices=["serve-local", "serve", "reshard", "stats"])
+    parser.add_argument("--shards", help="comma separated shard addresses (serve-local: a count)")
+    parser.add_argument("--address", help="this shard's address (serve)")
+    parser.add_argument("--dir", default="/tmp/gallery-shards", help="socket directory (serve-local)")
+    args = parser.parse_args()
+    authkey = shard_authkey()
+
+    if args.command == "serve-local":
+        count = int(args.shards or os.cpu_count())
+        os.makedirs(args.dir, exist_ok=True)
+        shards = [os.path.join(args.dir, f"shard-{i}.sock") for i in range(count)]
+        processes = [
+            multiprocessing.Process(target=_run_shard, args=(address, shards, authkey), name=f"gallery-shard-{i}")
+            for i, address in enumerate(shards)
+        ]
+        for process in processes:
+            process.start()
+        print(f"Started {count} gallery shards; set GALLERY_SHARD_ADDRESSES={','.join(shards)}")
+        for process in processes:
+            process.join()
+        return
+
+    shards = [s for s in (args.shards or "").split(",") if s] or config.GALLERY_SHARD_ADDRESSES
+    if args.command == "serve":
+        if args.address not in shards:
+            raise SystemExit("--address must be one of --shards")
+        _run_shard(args.address, shards, authkey)
+    elif args.command == "reshard":
+        for address, epoch, members in ShardedGallery(shards, authkey).reshard(shards):
+            print(f"{address}: epoch {epoch}, {len(members)} shards")
+    else:
+        for address, stats in ShardedGallery(shards, authkey).stats().items():
+            print(f"{address}: {stats['faces']} faces, {stats['nbytes'] / 1e6:.1f} MB scanned per query")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Memory-mapped gallery snapshots shared by every worker on a machine.
+
+File layout (little endian):
+    header   HEADER_SIZE bytes: magic, format, precision, dim, count, version,
+             change_seq, built_at, vectors offset, ids offset, scan offset,
+             scales offset
+    vectors  count x dim float32, L2-normalized, page aligned
+    scan     count x dim int8 copy for the first-pass scan, page
+             aligned (only for reduced-precision snapshots)
+    scales   count float32 per-row int8 scales (int8 only)
+    ids      count int64, sorted ascending
+
+Format 1 files (no scan section) are still readable as float32 snapshots,
+and so are float16 ones (no longer a gallery precision) by their vectors.
+
+Snapshots are published by pointing the `current` symlink at a new file with
+an atomic rename, so readers see either the old or the new version. Workers
+mmap the file read-only, so the OS page cache holds a single copy of the
+gallery no matter how many workers map it.
+
+Usage (from the backend directory):
+    python -m app.gallery_snapshot build [--dir DIR] [--precision float32|int8]
+    python -m app.gallery_snapshot info [--dir DIR]
+"""
+import argparse
+import datetime
+import os
+import struct
+import time
+import numpy as np
+
+from . import config
+from .gallery import Gallery, normalize_rows, quantize, PRECISIONS, EMBEDDING_DIM
+
+MAGIC = b"FGAL"
+FORMAT_VERSION = 2
+READABLE_FORMATS = (1, 2)
+# Format 1 wrote zeros for the precision code and had no scan/scales offsets,
+# so it reads as a float32 snapshot with this header too.
+HEADER = struct.Struct("<4sHHIQQQdQQQQ")
+HEADER_SIZE = 4096
+PAGE_SIZE = 4096
+SCAN_DTYPES = {"int8": "i1"}
+# Header precision codes; kept stable so old files read correctly
+PRECISION_CODES = ("float32", "float16", "int8")
+CURRENT_LINK = "current"
+KEEP_VERSIONS = 3
+
+class SnapshotInfo:
+    def __init__(self, path, precision, dim, count, version, change_seq, built_at,
+                 vectors_offset, ids_offset, scan_offset, scales_offset):
+        self.path = path
+        self.precision = precision
+        self.dim = dim
+        self.count = count
+        self.version = version
+        self.change_seq = change_seq
+        self.built_at = built_at
+        self.vectors_offset = vectors_offset
+        self.ids_offset = ids_offset
+        self.scan_offset = scan_offset
+        self.scales_offset = scales_offset
+
+def read_header(path: str) -> SnapshotInfo:
+    with open(path, "rb") as f:
+        raw = f.read(HEADER.size)
+    (magic, fmt, precision_code, dim, count, version, change_seq, built_at,
+     vectors_offset, ids_offset, scan_offset, scales_offset) = HEADER.unpack(raw)
+    if magic != MAGIC or fmt not in READABLE_FORMATS or precision_code >= len(PRECISION_CODES):
+        raise ValueError(f"{path} is not a gallery snapshot (formats {READABLE_FORMATS})")
+    return SnapshotInfo(path, PRECISION_CODES[precision_code], dim, count, version, change_seq, built_at,
+                        vectors_offset, ids_offset, scan_offset, scales_offset)
+
+def _pad_to_page(f):
+    f.write(b"\0" * (-f.tell() % PAGE_SIZE))
+
+def _write_scan(f, path: str, count: int, dim: int, precision: str):
+    """
+    Second pass over the float32 section already on disk: writes the
+    quantized copy and returns the int8 scales.
+    """
+    f.flush()
+    vectors = np.memmap(path, dtype="<f4", mode="r", offset=HEADER_SIZE, shape=(count, dim))
+    scales = np.empty(count, dtype="<f4") if precision == "int8" else None
+    for start in range(0, count, 4096):
+        scan, chunk_scales = quantize(np.asarray(vectors[start:start + 4096]), precision)
+        f.write(scan.astype(SCAN_DTYPES[precision]).tobytes())
+        if scales is not None:
+            scales[start:start + len(scan)] = chunk_scales
+    del vectors
+    return scales
+
+def write_snapshot(directory: str, rows, version: int, change_seq: int, dim: int = EMBEDDING_DIM,
+                   precision: str = "float32", built_at: float = None) -> str:
+    """
+    Streams (id, embedding) rows, which must be ordered by id, into a new
+    snapshot file and returns its path. Rows are written in chunks so the
+    builder never holds the whole gallery in memory. `built_at` (epoch
+    seconds) is when the rows were read; defaults to now.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown gallery precision: {precision}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"gallery-v{version}.bin")
+    tmp_path = path + ".tmp"
+
+    ids = []
+    chunk_ids, chunk = [], []
+    with open(tmp_path, "wb") as f:
+        f.write(b"\0" * HEADER_SIZE)
+
+        def flush():
+            f.write(normalize_rows(np.stack(chunk)).astype("<f4").tobytes())
+            ids.extend(chunk_ids)
+            chunk_ids.clear()
+            chunk.clear()
+
+        for identity_id, embedding in rows:
+            if embedding is None:
+                continue
+            chunk_ids.append(identity_id)
+            chunk.append(np.asarray(embedding, dtype=np.float32))
+            if len(chunk) >= 4096:
+                flush()
+        if chunk:
+            flush()
+
+        ids_array = np.asarray(ids, dtype="<i8")
+        if len(ids_array) > 1 and np.any(np.diff(ids_array) <= 0):
+            raise ValueError("Snapshot rows must be ordered by unique id")
+
+        scan_offset = scales_offset = 0
+        if precision != "float32" and len(ids_array):
+            _pad_to_page(f)
+            scan_offset = f.tell()
+            scales = _write_scan(f, tmp_path, len(ids_array), dim, precision)
+            if scales is not None:
+                scales_offset = f.tell()
+                f.write(scales.tobytes())
+
+        f.write(b"\0" * (-f.tell() % 8))
+        ids_offset = f.tell()
+        f.write(ids_array.tobytes())
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, PRECISION_CODES.index(precision), dim, len(ids), version,
+                            change_seq, time.time() if built_at is None else built_at, HEADER_SIZE, ids_offset, scan_offset, scales_offset))
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+    return path
+
+def publish(directory: str, path: str):
+    """
+    Atomically points `current` at `path` and removes old versions.
+    Workers still mapping a removed file keep their pages until they swap.
+    """
+    link = os.path.join(directory, CURRENT_LINK)
+    tmp_link = link + ".tmp"
+    if os.path.lexists(tmp_link):
+        os.remove(tmp_link)
+    os.symlink(os.path.basename(path), tmp_link)
+    os.replace(tmp_link, link)
+
+    snapshots = sorted(
+        (f for f in os.listdir(directory) if f.startswith("gallery-v") and f.endswith(".bin")),
+        key=lambda f: int(f[len("gallery-v"):-len(".bin")])
+    )
+    for old in snapshots[:-KEEP_VERSIONS]:
+        os.remove(os.path.join(directory, old))
+
+def current_path(directory: str):
+    link = os.path.join(directory, CURRENT_LINK)
+    if not os.path.exists(link):
+        return None
+    return os.path.realpath(link)
+
+def current_version(directory: str):
+    path = current_path(directory)
+    return read_header(path).version if path else None
+
+def open_snapshot(path: str, precision: str = None, rerank_k: int = 32, template_shortlist: int = 16) -> Gallery:
+    """
+    Maps a snapshot read-only into a Gallery without copying it. `precision`
+    defaults to the snapshot's own; asking for a different one builds a
+    private quantized copy in this process.
+    """
+    info = read_header(path)
+    precision = precision or (info.precision if info.precision in PRECISIONS else "float32")
+    if info.count == 0:
+        gallery = Gallery(dim=info.dim, precision=precision, rerank_k=rerank_k, template_shortlist=template_shortlist)
+        gallery.version, gallery.change_seq, gallery.built_at = info.version, info.change_seq, info.built_at
+        return gallery
+
+    vectors = np.memmap(path, dtype="<f4", mode="r", offset=info.vectors_offset, shape=(info.count, info.dim))
+    ids = np.memmap(path, dtype="<i8", mode="r", offset=info.ids_offset, shape=(info.count,))
+    scan = scales = None
+    if precision == info.precision and precision != "float32":
+        scan = np.memmap(path, dtype=SCAN_DTYPES[precision], mode="r", offset=info.scan_offset,
+                         shape=(info.count, info.dim))
+        if info.scales_offset:
+            scales = np.memmap(path, dtype="<f4", mode="r", offset=info.scales_offset, shape=(info.count,))
+    elif precision != "float32":
+        print(f"Gallery snapshot {path} is {info.precision}; quantizing to {precision} in memory.")
+    return Gallery.from_base(ids, vectors, version=info.version, change_seq=info.change_seq,
+                             built_at=info.built_at, scan=scan, scales=scales, precision=precision,
+                             rerank_k=rerank_k, template_shortlist=template_shortlist)
+
+def load_current(directory: str, precision: str = None, rerank_k: int = 32, template_shortlist: int = 16):
+    path = current_path(directory)
+    return open_snapshot(path, precision, rerank_k, template_shortlist) if path else None
+
+def build(directory: str, precision: str = "float32") -> str:
+    from . import crud, db, identities
+
+    previous = current_version(directory) or 0
+    with db.SessionLocal() as session:
+        # The sequence, the snapshot time and the rows all come from one
+        # REPEATABLE READ snapshot. Transactions still open at that point may
+        # hold a lower seq than change_seq; workers also replay everything
+        # logged within GALLERY_REPLAY_MARGIN of built_at to cover them.
+        session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        built_at = crud.get_db_epoch(session)
+        change_seq = crud.get_max_change_seq(session)
+        # Identity keys sort by type, then id, so this stream is in key order
+        rows = identities.iter_rows(session)
+        path = write_snapshot(directory, rows, previous + 1, change_seq, precision=precision, built_at=built_at)
+        publish(directory, path)
+
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=config.GALLERY_CHANGE_LOG_RETENTION_DAYS)
+        pruned = crud.prune_gallery_changes(session, change_seq, cutoff)
+
+    info = read_header(path)
+    print(f"Published {info.precision} gallery snapshot v{info.version}: {info.count} faces, change_seq {info.change_seq} "
+          f"({pruned} old change log entries pruned).")
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and inspect gallery snapshots")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--dir", default=config.GALLERY_SNAPSHOT_DIR)
+    parser.add_argument("--precision", default=config.GALLERY_PRECISION, choices=PRECISIONS)
+    args = parser.parse_args()
+
+    if not args.dir:
+        raise SystemExit("Set GALLERY_SNAPSHOT_DIR or pass --dir")
+
+    if args.command == "build":
+        build(args.dir, args.precision)
+    else:
+        path = current_path(args.dir)
+        if path is None:
+            print("No snapshot published.")
+            return
+        info = read_header(path)
+        print(f"{path}: v{info.version}, {info.count} x {info.dim} {info.precision}, change_seq {info.change_seq}, "
+              f"built {datetime.datetime.utcfromtimestamp(info.built_at):%Y-%m-%d %H:%M:%S} UTC")
+
+if __name__ == "__main__":
+    main()
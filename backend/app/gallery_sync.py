@@ -0,0 +1,117 @@
+import json
+import select
+import threading
+import time
+from collections import defaultdict
+import psycopg2
+
+CHANNEL = "gallery_changes"
+
+class GalleryListener(threading.Thread):
+    """
+    Background LISTEN on the gallery_changes channel (see migration 0004).
+
+    Each worker runs one listener. Notifications are drained in batches and
+    handed to per-table handlers as (upserted_ids, deleted_ids) so galleries
+    are patched incrementally. Resync callbacks (full reloads) run only when
+    the connection is (re)established, because notifications sent while we
+    were disconnected are lost.
+    """
+    def __init__(self, dsn: str, channel: str = CHANNEL, poll_timeout: float = 1.0, max_backoff: float = 30.0):
+        super().__init__(name="gallery-listener", daemon=True)
+        self.dsn = dsn
+        self.channel = channel
+        self.poll_timeout = poll_timeout
+        self.max_backoff = max_backoff
+        self.synced = False
+        self._handlers = {}
+        self._resync_callbacks = []
+        self._tick_callbacks = []
+        self._stop_event = threading.Event()
+
+    def on_change(self, table: str, handler):
+        self._handlers[table] = handler
+
+    def on_resync(self, callback):
+        self._resync_callbacks.append(callback)
+
+    def on_tick(self, callback, interval: float):
+        """
+        Runs `callback` on the listener thread about every `interval` seconds,
+        so it never races with change handlers.
+        """
+        self._tick_callbacks.append([callback, interval, time.monotonic() + interval])
+
+    def _run_ticks(self):
+        now = time.monotonic()
+        for tick in self._tick_callbacks:
+            callback, interval, due = tick
+            if now >= due:
+                tick[2] = now + interval
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Gallery listener: tick {callback.__name__} failed: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        conn.cursor().execute(f"LISTEN {self.channel};")
+        return conn
+
+    def _dispatch(self, notifies):
+        # Collapse the batch: the last operation per (table, id) wins
+        changes = defaultdict(dict)
+        for notify in notifies:
+            try:
+                payload = json.loads(notify.payload)
+                changes[payload["table"]][payload["id"]] = payload["op"]
+            except (ValueError, KeyError) as e:
+                print(f"Gallery listener: bad payload {notify.payload!r}: {e}")
+
+        for table, ops in changes.items():
+            handler = self._handlers.get(table)
+            if handler is None:
+                continue
+            upserted = [i for i, op in ops.items() if op != "DELETE"]
+            deleted = [i for i, op in ops.items() if op == "DELETE"]
+            try:
+                handler(upserted, deleted)
+            except Exception as e:
+                print(f"Gallery listener: {table} handler failed: {e}")
+
+    def run(self):
+        backoff = 1.0
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                # LISTEN is active before reloading, so nothing committed during
+                # the reload is missed; replaying those events is idempotent.
+                for callback in self._resync_callbacks:
+                    callback()
+                self.synced = True
+                backoff = 1.0
+
+                while not self._stop_event.is_set():
+                    if select.select([conn], [], [], self.poll_timeout) != ([], [], []):
+                        conn.poll()
+                        if conn.notifies:
+                            notifies = list(conn.notifies)
+                            conn.notifies.clear()
+                            self._dispatch(notifies)
+                    self._run_ticks()
+            except Exception as e:
+                print(f"Gallery listener disconnected: {e}; retrying in {backoff:.0f}s")
+                self._stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+            finally:
+                self.synced = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
@@ -0,0 +1,95 @@
+"""
+Loading and patching the identity index: users, students and faculty in one
+gallery, keyed by gallery.identity_key so one scan answers any type filter.
+"""
+import datetime
+
+from . import config, crud
+from .gallery import Gallery, IDENTITY_TYPES, identity_key
+
+# Tables reported by the gallery_changes trigger -> identity type
+TABLE_TYPES = {"users": "user", "students": "student", "faculty": "faculty"}
+
+def iter_rows(session, owns=None):
+    """
+    Streams (key, embedding) for every identity in key order, optionally
+    only the keys `owns` accepts (e.g. a shard's).
+    """
+    for identity_type in IDENTITY_TYPES:
+        for identity_id, embedding in crud.get_identity_embeddings(session, identity_type):
+            key = identity_key(identity_type, identity_id)
+            if owns is None or owns(key):
+                yield key, embedding
+
+def attach_templates(gallery: Gallery, session, user_ids=None):
+    """
+    Loads users' face templates for the identities present in the gallery.
+    """
+    for user_id, templates in crud.get_face_templates(session, user_ids).items():
+        key = identity_key("user", user_id)
+        if key in gallery:
+            gallery.set_templates(key, templates)
+
+def active_model(session) -> str:
+    """
+    The embedding model stored embeddings are computed with; the configured
+    default until the schema has been migrated.
+    """
+    return crud.get_active_model_version(session) or config.EDGEFACE_MODEL
+
+def load(session, owns=None, **options) -> Gallery:
+    gallery = Gallery.from_rows(iter_rows(session, owns), **options)
+    attach_templates(gallery, session)
+    # Read after the rows: if a reembed switch commits in between, the tag
+    # is ahead of the rows and searches are refused until the next reload,
+    # never answered from a mix of models
+    gallery.model_version = active_model(session)
+    return gallery
+
+def model_changed(gallery: Gallery, session) -> bool:
+    """
+    True once a reembed switch has committed since the gallery was loaded.
+    Changes read in `session` may then hold the new model's embeddings, so
+    they are not applied; the gallery is marked stale (searches refused)
+    until the model change reloads it.
+    """
+    if active_model(session) == gallery.model_version:
+        return False
+    gallery.model_version = None
+    return True
+
+def changed_rows(session, identity_type: str, upserted, deleted):
+    """
+    Turns a batch of changed row ids into keyword arguments for
+    Gallery.apply_changes: keyed rows, deletions and user templates.
+    """
+    rows = crud.get_identity_embeddings(session, identity_type, upserted) if upserted else []
+    # Rows gone by the time we look were deleted in the meantime
+    found = {row[0] for row in rows}
+    deleted = list(deleted) + [i for i in upserted if i not in found]
+
+    templates = {}
+    if identity_type == "user" and found:
+        user_templates = crud.get_face_templates(session, list(found))
+        templates = {identity_key("user", i): user_templates.get(i) for i in found}
+    return {
+        "rows": [(identity_key(identity_type, i), embedding) for i, embedding in rows],
+        "deleted_ids": [identity_key(identity_type, i) for i in deleted],
+        "templates": templates,
+    }
+
+def catch_up(gallery: Gallery, session):
+    """
+    Replays the gallery change log after the snapshot's change_seq onto it,
+    plus everything logged within GALLERY_REPLAY_MARGIN of when it was
+    built (replaying a change twice is harmless).
+    """
+    since_time = None
+    if gallery.built_at:
+        since_time = datetime.datetime.utcfromtimestamp(gallery.built_at - config.GALLERY_REPLAY_MARGIN)
+    for table, identity_type in TABLE_TYPES.items():
+        changes = crud.get_gallery_changes(session, table, gallery.change_seq, since_time)
+        upserted = [i for i, op in changes.items() if op != "DELETE"]
+        deleted = [i for i, op in changes.items() if op == "DELETE"]
+        if upserted or deleted:
+            gallery.apply_changes(**changed_rows(session, identity_type, upserted, deleted))
@@ -0,0 +1,147 @@
+"""
+Bounded ingestion of uploaded images: nothing is read or decoded without a
+limit.
+
+- RequestSizeLimit (ASGI middleware) caps the request body while it streams
+  in: Content-Length is checked up front and chunked bodies are counted, so
+  an oversized upload is answered with 413 before the multipart form has
+  been spooled.
+- read_upload reads one upload part in chunks and stops as soon as it
+  passes UPLOAD_MAX_PART_BYTES.
+- decode_image checks format and dimensions from the image header alone,
+  rejects images over UPLOAD_MAX_PIXELS (decompression bombs) and downscales
+  large ones; for JPEG the decoder itself decodes at 1/2, 1/4 or 1/8 scale
+  (draft mode), so the full-size image is never materialized.
+"""
+import io
+import json
+
+from PIL import Image
+
+from . import config
+
+FORMATS = ("JPEG", "PNG", "WEBP")
+CHUNK_SIZE = 64 * 1024
+
+class IngestError(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class UploadTooLarge(Exception):
+    pass
+
+class RequestSizeLimit:
+    """
+    ASGI middleware capping request bodies at `max_bytes`, or at the limit
+    of the longest matching path prefix in `path_limits` (0 = no limit).
+    """
+    def __init__(self, app, max_bytes: int, path_limits=None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = sorted((path_limits or {}).items(), key=lambda item: len(item[0]), reverse=True)
+
+    def limit_for(self, path: str) -> int:
+        for prefix, limit in self.path_limits:
+            if path.startswith(prefix):
+                return limit
+        return self.max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        limit = self.limit_for(scope["path"])
+        if not limit:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > limit:
+                return await self._reject(send, limit)
+
+        state = {"received": 0, "exceeded": False, "started": False}
+
+        async def limited_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > limit:
+                    state["exceeded"] = True
+                    raise UploadTooLarge()
+            return message
+
+        async def guarded_send(message):
+            # Past the limit the app's own answer (FastAPI turns a failed
+            # form parse into a 400) is replaced by the 413
+            if state["exceeded"] and not state["started"]:
+                return
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not state["exceeded"]:
+                raise
+        if state["exceeded"] and not state["started"]:
+            await self._reject(send, limit)
+
+    async def _reject(self, send, limit: int):
+        body = json.dumps({"detail": f"Request body larger than {limit} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+async def read_upload(file, max_bytes: int = None) -> bytes:
+    """
+    The bytes of an upload part, read in chunks; IngestError (413) as soon
+    as it passes `max_bytes` (UPLOAD_MAX_PART_BYTES).
+    """
+    max_bytes = max_bytes or config.UPLOAD_MAX_PART_BYTES
+    if getattr(file, "size", None) is not None and file.size > max_bytes:
+        raise IngestError(f"Upload part larger than {max_bytes} bytes", 413)
+    chunks, total = [], 0
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise IngestError(f"Upload part larger than {max_bytes} bytes", 413)
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def decode_image(data: bytes, max_side: int = None, size=None, formats=FORMATS) -> Image.Image:
+    """
+    RGB image from encoded bytes. Format, pixel count and the expected
+    `size` (if given) are checked on the header before any pixel is
+    decoded; a side over `max_side` (UPLOAD_MAX_SIDE) is scaled down.
+    """
+    max_side = config.UPLOAD_MAX_SIDE if max_side is None else max_side
+    try:
+        image = Image.open(io.BytesIO(data))
+    except Exception:
+        raise IngestError("Invalid image file")
+    if image.format not in formats:
+        raise IngestError(f"Images must be {', '.join(formats)}")
+
+    width, height = image.size
+    if size is not None and (width, height) != tuple(size):
+        raise IngestError(f"Image is {width}x{height}, expected {size[0]}x{size[1]}")
+    if config.UPLOAD_MAX_PIXELS and width * height > config.UPLOAD_MAX_PIXELS:
+        raise IngestError(f"Image is {width}x{height}, more than {config.UPLOAD_MAX_PIXELS} pixels", 413)
+
+    try:
+        if max_side and max(width, height) > max_side:
+            scale = max_side / max(width, height)
+            # JPEG only: pick the smallest decoder scale still >= the target
+            image.draft("RGB", (max(1, int(width * scale)), max(1, int(height * scale))))
+            image = image.convert("RGB")
+            image.thumbnail((max_side, max_side))
+            return image
+        return image.convert("RGB")
+    except Exception:
+        raise IngestError("Invalid image file")
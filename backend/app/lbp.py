@@ -0,0 +1,215 @@
+"""
+LBP texture features for presentation-attack (spoof) detection on the
+aligned 112x112 face crop. Printed photos and screens lose fine skin texture
+and add moire and halftone patterns, which show up in the distribution of
+local binary patterns.
+
+Features are uniform LBP(8, 1) histograms over a GRID x GRID grid of cells,
+L1-normalized per cell and square-rooted. Everything is whole-array numpy
+(eight shifted comparisons and one bincount), so a face costs a few ms.
+
+A model is a small logistic regression stored as .npz (weights, bias,
+feature mean/std, decision threshold), trained and calibrated with:
+
+    python -m app.lbp calibrate --real DIR --spoof DIR [--out lbp_model.npz]
+        [--target-apcer 0.05] [--align]
+
+Images in the directories are aligned 112x112 crops, or any photos with
+--align. The threshold is chosen on a held-out split so that at most
+--target-apcer of spoofs are accepted.
+"""
+import argparse
+import os
+
+import numpy as np
+
+CROP_SIZE = 112
+GRID = 4
+N_BINS = 59  # 58 uniform patterns + 1 bin for all others
+
+# Neighbours of LBP(8, 1), clockwise from the top-left
+OFFSETS = ((-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1))
+
+def _uniform_lut() -> np.ndarray:
+    """
+    Maps each 8-bit code to its uniform pattern label (at most two 0/1
+    transitions around the circle), or N_BINS - 1.
+    """
+    codes = np.arange(256)
+    bits = (codes[:, None] >> np.arange(8)) & 1
+    transitions = (bits != np.roll(bits, 1, axis=1)).sum(axis=1)
+    lut = np.full(256, N_BINS - 1, dtype=np.int64)
+    uniform = transitions <= 2
+    lut[uniform] = np.arange(uniform.sum())
+    return lut
+
+UNIFORM_LUT = _uniform_lut()
+
+def to_gray(face_image) -> np.ndarray:
+    """
+    Grey float32 array of a crop (PIL image or numpy RGB/grey array) at
+    CROP_SIZE x CROP_SIZE.
+    """
+    if hasattr(face_image, "convert"):
+        face_image = face_image.convert("L")
+        if face_image.size != (CROP_SIZE, CROP_SIZE):
+            face_image = face_image.resize((CROP_SIZE, CROP_SIZE))
+        return np.asarray(face_image, dtype=np.float32)
+    gray = np.asarray(face_image, dtype=np.float32)
+    if gray.ndim == 3:
+        gray = gray @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    return gray
+
+def lbp_labels(gray: np.ndarray) -> np.ndarray:
+    """
+    Uniform LBP label of every interior pixel, shape (H - 2, W - 2).
+    """
+    h, w = gray.shape
+    center = gray[1:-1, 1:-1]
+    codes = np.zeros(center.shape, dtype=np.int64)
+    for bit, (dy, dx) in enumerate(OFFSETS):
+        codes |= (gray[1 + dy:h - 1 + dy, 1 + dx:w - 1 + dx] >= center).astype(np.int64) << bit
+    return UNIFORM_LUT[codes]
+
+def features(face_image, grid: int = GRID) -> np.ndarray:
+    """
+    Concatenated per-cell uniform LBP histograms, shape (grid * grid * N_BINS,).
+    """
+    labels = lbp_labels(to_gray(face_image))
+    h, w = labels.shape
+    rows = np.arange(h) * grid // h
+    cols = np.arange(w) * grid // w
+    cells = rows[:, None] * grid + cols[None, :]
+    hist = np.bincount((cells * N_BINS + labels).ravel(), minlength=grid * grid * N_BINS).astype(np.float32)
+    hist = hist.reshape(grid * grid, N_BINS)
+    hist /= np.maximum(hist.sum(axis=1, keepdims=True), 1.0)
+    return np.sqrt(hist).ravel()
+
+# ------------------------------------------------------------
+# Model
+# ------------------------------------------------------------
+
+class TextureModel:
+    """
+    Logistic regression on standardized LBP features; `score` is the
+    probability that a crop is a live face.
+    """
+    def __init__(self, weights, bias, mean, std, threshold, grid=GRID):
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.bias = float(bias)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.threshold = float(threshold)
+        self.grid = int(grid)
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path)
+        return cls(data["weights"], data["bias"], data["mean"], data["std"], data["threshold"], data["grid"])
+
+    def save(self, path: str):
+        np.savez(path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 threshold=self.threshold, grid=self.grid)
+
+    def scores(self, feature_rows: np.ndarray) -> np.ndarray:
+        z = ((feature_rows - self.mean) / self.std) @ self.weights + self.bias
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def score(self, face_image) -> float:
+        return float(self.scores(features(face_image, self.grid)[None, :])[0])
+
+def train_logistic(x: np.ndarray, y: np.ndarray, l2: float = 1e-2, steps: int = 500, lr: float = 0.5):
+    """
+    Full-batch gradient descent; x is standardized. Returns (weights, bias).
+    """
+    weights = np.zeros(x.shape[1], dtype=np.float32)
+    bias = 0.0
+    for _ in range(steps):
+        p = 1.0 / (1.0 + np.exp(-(x @ weights + bias)))
+        error = p - y
+        weights -= lr * (x.T @ error / len(y) + l2 * weights)
+        bias -= lr * float(error.mean())
+    return weights, bias
+
+def calibrate_threshold(live_scores: np.ndarray, spoof_scores: np.ndarray, target_apcer: float) -> float:
+    """
+    Threshold that accepts at most `target_apcer` of the spoofs and, within
+    that, rejects the fewest live faces (then the fewest spoofs).
+    """
+    candidates = np.unique(np.concatenate([live_scores, np.nextafter(spoof_scores, np.inf), [0.5]]))
+    apcer = (spoof_scores[None, :] >= candidates[:, None]).mean(axis=1) if len(spoof_scores) else 0 * candidates
+    bpcer = (live_scores[None, :] < candidates[:, None]).mean(axis=1) if len(live_scores) else 0 * candidates
+    feasible = np.flatnonzero(apcer <= target_apcer)
+    best = feasible[np.lexsort((apcer[feasible], bpcer[feasible]))[0]]
+    return float(candidates[best])
+
+def fit(real: np.ndarray, spoof: np.ndarray, target_apcer: float = 0.05, holdout: float = 0.2, seed: int = 0):
+    """
+    Trains on feature rows of live and spoof crops and picks the threshold
+    on a held-out split. Returns (model, held-out APCER, held-out BPCER).
+    """
+    rng = np.random.default_rng(seed)
+    x = np.vstack([real, spoof]).astype(np.float32)
+    y = np.concatenate([np.ones(len(real)), np.zeros(len(spoof))]).astype(np.float32)
+    order = rng.permutation(len(y))
+    split = max(1, int(len(y) * (1 - holdout)))
+    train, held = order[:split], order[split:] if split < len(y) else order
+
+    mean = x[train].mean(axis=0)
+    std = x[train].std(axis=0) + 1e-6
+    weights, bias = train_logistic((x[train] - mean) / std, y[train])
+    model = TextureModel(weights, bias, mean, std, 0.5)
+
+    held_scores = model.scores(x[held])
+    model.threshold = calibrate_threshold(held_scores[y[held] == 1], held_scores[y[held] == 0], target_apcer)
+    accepted = held_scores >= model.threshold
+    apcer = float(accepted[y[held] == 0].mean()) if (y[held] == 0).any() else 0.0
+    bpcer = float((~accepted[y[held] == 1]).mean()) if (y[held] == 1).any() else 0.0
+    return model, apcer, bpcer
+
+def _load_dir(path: str, align: bool):
+    from PIL import Image
+
+    detector = None
+    if align:
+        # Aligned like the crops the check sees at run time (LANDMARK_PROFILE)
+        from .antispoofing import AntiSpoofing
+        from .detector import FaceDetector
+        detector, landmarks = FaceDetector(), AntiSpoofing()
+    rows = []
+    for name in sorted(os.listdir(path)):
+        if not name.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        image = Image.open(os.path.join(path, name)).convert("RGB")
+        if detector is not None:
+            faces = detector.detect_all(image)
+            if not faces:
+                print(f"  no face in {name}, skipped")
+                continue
+            box, _, points = max(faces, key=lambda f: (f[0][2] - f[0][0]) * (f[0][3] - f[0][1]))
+            image = landmarks.align_detection(detector, image, box, points)
+        rows.append(features(image))
+    return np.array(rows, dtype=np.float32).reshape(-1, GRID * GRID * N_BINS)
+
+def main():
+    from . import config
+
+    parser = argparse.ArgumentParser(description="Train and calibrate the LBP texture spoof model")
+    parser.add_argument("command", choices=["calibrate"])
+    parser.add_argument("--real", required=True, help="directory of live face images")
+    parser.add_argument("--spoof", required=True, help="directory of printed/screen attack images")
+    parser.add_argument("--out", default=config.LBP_MODEL_PATH or "lbp_model.npz")
+    parser.add_argument("--target-apcer", type=float, default=0.05, help="max share of spoofs accepted")
+    parser.add_argument("--align", action="store_true", help="detect and align faces (images are not crops)")
+    args = parser.parse_args()
+
+    real, spoof = _load_dir(args.real, args.align), _load_dir(args.spoof, args.align)
+    if not len(real) or not len(spoof):
+        raise SystemExit("Need at least one live and one spoof image")
+    model, apcer, bpcer = fit(real, spoof, args.target_apcer)
+    model.save(args.out)
+    print(f"Saved {args.out}: {len(real)} live / {len(spoof)} spoof, threshold {model.threshold:.3f}, "
+          f"held-out APCER {apcer:.3f}, BPCER {bpcer:.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,36 @@
-from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException, status
+from fastapi import FastAPI, Depends, UploadFile, File, Form, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import numpy as np
 import io
+import json
+import os
 import pickle
+import shutil
+import tempfile
 from PIL import Image
-from . import models, schemas, crud, db, detector, edgeface, antispoofing
+from . import models, schemas, crud, crud_async, db, detector, edgeface, antispoofing, config, frames, gallery, gallery_sync, gallery_snapshot, gallery_shards, identities, bulk_enroll, ingest, quality
+from starlette.concurrency import run_in_threadpool
+from .responses import rows_response
 
-models.Base.metadata.create_all(bind=db.engine)
+# Schema is managed by versioned migrations (python -m app.migrate), run once
+# per deploy rather than on every worker boot.
 
 app = FastAPI()
 
+# Cap request bodies while they stream in; added before CORS so the 413
+# still carries CORS headers
+app.add_middleware(
+    ingest.RequestSizeLimit,
+    max_bytes=config.UPLOAD_MAX_REQUEST_BYTES,
+    path_limits={
+        "/enroll/bulk": config.UPLOAD_MAX_ARCHIVE_BYTES,
+        "/recognize/frames": config.FRAME_MAX_PAYLOAD_BYTES,
+    },
+)
+
 # Add CORS to allow frontend communication
 app.add_middleware(
     CORSMiddleware,
@@ -20,12 +39,33 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if config.GZIP_MIN_SIZE > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=config.GZIP_MIN_SIZE)
 
 # Initialize models
 print("Loading models...")
 face_detector = detector.FaceDetector()
-edge_face = edgeface.EdgeFaceWrapper(device='cpu')
+
+def active_model_version():
+    """
+    The embedding model every stored embedding was computed with; the
+    configured default until the schema has been migrated.
+    """
+    try:
+        with db.SessionLocal() as session:
+            return identities.active_model(session)
+    except Exception as e:
+        print(f"Could not read the active embedding model ({e}); using {config.EDGEFACE_MODEL}")
+        return config.EDGEFACE_MODEL
+
+edge_face = edgeface.EdgeFaceWrapper(device='cpu', model_name=active_model_version())
 anti_spoof = antispoofing.AntiSpoofing()
+if anti_spoof.texture_model is None and (config.LBP_ENFORCE or config.LBP_RECOGNIZE):
+    # Otherwise every texture check would silently pass
+    raise RuntimeError(
+        "LBP_ENFORCE/LBP_RECOGNIZE need a texture model: set LBP_MODEL_PATH to one "
+        "calibrated with `python -m app.lbp calibrate`"
+    )
 print("Models loaded.")
 
 def get_db():
@@ -35,13 +75,30 @@ def get_db():
     finally:
         db_session.close()
 
-async def read_image(file: UploadFile) -> Image.Image:
-    contents = await file.read()
+async def read_image(file: UploadFile, max_side: int = None) -> Image.Image:
+    """
+    Reads and decodes an uploaded image within the upload limits (see
+    ingest.py); oversized images are rejected or downscaled before a full
+    decode.
+    """
     try:
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
-        return image
-    except Exception as e:
-        raise HTTPException(status_code=400, detail="Invalid image file")
+        contents = await ingest.read_upload(file)
+        return await run_in_threadpool(ingest.decode_image, contents, max_side)
+    except ingest.IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+async def read_frame(frame) -> Image.Image:
+    """
+    One /recognize frame: an upload part, or (bytes, size) from a FRM1
+    payload. Frames are decoded only when they are used.
+    """
+    if isinstance(frame, UploadFile):
+        return await read_image(frame)
+    data, size = frame
+    try:
+        return await run_in_threadpool(frames.decode_frame, data, size)
+    except frames.FrameError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
 
 @app.post("/register", response_model=schemas.User)
 async def register(
@@ -56,135 +113,541 @@ async def register(
     
     if len(files) != 3:
         raise HTTPException(status_code=400, detail="Must provide exactly 3 images")
-    
+
+    # One model for every capture and the stored version tag, even if a
+    # model switch lands mid-request
+    embedder = edge_face
     embeddings = []
+    crops = []
     
     for file in files:
         image = await read_image(file)
         
-        # 1. Anti-Spoofing Check
-        is_real, score, msg = anti_spoof.check_texture_lbp(image)
-        # Note: LBP is heuristic. If your camera quality varies, this might be flaky.
-        # We can log the score for now or enforce it. 
-        # For this demo, we will warn but proceed if score is not completely zero, 
-        # or strictly enforce if configured.
-        # Let's enforce a weak check or just rely on Face Detection confidence for now
-        # per the "simple" requirement, but I'll leave the check active.
+        # 1. Detect and align the largest face (LANDMARK_PROFILE)
+        face_img = await run_in_threadpool(crop_largest_face, image)
+        if face_img is None:
+             raise HTTPException(status_code=400, detail="No face detected in one of the images")
+
+        # 2. Anti-Spoofing Check on the face crop only (LBP texture)
+        is_real, score, msg = anti_spoof.check_texture_lbp(face_img)
         if not is_real:
             print(f"LBP Spoof Warning: {score} ({msg})")
-            # raise HTTPException(status_code=400, detail="Spoof detected (Texture)")
-        
-        # 2. Detect Face
-        # MTCNN returns boxes
-        bboxes = face_detector.detect_faces(image)
-        if not bboxes:
-             raise HTTPException(status_code=400, detail="No face detected in one of the images")
-        
-        # Select largest face
-        # bbox is (x1, y1, x2, y2)
-        # Area = (x2-x1) * (y2-y1)
-        bboxes.sort(key=lambda b: (b[2]-b[0]) * (b[3]-b[1]), reverse=True)
-        bbox = bboxes[0]
-        
-        # New: Use Align Face instead of simple crop
-        landmarks = anti_spoof.get_landmarks(image)
-        if landmarks is not None:
-             face_img = face_detector.align_face(image, landmarks)
-        else:
-             # Fallback to crop if landmarks fail
-             face_img = face_detector.get_cropped_face(image, bbox)
+            if config.LBP_ENFORCE:
+                raise HTTPException(status_code=400, detail="Spoof detected (Texture)")
         
         # 3. Get Embedding
-        emb = edge_face.get_embedding(face_img)
+        emb = embedder.get_embedding(face_img)
         embeddings.append(emb)
+        # Keep the aligned crop so a new model can re-embed this user
+        crops.append(edgeface.encode_crop(face_img))
     
-    # Average the embeddings to store a single robust vector
+    # Keep every capture as a template; their mean is the search centroid
     if embeddings:
-        avg_embedding = np.mean(embeddings, axis=0)
+        centroid = gallery.centroid(embeddings)
     else:
         raise HTTPException(status_code=400, detail="No embeddings generated")
 
+    # Same face already enrolled (under any name)?
+    duplicate = None
+    if config.DUPLICATE_ACTION != "off":
+        duplicate = await find_duplicate(db, centroid, embeddings, embedder.model_name)
+    if duplicate is not None and config.DUPLICATE_ACTION == "reject":
+        identity_type, identity_id, similarity = duplicate
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Face already registered ({identity_type} {identity_id}, similarity {similarity:.2f})"
+        )
+
     # Save to DB
     user_data = schemas.UserCreate(name=name, enrollment_number=enrollment_number)
-    user = crud.create_user(db, user_data, avg_embedding)
+    user = crud.create_user(db, user_data, centroid, templates=embeddings, duplicate=duplicate,
+                            crops=crops, model_version=embedder.model_name)
     return user
 
-@app.post("/recognize")
-async def recognize(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
-    embeddings = []
+gallery_options = config.GALLERY_OPTIONS
+
+# Roster galleries per attendance session, loaded on first use
+roster_galleries = gallery.GalleryCache(max_entries=config.ROSTER_CACHE_SIZE, ttl=config.ROSTER_CACHE_TTL)
+
+async def get_roster_gallery(db, session_id: int) -> gallery.Gallery:
+    roster = roster_galleries.get(session_id)
+    if roster is None:
+        session = await crud_async.get_session(db, session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Attendance session not found")
+        rows = await crud_async.get_roster_embeddings(db, session.offering_id)
+        roster = gallery.Gallery.from_rows(rows, **gallery_options)
+        # After the rows, as in identities.load
+        roster.model_version = await crud_async.get_active_model_version(db) or config.EDGEFACE_MODEL
+        roster_galleries.put(session_id, roster)
+    return roster
+
+# Identity index (users, students and faculty), kept current in every
+# worker by the gallery listener
+identity_gallery = gallery.Gallery(**gallery_options)
+gallery_listener = None
+
+# With shards configured the identity index lives in the shard processes instead
+identity_shards = None
+if config.GALLERY_SHARD_ADDRESSES:
+    identity_shards = gallery_shards.ShardedGallery(config.GALLERY_SHARD_ADDRESSES, gallery_shards.shard_authkey())
+
+def fetch_changed_embeddings(session, fetch, upserted, deleted):
+    if not upserted:
+        return [], list(deleted)
+    rows = fetch(session, upserted)
+    # Rows gone by the time we look were deleted in the meantime
+    found = {row[0] for row in rows}
+    return rows, list(deleted) + [i for i in upserted if i not in found]
+
+def load_identity_gallery(session) -> gallery.Gallery:
+    """
+    The published snapshot (memory-mapped, shared with the other workers)
+    caught up through the change log, or a full database load when no
+    snapshot is configured.
+    """
+    snapshot = None
+    if config.GALLERY_SNAPSHOT_DIR:
+        snapshot = gallery_snapshot.load_current(config.GALLERY_SNAPSHOT_DIR, **gallery_options)
+    if snapshot is None:
+        change_seq = crud.get_max_change_seq(session)
+        index = identities.load(session, **gallery_options)
+        index.change_seq = change_seq
+        return index
+
+    identities.catch_up(snapshot, session)
+    # Snapshots hold centroids only; templates are small and loaded per worker
+    identities.attach_templates(snapshot, session)
+    # The change log replays a switch's re-embedding, so the snapshot is
+    # on the model active after the catch-up
+    snapshot.model_version = identities.active_model(session)
+    return snapshot
+
+def resync_identity_gallery(loaded=None):
+    if loaded is None:
+        with db.SessionLocal() as session:
+            loaded = load_identity_gallery(session)
+    identity_gallery.reset(loaded)
+    source = f"snapshot v{identity_gallery.version}" if identity_gallery.version else "database"
+    print(f"Identity gallery loaded from {source} ({len(identity_gallery)} faces, {identity_gallery.model_version}).")
+
+def resync_galleries():
+    """
+    Full reload, on (re)connecting to the listener and after a model switch
+    (which may have been missed while disconnected). A new embedding model
+    and the gallery re-embedded with it are both loaded before either is
+    swapped in. Galleries are tagged with their model and searches with the
+    query's (see search_index), so a query embedded with one model is never
+    matched against the other's embeddings while the swap is under way.
+    """
+    global edge_face
+    version = active_model_version()
+    embedder = edge_face
+    if version != edge_face.model_name:
+        print(f"Switching embedding model {edge_face.model_name} -> {version}")
+        embedder = edgeface.EdgeFaceWrapper(device='cpu', model_name=version)
+    loaded = None
+    if identity_shards is None:
+        with db.SessionLocal() as session:
+            loaded = load_identity_gallery(session)
+    edge_face = embedder
+    if loaded is not None:
+        resync_identity_gallery(loaded)
+    # Roster changes may have been missed while disconnected
+    roster_galleries.invalidate()
+
+def check_gallery_snapshot():
+    version = gallery_snapshot.current_version(config.GALLERY_SNAPSHOT_DIR)
+    if version is not None and version != identity_gallery.version:
+        resync_identity_gallery()
+
+def identity_change_handler(identity_type: str):
+    def apply_changes(upserted, deleted):
+        # Template changes always rewrite a user's centroid, so they arrive as user updates
+        with db.SessionLocal() as session:
+            changes = identities.changed_rows(session, identity_type, upserted, deleted)
+            if identities.model_changed(identity_gallery, session):
+                return
+        identity_gallery.apply_changes(**changes)
+    return apply_changes
+
+apply_identity_student_changes = identity_change_handler("student")
+
+def apply_student_changes(upserted, deleted):
+    if identity_shards is None:
+        apply_identity_student_changes(upserted, deleted)
+    with db.SessionLocal() as session:
+        rows, deleted = fetch_changed_embeddings(session, crud.get_student_embeddings, upserted, deleted)
+        version = identities.active_model(session)
+    if version != edge_face.model_name:
+        # A reembed switch: the rosters are rebuilt with the new model
+        roster_galleries.invalidate()
+        return
+    roster_galleries.apply_changes(rows, deleted)
+
+def apply_enrollment_changes(offering_ids, deleted_offering_ids):
+    roster_galleries.invalidate()
+
+def apply_model_change(upserted, deleted):
+    """
+    `python -m app.reembed switch` replaced every embedding.
+    """
+    resync_galleries()
+
+@app.on_event("startup")
+def start_gallery_listener():
+    global gallery_listener
+    if not config.GALLERY_LISTEN:
+        return
+    gallery_listener = gallery_sync.GalleryListener(db.psycopg2_dsn())
+    gallery_listener.on_resync(resync_galleries)
+    if identity_shards is None:
+        gallery_listener.on_change("users", identity_change_handler("user"))
+        gallery_listener.on_change("faculty", identity_change_handler("faculty"))
+    gallery_listener.on_change("students", apply_student_changes)
+    gallery_listener.on_change("enrollments", apply_enrollment_changes)
+    gallery_listener.on_change("embedding_model_state", apply_model_change)
+    if config.GALLERY_SNAPSHOT_DIR and identity_shards is None:
+        gallery_listener.on_tick(check_gallery_snapshot, config.GALLERY_SNAPSHOT_POLL)
+    gallery_listener.start()
+
+@app.on_event("shutdown")
+def stop_gallery_listener():
+    if gallery_listener is not None:
+        gallery_listener.stop()
+    if identity_shards is not None:
+        identity_shards.close()
+
+def crop_largest_face(image: Image.Image):
+    """
+    Detects and aligns the largest face, or returns None.
+    """
+    faces = face_detector.detect_all(image)
+    if not faces:
+        return None
+    bbox, _, points = max(faces, key=lambda f: (f[0][2]-f[0][0]) * (f[0][3]-f[0][1]))
+    return anti_spoof.align_detection(face_detector, image, bbox, points)
+
+def detect_scored_face(image: Image.Image):
+    """
+    The largest face in a frame and its quality, before any alignment:
+    (FaceQuality, image, 5 landmarks, box), or None.
+    """
+    faces = face_detector.detect_all(image)
+    if not faces:
+        return None
+    box, prob, points = max(faces, key=lambda f: (f[0][2] - f[0][0]) * (f[0][3] - f[0][1]))
+    return quality.score_face(image, box, prob, points), image, points, box
+
+async def get_identity_index(db, types):
+    """
+    The gallery to search: the shards, this worker's identity gallery, or
+    (listener down) one loaded for this request with just the requested types.
+    """
+    if identity_shards is not None:
+        return identity_shards
+    if gallery_listener is not None and gallery_listener.synced:
+        return identity_gallery
+    index = gallery.Gallery(**gallery_options)
+    for t in types or gallery.IDENTITY_TYPES:
+        rows = await crud_async.get_identity_embeddings(db, t)
+        index.apply_changes([(gallery.identity_key(t, i), e) for i, e in rows])
+    if types is None or "user" in types:
+        for user_id, templates in (await crud_async.get_face_templates(db)).items():
+            index.set_templates(gallery.identity_key("user", user_id), templates)
+    index.model_version = await crud_async.get_active_model_version(db) or config.EDGEFACE_MODEL
+    return index
+
+async def search_index(index, queries, k: int, types=None, model_version: str = None):
+    """
+    index.search_batch off the event loop. Returns (matches per query,
+    degraded); degraded means some gallery shards did not answer, so the
+    matches cover only part of the identities. `model_version` is the model
+    the queries were embedded with: 503 while the gallery holds another
+    model's embeddings (a model switch in progress).
+    """
+    if isinstance(index, gallery_shards.ShardedGallery):
+        matches, missing = await run_in_threadpool(index.search_batch_partial, queries, k, types, model_version)
+        return matches, bool(missing)
+    try:
+        return await run_in_threadpool(index.search_batch, queries, k, types, model_version), False
+    except gallery.ModelMismatch:
+        raise HTTPException(status_code=503, detail="Embedding model is being switched, try again")
+
+async def search_complete(index, queries, k: int, types=None, model_version: str = None):
+    """
+    search_index for decisions that need the whole gallery (marking
+    attendance): 503 instead of a partial answer.
+    """
+    matches, degraded = await search_index(index, queries, k, types, model_version)
+    if degraded:
+        raise HTTPException(status_code=503, detail="Identity index partially unavailable, try again")
+    return matches
+
+async def find_duplicate(db, centroid, embeddings, model_version: str):
+    """
+    Nearest enrolled identity to a new registration, checking the centroid
+    and every capture in one batch search. Returns (identity_type,
+    identity_id, similarity) above DUPLICATE_THRESHOLD, else None. Without
+    every shard, only a duplicate found is an answer; 503 otherwise.
+    """
+    types = parse_identity_types(config.DUPLICATE_CHECK_TYPES)
+    index = await get_identity_index(db, types)
+    results, degraded = await search_index(index, np.stack([centroid] + embeddings), 1, types, model_version)
+    matches = [m for query_matches in results for m in query_matches]
+    key, similarity = max(matches, key=lambda m: m[1]) if matches else (None, -1.0)
+    if similarity < config.DUPLICATE_THRESHOLD:
+        if degraded:
+            raise HTTPException(status_code=503, detail="Identity index partially unavailable, try again")
+        return None
+    identity_type, identity_id = gallery.split_key(key)
+    return identity_type, identity_id, float(similarity)
+
+def parse_identity_types(value: Optional[str]):
+    """
+    Comma separated identity types for /recognize; "all" searches every
+    type, and no value uses RECOGNITION_IDENTITY_TYPES.
+    """
+    value = value or config.RECOGNITION_IDENTITY_TYPES
+    if value == "all":
+        return None
+    types = tuple(t.strip() for t in value.split(",") if t.strip())
+    gallery.type_codes(types)
+    return types
+
+async def embed_best_frames(files, on_face=None):
+    """
+    Scores every frame, then aligns and embeds only the best ones in one
+    pass. Returns their quality-weighted query embedding and the crops.
+    `on_face(face)` is called (in the threadpool) for every frame with a face
+    and returns its 68 landmarks (or None), reused for alignment.
+    """
+    candidates = []
     
     for file in files:
-        image = await read_image(file)
+        image = await read_frame(file)
         
-        # 1. Anti-Spoofing (Simplified for recognition frames)
+        # Anti-Spoofing (Simplified for recognition frames)
         # We can skip full LBP if we trust the first frame passed liveness, 
         # but for safety let's just log.
         
-        # 2. Detect
-        bboxes = face_detector.detect_faces(image)
-        if not bboxes:
+        face = await run_in_threadpool(detect_scored_face, image)
+        if face is None:
              continue # Skip frames with no face
-        
-        bboxes.sort(key=lambda b: (b[2]-b[0]) * (b[3]-b[1]), reverse=True)
-        bbox = bboxes[0]
-        
-        # Use Align Face
-        landmarks = anti_spoof.get_landmarks(image)
-        if landmarks is not None:
-            face_img = face_detector.align_face(image, landmarks)
-        else:
-            face_img = face_detector.get_cropped_face(image, bbox)
-        
-        # 3. Embed
-        emb = edge_face.get_embedding(face_img)
-        embeddings.append(emb)
+        landmarks = await run_in_threadpool(on_face, face) if on_face is not None else None
+        candidates.append(face + (landmarks,))
     
-    if not embeddings:
+    if not candidates:
          raise HTTPException(status_code=400, detail="No faces detected in any of the frames")
-         
-    # Average embeddings for query
-    query_embedding = np.mean(embeddings, axis=0)
-    
+
+    # Only the sharpest, most frontal frames are aligned and embedded
+    selected = quality.best_k(candidates, config.RECOGNITION_BEST_FRAMES, config.RECOGNITION_MIN_QUALITY)
+    if not selected:
+         raise HTTPException(status_code=400, detail="Face too blurred, small or turned away in every frame")
+    crops = await run_in_threadpool(
+        lambda: [anti_spoof.align_detection(face_detector, image, box, points, landmarks)
+                 for _, image, points, box, landmarks in selected]
+    )
+    embeddings = await run_in_threadpool(edge_face.get_embeddings, crops)
+
+    # Quality-weighted average for the query
+    return quality.weighted_centroid(embeddings, [face[0].score for face in selected]), crops
+
+def is_confident(matches) -> bool:
+    """
+    Top match clear enough to stop looking at more frames.
+    """
+    if not matches or matches[0][1] < config.EARLY_EXIT_SIMILARITY:
+        return False
+    runner_up = matches[1][1] if len(matches) > 1 else -1.0
+    return matches[0][1] - runner_up >= config.EARLY_EXIT_MARGIN
+
+async def match_progressively(files, index, types=None, on_face=None, model_version: str = None):
+    """
+    Embeds frames one at a time and searches after each, on the weighted
+    centroid of the best frames so far. Stops at the first confident match
+    and skips the remaining frames, except that with `on_face` (liveness)
+    every frame is still detected and passed to it, just not embedded.
+    Returns (query embedding, top-1 matches, embedded crops).
+    """
+    embedded, crops, faces_seen, confident = [], [], False, False
+    query, matches = None, []
+    for file in files:
+        face = await run_in_threadpool(detect_scored_face, await read_frame(file))
+        if face is None:
+            continue
+        faces_seen = True
+        landmarks = await run_in_threadpool(on_face, face) if on_face is not None else None
+        score, image, points, box = face
+        if confident or score.score < config.RECOGNITION_MIN_QUALITY:
+            continue
+        crop = await run_in_threadpool(anti_spoof.align_detection, face_detector, image, box, points, landmarks)
+        emb = await run_in_threadpool(edge_face.get_embedding, crop)
+        embedded.append((score, emb))
+        crops.append(crop)
+
+        best = quality.best_k(embedded, config.RECOGNITION_BEST_FRAMES)
+        query = quality.weighted_centroid(np.stack([e for _, e in best]), [q.score for q, _ in best])
+        matches = (await search_complete(index, query[None], 2, types, model_version))[0]
+        if is_confident(matches):
+            confident = True
+            if on_face is None:
+                break
+
+    if not faces_seen:
+        raise HTTPException(status_code=400, detail="No faces detected in any of the frames")
+    if not embedded:
+        raise HTTPException(status_code=400, detail="Face too blurred, small or turned away in every frame")
+    return query, matches[:1], crops
+
+@app.post("/recognize")
+async def recognize(
+    files: List[UploadFile] = File(...),
+    session_id: Optional[int] = Form(None),
+    identity_type: Optional[str] = Form(None),
+    liveness: bool = Form(False),
+    db = Depends(db.get_async_db)
+):
+    return await recognize_burst(db, files, session_id, identity_type, liveness)
+
+@app.post("/recognize/frames")
+async def recognize_frames(
+    request: Request,
+    session_id: Optional[int] = None,
+    identity_type: Optional[str] = None,
+    liveness: bool = False,
+    db = Depends(db.get_async_db)
+):
+    """
+    /recognize with the burst as one FRM1 binary body (see frames.py)
+    instead of multipart parts; options are query parameters.
+    """
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > config.FRAME_MAX_PAYLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Frame payload larger than {config.FRAME_MAX_PAYLOAD_BYTES} bytes")
+    try:
+        payload, size = await frames.read_frames(
+            request.stream(), config.FRAME_MAX_COUNT, config.FRAME_MAX_BYTES, config.FRAME_MAX_PAYLOAD_BYTES
+        )
+    except frames.FrameError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    return await recognize_burst(db, [(data, size) for data in payload], session_id, identity_type, liveness)
+
+async def recognize_burst(db, files, session_id: Optional[int], identity_type: Optional[str], liveness: bool):
+    """
+    Shared body of /recognize and /recognize/frames; `files` are anything
+    read_frame accepts.
+    """
+    # Taken before embedding: if the model is switched mid-request the
+    # search is refused rather than mixing models
+    model_version = edge_face.model_name
+    if session_id is not None:
+        # Only search the students enrolled in this session's offering
+        index, types = await get_roster_gallery(db, session_id), None
+    else:
+        try:
+            types = parse_identity_types(identity_type)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        index = await get_identity_index(db, types)
+
+    # Liveness reuses the burst's own detections: dlib only places the
+    # 68 landmarks inside MTCNN's box
+    landmark_series, on_face = [], None
+    if liveness or config.RECOGNITION_LIVENESS:
+        def on_face(face):
+            # Computed once per detection; alignment reuses them
+            landmarks = anti_spoof.get_landmarks_in_box(face[1], face[3])
+            landmark_series.append(landmarks)
+            return landmarks
+
+    if config.RECOGNITION_EARLY_EXIT:
+        query_embedding, matches, crops = await match_progressively(files, index, types, on_face, model_version)
+    else:
+        query_embedding, crops = await embed_best_frames(files, on_face)
+        matches = (await search_complete(index, query_embedding[None], 1, types, model_version))[0]
+
+    live = anti_spoof.check_liveness(landmark_series) if on_face is not None else None
+    # A caller asking for liveness relies on it: nothing is marked unless live
+    if live is not None and (liveness or config.LIVENESS_ENFORCE) and not live["live"]:
+        return {"status": "failure", "message": "Liveness check failed", "liveness": live}
+
+    texture = None
+    if config.LBP_RECOGNIZE:
+        # Only the crops that were embedded; a few ms each
+        checks = [anti_spoof.check_texture_lbp(crop) for crop in crops]
+        score = float(np.mean([s for _, s, _ in checks]))
+        texture = {"live": all(is_real for is_real, _, _ in checks), "score": score}
+        if config.LBP_ENFORCE and not texture["live"]:
+            return {"status": "failure", "message": "Spoof detected (Texture)", "texture": texture}
+
+    response = await match_response(db, matches, query_embedding, session_id, model_version)
+    if live is not None:
+        response["liveness"] = live
+    if texture is not None:
+        response["texture"] = texture
+    return response
+
+async def match_response(db, matches, query_embedding, session_id: Optional[int], model_version: str):
+    """
+    Acts on the top match of /recognize: marks attendance (session roster
+    or legacy user), learns a template, and builds the response.
+    """
     # 4. Compare
-    users = crud.get_users(db)
-    
-    threshold = 0.5 
-    max_sim = -1.0
-    best_match = None
-    
-    def normalize(v):
-        norm = np.linalg.norm(v)
-        if norm == 0: return v
-        return v / norm
-        
-    query_norm = normalize(query_embedding)
-    
-    for user in users:
-        # User.embedding is now a Vector (numpy array or list of floats) handled by pgvector
-        # pgvector returns it as a numpy array or list? It returns numpy array usually if configured, creates string otherwise.
-        # pgvector-python + sqlalchemy usually returns numpy array or list.
-        # Let's assume it's iterable.
-        
-        stored_embedding = np.array(user.embedding)
-        if stored_embedding is None: continue
-        
-        # Calculate similarity (Cosine)
-        # Note: pgvector supports cosine distance in SQL, but here we are doing it in Python for now
-        # per the existing logic structure. 
-        # Ideally, we should use `db.query(User).order_by(User.embedding.cosine_distance(query_embedding)).limit(1)`
-        # But to keep changes minimal and safe:
-        
-        db_norm = normalize(stored_embedding)
-        sim = np.dot(query_norm, db_norm)
-        
-        if sim > max_sim:
-            max_sim = sim
-            best_match = user
+    threshold = config.RECOGNITION_THRESHOLD
+
+    if session_id is not None:
+        best_id, max_sim = matches[0] if matches else (None, -1.0)
+
+        if best_id is not None and max_sim > threshold:
+            student = await crud_async.get_student(db, best_id)
+            record, already_marked = await crud_async.mark_attendance(db, session_id, best_id, similarity=float(max_sim))
+            return {
+                "status": "success",
+                "student": student.name,
+                "enrollment_number": student.enrollment_number,
+                "user": student.name,
+                "similarity": float(max_sim),
+                "session_id": session_id,
+                "record_id": record.record_id,
+                "already_marked": already_marked
+            }
+        return {
+            "status": "failure",
+            "message": "Student not recognized for this session",
+            "similarity": float(max_sim),
+            "session_id": session_id
+        }
+
+    best_key, max_sim = matches[0] if matches else (None, -1.0)
+    best_type, best_id = gallery.split_key(best_key) if best_key is not None else (None, None)
+
+    if best_type is not None and best_type != "user" and max_sim > threshold:
+        # Students and faculty recognized outside a session: identify only
+        person = await crud_async.get_identity(db, best_type, best_id)
+        if person is not None:
+            return {
+                "status": "success",
+                "identity_type": best_type,
+                "identity_id": best_id,
+                "student": person.name,
+                "enrollment_number": person.number,
+                "user": person.name,
+                "similarity": float(max_sim)
+            }
+
+    best_match = await crud_async.get_user(db, best_id) if best_type == "user" else None
             
     if max_sim > threshold and best_match:
-        crud.create_attendance(db, best_match.id)
+        await crud_async.create_attendance(db, best_match.id)
+        # Confident but not redundant with the user's templates: learn from it
+        if config.TEMPLATE_LEARNING and config.TEMPLATE_ADD_THRESHOLD <= max_sim < config.TEMPLATE_DIVERSITY_MAX:
+            await crud_async.add_face_template(db, best_match.id, query_embedding, config.MAX_TEMPLATES_PER_USER,
+                                               model_version=model_version)
         return {
             "status": "success",
+            "identity_type": "user",
+            "identity_id": best_match.id,
             "student": best_match.name,
             "enrollment_number": best_match.enrollment_number or f"ID:{best_match.id}",
             "user": best_match.name,
@@ -196,12 +659,226 @@ async def recognize(files: List[UploadFile] = File(...), db: Session = Depends(g
             "message": "User not recognized",
             "similarity": float(max_sim)
         }
+def crop_all_faces(image: Image.Image):
+    """
+    Every sufficiently large face in a group photo, aligned like enrolled
+    faces. Returns [(bbox, detection prob, 112x112 crop)].
+    """
+    faces = face_detector.detect_all(
+        image, min_prob=config.CLASSROOM_MIN_DETECTION_PROB, min_size=config.CLASSROOM_MIN_FACE
+    )
+    return [(bbox, prob, anti_spoof.align_detection(face_detector, image, bbox, points)) for bbox, prob, points in faces]
+
+@app.post("/classroom")
+async def classroom(
+    files: List[UploadFile] = File(...),
+    session_id: int = Form(...),
+    db = Depends(db.get_async_db)
+):
+    """
+    Marks a whole class from one or a few wide-angle photos: every face is
+    embedded in one forward pass, matched against the session roster in one
+    batch search, and each student is assigned to at most one face.
+    """
+    if len(files) > config.CLASSROOM_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {config.CLASSROOM_MAX_IMAGES} images per request")
+
+    faces = []
+    for image_index, file in enumerate(files):
+        image = await read_image(file, max_side=config.CLASSROOM_MAX_SIDE)
+        for bbox, prob, crop in await run_in_threadpool(crop_all_faces, image):
+            faces.append((image_index, bbox, prob, crop))
+    if not faces:
+        raise HTTPException(status_code=400, detail="No faces detected in any of the images")
+
+    roster = await get_roster_gallery(db, session_id)
+    model_version = edge_face.model_name
+    vectors = await run_in_threadpool(edge_face.get_embeddings, [crop for _, _, _, crop in faces])
+    results = await search_complete(roster, vectors, config.CLASSROOM_CANDIDATES, None, model_version)
+    assigned = gallery.assign_one_to_one(results, config.RECOGNITION_THRESHOLD)
+
+    student_ids = [student_id for student_id, _ in assigned.values()]
+    created, already = await crud_async.create_attendance_records(
+        db, session_id, [(student_id, float(sim)) for student_id, sim in assigned.values()]
+    )
+    names = await crud_async.get_identities(db, "student", student_ids) if student_ids else {}
+
+    recognized, unrecognized = [], []
+    for i, (image_index, bbox, prob, _) in enumerate(faces):
+        face = {"image": image_index, "box": list(bbox), "detection_prob": prob}
+        if i not in assigned:
+            best = results[i][0][1] if results[i] else None
+            unrecognized.append({**face, "best_similarity": float(best) if best is not None else None})
+            continue
+        student_id, sim = assigned[i]
+        student = names.get(student_id)
+        recognized.append({
+            **face,
+            "student_id": student_id,
+            "student": student.name if student else None,
+            "enrollment_number": student.number if student else None,
+            "similarity": float(sim),
+            "record_id": already.get(student_id, created.get(student_id)),
+            "already_marked": student_id in already,
+        })
+    return {
+        "status": "success",
+        "session_id": session_id,
+        "faces_detected": len(faces),
+        "marked": len(created),
+        "recognized": recognized,
+        "unrecognized": unrecognized,
+    }
+
+@app.post("/search")
+async def search(
+    files: List[UploadFile] = File(None),
+    embeddings: Optional[str] = Form(None),
+    k: int = Form(5),
+    identity_type: Optional[str] = Form("all"),
+    db = Depends(db.get_async_db)
+):
+    """
+    Batch lookup: every uploaded face image and every embedding in the JSON
+    list `embeddings` is one query, and each gets its top-k identities.
+    """
+    if not 1 <= k <= config.SEARCH_MAX_K:
+        raise HTTPException(status_code=400, detail=f"k must be between 1 and {config.SEARCH_MAX_K}")
+    try:
+        types = parse_identity_types(identity_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    sources, vectors = [], []
+    if embeddings:
+        try:
+            raw = np.asarray(json.loads(embeddings), dtype=np.float32)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="embeddings must be a JSON list of 512-d vectors")
+        if raw.ndim == 1:
+            raw = raw[None, :]
+        if raw.ndim != 2 or raw.shape[1] != gallery.EMBEDDING_DIM:
+            raise HTTPException(status_code=400, detail="embeddings must be a JSON list of 512-d vectors")
+        sources += [f"embedding:{i}" for i in range(len(raw))]
+        vectors += list(raw)
+
+    # Counted before any image is read or decoded
+    files = files or []
+    if not sources and not files:
+        raise HTTPException(status_code=400, detail="Provide face images or embeddings")
+    if len(sources) + len(files) > config.SEARCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {config.SEARCH_MAX_QUERIES} queries per request")
+
+    # Detection per image, then every face embedded in one forward pass
+    crops = []
+    for file in files:
+        crops.append(await run_in_threadpool(crop_largest_face, await read_image(file)))
+        sources.append(file.filename)
+    model_version = edge_face.model_name
+    embedded = iter(await run_in_threadpool(edge_face.get_embeddings, [crop for crop in crops if crop is not None]))
+    vectors += [next(embedded) if crop is not None else None for crop in crops]
+
+    found = [i for i, v in enumerate(vectors) if v is not None]
+    index = await get_identity_index(db, types)
+    queries = np.stack([vectors[i] for i in found]) if found else None
+    matches, degraded = await search_index(index, queries, k, types, model_version) if found else ([], False)
+    per_query = dict(zip(found, matches))
+
+    # One name lookup per identity type for the whole batch
+    wanted = {}
+    for key, _ in (m for query_matches in matches for m in query_matches):
+        t, identity_id = gallery.split_key(key)
+        wanted.setdefault(t, set()).add(identity_id)
+    names = {}
+    for t, ids in wanted.items():
+        for identity_id, row in (await crud_async.get_identities(db, t, ids)).items():
+            names[gallery.identity_key(t, identity_id)] = row
+
+    results = []
+    for i, source in enumerate(sources):
+        if i not in per_query:
+            results.append({"query": i, "source": source, "error": "No face detected", "matches": []})
+            continue
+        query_matches = []
+        for key, sim in per_query[i]:
+            t, identity_id = gallery.split_key(key)
+            person = names.get(key)
+            query_matches.append({
+                "identity_type": t,
+                "identity_id": identity_id,
+                "name": person.name if person else None,
+                "number": person.number if person else None,
+                "similarity": sim,
+            })
+        results.append({"query": i, "source": source, "matches": query_matches})
+    # Partial results are still useful for a lookup, but must say so
+    return {"k": k, "degraded": degraded, "results": results}
+
+@app.post("/enroll/bulk")
+async def start_bulk_enrollment(
+    archive: UploadFile = File(None),
+    names: UploadFile = File(None),
+    path: Optional[str] = Form(None),
+    target: str = Form("student"),
+    db: Session = Depends(get_db)
+):
+    """
+    Starts a bulk enrollment job from an uploaded .zip/.tar archive or a
+    directory under BULK_ENROLL_ROOT (see bulk_enroll.py for the layout).
+    """
+    if target not in bulk_enroll.TARGETS:
+        raise HTTPException(status_code=400, detail=f"target must be one of {', '.join(bulk_enroll.TARGETS)}")
+    if (archive is None) == (path is None):
+        raise HTTPException(status_code=400, detail="Provide either an archive upload or a path")
+
+    if path is not None:
+        root = os.path.realpath(config.BULK_ENROLL_ROOT) if config.BULK_ENROLL_ROOT else None
+        source = os.path.realpath(path)
+        if root is None or os.path.commonpath([root, source]) != root or not os.path.isdir(source):
+            raise HTTPException(status_code=400, detail="path must be a directory under BULK_ENROLL_ROOT")
+        source_name, cleanup = source, False
+    else:
+        # Spool the upload to disk; archives can be far larger than memory
+        with tempfile.NamedTemporaryFile(prefix="bulk-enroll-", delete=False) as tmp:
+            await run_in_threadpool(shutil.copyfileobj, archive.file, tmp, 1024 * 1024)
+        source, source_name, cleanup = tmp.name, archive.filename, True
+
+    try:
+        names_data = await ingest.read_upload(names) if names is not None else None
+    except ingest.IngestError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    job = crud.create_enrollment_job(db, target, source_name)
+    bulk_enroll.BulkEnrollment(job.job_id, source, names_data, target, crop_largest_face, edge_face, cleanup).start()
+    return {"job_id": job.job_id, "status": job.status}
+
+@app.get("/enroll/bulk/{job_id}")
+def get_bulk_enrollment(job_id: int, errors_limit: int = 1000, db: Session = Depends(get_db)):
+    job = crud.get_enrollment_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Enrollment job not found")
+    return {
+        "job_id": job.job_id,
+        "target": job.target,
+        "source": job.source,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "succeeded": job.succeeded,
+        "failed": job.failed,
+        "error": job.error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "errors": [
+            {"enrollment_number": e.enrollment_number, "error": e.error}
+            for e in crud.get_enrollment_job_errors(db, job_id, errors_limit)
+        ],
+    }
+
 @app.post("/detect-blink")
 async def detect_blink(file: UploadFile = File(...)):
+    image = await read_image(file)
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
-        
         # Check blink
         result = anti_spoof.check_eye_blink(image)
         
@@ -210,9 +887,9 @@ async def detect_blink(file: UploadFile = File(...)):
         print(f"Blink error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 @app.get("/users", response_model=List[schemas.User])
-def get_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    return users
+def get_users(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(db.get_read_db)):
+    rows = crud.get_user_rows(db, skip=skip, limit=limit)
+    return rows_response(["id", "name", "enrollment_number", "created_at"], rows, format)
 
 @app.delete("/users/{user_id}", response_model=schemas.User)
 def delete_user(user_id: int, db: Session = Depends(get_db)):
@@ -222,13 +899,14 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
     return db_user
 
 @app.get("/attendance")
-def get_attendance(
+async def get_attendance(
     user_id: int = None, 
     start_date: str = None, 
     end_date: str = None,
     skip: int = 0,
     limit: int = 1000,
-    db: Session = Depends(get_db)
+    format: str = "json",
+    db = Depends(db.get_async_read_db)
 ):
     from datetime import datetime
     
@@ -236,37 +914,16 @@ def get_attendance(
     start_dt = datetime.fromisoformat(start_date) if start_date else None
     end_dt = datetime.fromisoformat(end_date) if end_date else None
     
-    attendance_records = crud.get_attendance(db, user_id=user_id, start_date=start_dt, end_date=end_dt, skip=skip, limit=limit)
-    
-    # Join with user data (or use snapshot)
-    result = []
-    for record in attendance_records:
-        # Fallback to join if snapshot is missing (for old records)
-        if not record.name:
-             user = db.query(models.User).filter(models.User.id == record.user_id).first()
-             name = user.name if user else "Unknown"
-             enrollment_number = user.enrollment_number if user else "N/A"
-        else:
-             name = record.name
-             enrollment_number = record.enrollment_number
-             
-        result.append({
-            "id": record.id,
-            "user_id": record.user_id,
-            "user_name": name,
-            "student_name": name, # Compatibility
-            "enrollment_number": enrollment_number,
-            "timestamp": record.timestamp.isoformat()
-        })
-    
-    return result
+    # Rows come back already joined and shaped; serialize them in one pass
+    keys, rows = await crud_async.get_attendance(db, user_id=user_id, start_date=start_dt, end_date=end_dt, skip=skip, limit=limit)
+    return rows_response(keys, rows, format)
 
 @app.get("/attendance/export")
 def export_attendance(
     user_id: int = None,
     start_date: str = None,
     end_date: str = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(db.get_read_db)
 ):
     from datetime import datetime
     from fastapi.responses import StreamingResponse
@@ -277,19 +934,19 @@ def export_attendance(
     start_dt = datetime.fromisoformat(start_date) if start_date else None
     end_dt = datetime.fromisoformat(end_date) if end_date else None
     
-    attendance_records = crud.get_attendance(db, user_id=user_id, start_date=start_dt, end_date=end_dt)
+    # Users are joined in the same query
+    rows = crud.get_attendance_export_rows(db, user_id=user_id, start_date=start_dt, end_date=end_dt)
     
     # Create Excel using Pandas
     import pandas as pd
     
     data = []
-    for record in attendance_records:
-        user = db.query(models.User).filter(models.User.id == record.user_id).first()
+    for record_id, record_user_id, user_name, timestamp in rows:
         data.append({
-            "Attendance ID": record.id,
-            "User ID": record.user_id,
-            "User Name": user.name if user else "Unknown",
-            "Time": record.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+            "Attendance ID": record_id,
+            "User ID": record_user_id,
+            "User Name": user_name,
+            "Time": timestamp.strftime('%Y-%m-%d %H:%M:%S')
         })
     
     df = pd.DataFrame(data)
@@ -333,19 +990,25 @@ def login_admin(admin: schemas.AdminLogin, db: Session = Depends(get_db)):
     return {"status": "success", "username": db_admin.username, "id": db_admin.id}
 
 @app.get("/stats")
-def get_stats(db: Session = Depends(get_db)):
+def get_stats(db: Session = Depends(db.get_read_db)):
     from datetime import datetime, timedelta
     from sqlalchemy import func
     
     # 1. Daily Attendance (Last 7 days)
+    # One range-filtered query so only the current month partitions are scanned,
+    # instead of a date() comparison per day that can't use the timestamp index.
     today = datetime.utcnow().date()
+    first_day = today - timedelta(days=6)
+    day_col = func.date(models.Attendance.timestamp).label('day')
+    day_counts = dict(db.query(day_col, func.count()).filter(
+        models.Attendance.timestamp >= datetime.combine(first_day, datetime.min.time()),
+        models.Attendance.timestamp < datetime.combine(today + timedelta(days=1), datetime.min.time())
+    ).group_by(day_col).all())
+
     daily_stats = []
     for i in range(6, -1, -1):
         day = today - timedelta(days=i)
-        count = db.query(models.Attendance).filter(
-            func.date(models.Attendance.timestamp) == day
-        ).count()
-        daily_stats.append({"date": day.strftime('%b %d'), "count": count})
+        daily_stats.append({"date": day.strftime('%b %d'), "count": day_counts.get(day, 0)})
     
     # 2. Peak Hours
     hour_counts = db.query(
@@ -365,18 +1028,10 @@ def get_stats(db: Session = Depends(get_db)):
 # --- Backend Compatibility Layer for Frontend ---
 
 @app.get("/students")
-def get_students(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, skip=skip, limit=limit)
-    # Map User objects to the structure expected by frontend (Student)
-    students = []
-    for user in users:
-        students.append({
-            "student_id": user.id,
-            "name": user.name,
-            "enrollment_number": user.enrollment_number,
-            "enrollment_type": "FT"  # Default value
-        })
-    return students
+def get_students(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(db.get_read_db)):
+    # User rows already shaped like the Student structure the frontend expects
+    rows = crud.get_user_rows_as_students(db, skip=skip, limit=limit)
+    return rows_response(["student_id", "name", "enrollment_number", "enrollment_type"], rows, format)
 
 @app.delete("/students/{student_id}")
 def delete_student(student_id: int, db: Session = Depends(get_db)):
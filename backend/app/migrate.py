@@ -0,0 +1,224 @@
+"""
+Versioned schema migrations.
+
+Migrations live in app/migrations as NNNN_description.py and define:
+    transactional = True | False   # False runs in autocommit, e.g. for CONCURRENTLY
+    def upgrade(conn): ...
+
+After the migrations, upgrade makes sure the partitioned attendance tables
+have partitions for the coming PARTITION_MONTHS_AHEAD months (see partitions.py).
+
+Usage (from the backend directory, or `python -m backend.app.migrate` from the repo root):
+    python -m app.migrate            # apply pending migrations, create partitions ahead
+    python -m app.migrate status     # list applied / pending
+"""
+import argparse
+import datetime
+import importlib.util
+import os
+import re
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from .db import engine
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), "migrations")
+MIGRATION_RE = re.compile(r"^(\d{4})_(\w+)\.py$")
+
+# pg_advisory_lock key so several containers starting together migrate once.
+ADVISORY_LOCK_KEY = 4_815_162
+
+# Fail fast instead of queueing behind (and blocking) live traffic, then retry.
+LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+LOCK_RETRIES = int(os.getenv("MIGRATION_LOCK_RETRIES", "10"))
+LOCK_NOT_AVAILABLE = "55P03"
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+
+class Migration:
+    def __init__(self, version: int, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+        spec = importlib.util.spec_from_file_location(f"{__package__}.migrations.m{version:04d}", path)
+        self.module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(self.module)
+        self.transactional = getattr(self.module, "transactional", True)
+
+    def __repr__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+def load_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = MIGRATION_RE.match(filename)
+        if m:
+            migrations.append(Migration(int(m.group(1)), m.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    return migrations
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR(255) NOT NULL, "
+        "applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL)"
+    ))
+
+
+def applied_versions(conn):
+    return {r[0] for r in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def _record(conn, migration: Migration):
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+        {"v": migration.version, "n": migration.name, "t": datetime.datetime.utcnow()}
+    )
+
+
+def _apply(migration: Migration):
+    if migration.transactional:
+        with engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+            migration.module.upgrade(conn)
+            _record(conn, migration)
+    else:
+        # Non-transactional migrations must be idempotent: they can stop half way.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+            migration.module.upgrade(conn)
+            _record(conn, migration)
+
+
+def _with_retry(label, step):
+    for attempt in range(1, LOCK_RETRIES + 1):
+        try:
+            step()
+            return
+        except OperationalError as e:
+            if getattr(e.orig, "pgcode", None) != LOCK_NOT_AVAILABLE or attempt == LOCK_RETRIES:
+                raise
+            wait = min(2 ** attempt, 30)
+            print(f"{label}: lock not available, retrying in {wait}s ({attempt}/{LOCK_RETRIES})")
+            time.sleep(wait)
+
+
+def _apply_with_retry(migration: Migration):
+    _with_retry(migration, lambda: _apply(migration))
+
+
+def _create_partitions_ahead(table: str):
+    from .partitions import create_partitions_ahead, is_partitioned
+
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        if is_partitioned(conn, table):
+            create_partitions_ahead(conn, table, PARTITION_MONTHS_AHEAD)
+
+
+def ensure_partitions():
+    from .partitions import PARTITIONED_TABLES
+
+    for table in PARTITIONED_TABLES:
+        _with_retry(f"partitions of {table}", lambda: _create_partitions_ahead(table))
+
+
+def upgrade():
+    migrations = load_migrations()
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        lock_conn.execute(text("SELECT pg_advisory_lock(:k)"), {"k": ADVISORY_LOCK_KEY})
+        try:
+            _ensure_version_table(lock_conn)
+            done = applied_versions(lock_conn)
+            pending = [m for m in migrations if m.version not in done]
+            if not pending:
+                print("Database is up to date.")
+
+            for migration in pending:
+                print(f"Applying {migration}...")
+                started = time.time()
+                _apply_with_retry(migration)
+                print(f"Applied {migration} in {time.time() - started:.1f}s.")
+
+            ensure_partitions()
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": ADVISORY_LOCK_KEY})
+
+
+def status():
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        done = applied_versions(conn)
+    for migration in load_migrations():
+        print(f"[{'x' if migration.version in done else ' '}] {migration}")
+
+
+# ------------------------------------------------------------
+# Helpers for migration modules
+# ------------------------------------------------------------
+
+def _partitions(conn, table: str):
+    return [r[0] for r in conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:t) ORDER BY c.relname"
+    ), {"t": table})]
+
+
+def _drop_invalid_index(conn, name: str):
+    # A failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind.
+    valid = conn.execute(text(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:n)"
+    ), {"n": name}).scalar()
+    if valid is False:
+        conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+
+
+def create_index_concurrently(conn, name: str, table: str, columns):
+    """
+    CREATE INDEX CONCURRENTLY that also works on partitioned tables, where
+    Postgres only allows it per partition: the parent index is created ON ONLY
+    the parent and each partition's index is built concurrently and attached.
+    Needs an autocommit connection (transactional = False).
+    """
+    cols = ", ".join(f'"{c}"' for c in columns)
+    partitions = _partitions(conn, table)
+
+    if not partitions:
+        _drop_invalid_index(conn, name)
+        conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "{table}" ({cols})'))
+        return
+
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "{name}" ON ONLY "{table}" ({cols})'))
+    for partition in partitions:
+        part_index = f"{partition}_{'_'.join(columns)}_idx"[:63]
+        _drop_invalid_index(conn, part_index)
+        conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{part_index}" ON "{partition}" ({cols})'))
+        attached = conn.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(:c) AND inhparent = to_regclass(:p))"
+        ), {"c": part_index, "p": name}).scalar()
+        if not attached:
+            conn.execute(text(f'ALTER INDEX "{name}" ATTACH PARTITION "{part_index}"'))
+
+
+def add_column_if_missing(conn, table: str, column: str, ddl_type: str):
+    # Adding a nullable column without a default is a catalog-only change.
+    conn.execute(text(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{column}" {ddl_type}'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    args = parser.parse_args()
+
+    if args.command == "status":
+        status()
+    else:
+        upgrade()
+
+
+if __name__ == "__main__":
+    main()
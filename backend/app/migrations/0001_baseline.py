@@ -0,0 +1,212 @@
+"""
+Baseline schema: extensions plus the tables as they were before versioned
+migrations, i.e. what create_all produced on startup. Frozen as DDL so later
+model changes only reach the database through their own migrations.
+On an existing database only missing types, tables and indexes are created.
+"""
+from sqlalchemy import text
+
+transactional = True
+
+ENUMS = {
+    "enrollment_type_enum": ("FT", "PT"),
+    "faculty_category": ("teaching", "non_teaching"),
+    "teaching_rank": (
+        "professor", "associate_professor", "assistant_professor", "lecturer", "senior_lecturer",
+    ),
+    "non_teaching_role": ("administrative", "technical", "support", "library", "lab_staff"),
+}
+
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS departments (
+        department_id SERIAL PRIMARY KEY,
+        code VARCHAR(32) NOT NULL UNIQUE,
+        name VARCHAR(255) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS programs (
+        program_id SERIAL PRIMARY KEY,
+        code VARCHAR(64) NOT NULL UNIQUE,
+        name VARCHAR(255) NOT NULL,
+        total_semesters SMALLINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS subjects (
+        subject_id SERIAL PRIMARY KEY,
+        program_id INTEGER NOT NULL REFERENCES programs (program_id),
+        code VARCHAR(64) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        semester SMALLINT NOT NULL,
+        credits SMALLINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS faculty (
+        faculty_id SERIAL PRIMARY KEY,
+        employee_number VARCHAR(64),
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) UNIQUE,
+        phone VARCHAR(32),
+        category faculty_category NOT NULL,
+        teaching_rank teaching_rank,
+        non_teaching_role non_teaching_role,
+        department_id INTEGER,
+        embedding vector(512),
+        created_at TIMESTAMP WITHOUT TIME ZONE,
+        CONSTRAINT check_faculty_role_validity CHECK (
+            (category = 'teaching' AND teaching_rank IS NOT NULL AND non_teaching_role IS NULL) OR
+            (category = 'non_teaching' AND non_teaching_role IS NOT NULL AND teaching_rank IS NULL)
+        )
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS locations (
+        location_id SERIAL PRIMARY KEY,
+        code VARCHAR(64) UNIQUE,
+        name VARCHAR(255),
+        building VARCHAR(128),
+        floor VARCHAR(32),
+        geom geometry(POINT, 4326),
+        created_at TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS students (
+        student_id SERIAL PRIMARY KEY,
+        enrollment_number VARCHAR(64) NOT NULL,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) UNIQUE,
+        phone VARCHAR(32),
+        enrollment_type enrollment_type_enum NOT NULL,
+        program_id INTEGER REFERENCES programs (program_id),
+        admission_year SMALLINT,
+        embedding vector(512),
+        created_at TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS course_offerings (
+        offering_id SERIAL PRIMARY KEY,
+        subject_id INTEGER NOT NULL REFERENCES subjects (subject_id),
+        academic_year VARCHAR(16) NOT NULL,
+        term VARCHAR(16) NOT NULL,
+        faculty_id INTEGER REFERENCES faculty (faculty_id),
+        location_id INTEGER REFERENCES locations (location_id),
+        max_capacity INTEGER,
+        created_at TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS enrollments (
+        enrollment_id SERIAL PRIMARY KEY,
+        student_id INTEGER NOT NULL REFERENCES students (student_id),
+        offering_id INTEGER NOT NULL REFERENCES course_offerings (offering_id),
+        enrolled_on TIMESTAMP WITHOUT TIME ZONE,
+        status VARCHAR(16)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attendance_sessions (
+        session_id SERIAL PRIMARY KEY,
+        offering_id INTEGER NOT NULL REFERENCES course_offerings (offering_id),
+        scheduled_start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        scheduled_end TIMESTAMP WITHOUT TIME ZONE,
+        verify_face BOOLEAN,
+        location_geom geometry(POINT, 4326),
+        location_accuracy_meters FLOAT,
+        created_by_faculty INTEGER REFERENCES faculty (faculty_id),
+        created_at TIMESTAMP WITHOUT TIME ZONE,
+        notes TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attendance_records (
+        record_id SERIAL PRIMARY KEY,
+        session_id INTEGER NOT NULL REFERENCES attendance_sessions (session_id),
+        student_id INTEGER REFERENCES students (student_id),
+        punch_in TIMESTAMP WITHOUT TIME ZONE,
+        punch_out TIMESTAMP WITHOUT TIME ZONE,
+        present BOOLEAN,
+        face_verified BOOLEAN,
+        face_similarity FLOAT,
+        device_info VARCHAR(255),
+        created_at TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255),
+        enrollment_number VARCHAR(64),
+        embedding vector(512),
+        created_at TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS admins (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(255),
+        hashed_password VARCHAR(255)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attendance (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users (id),
+        name VARCHAR(255),
+        enrollment_number VARCHAR(64),
+        timestamp TIMESTAMP WITHOUT TIME ZONE
+    )
+    """,
+]
+
+# (name, table, columns, unique); the ix_* names create_all gave index=True
+# columns, plus GeoAlchemy's spatial indexes.
+INDEXES = [
+    ("ix_departments_department_id", "departments", "department_id", False),
+    ("ix_programs_program_id", "programs", "program_id", False),
+    ("ix_subjects_subject_id", "subjects", "subject_id", False),
+    ("ix_faculty_faculty_id", "faculty", "faculty_id", False),
+    ("ix_faculty_employee_number", "faculty", "employee_number", True),
+    ("ix_locations_location_id", "locations", "location_id", False),
+    ("ix_students_student_id", "students", "student_id", False),
+    ("ix_students_enrollment_number", "students", "enrollment_number", True),
+    ("ix_students_name", "students", "name", False),
+    ("ix_course_offerings_offering_id", "course_offerings", "offering_id", False),
+    ("ix_enrollments_enrollment_id", "enrollments", "enrollment_id", False),
+    ("ix_attendance_sessions_session_id", "attendance_sessions", "session_id", False),
+    ("ix_attendance_records_record_id", "attendance_records", "record_id", False),
+    ("ix_users_id", "users", "id", False),
+    ("ix_users_name", "users", "name", False),
+    ("ix_users_enrollment_number", "users", "enrollment_number", True),
+    ("ix_admins_id", "admins", "id", False),
+    ("ix_admins_username", "admins", "username", True),
+    ("ix_attendance_id", "attendance", "id", False),
+]
+SPATIAL_INDEXES = [
+    ("idx_locations_geom", "locations", "geom"),
+    ("idx_attendance_sessions_location_geom", "attendance_sessions", "location_geom"),
+]
+
+
+def upgrade(conn):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+
+    for name, values in ENUMS.items():
+        exists = conn.execute(text("SELECT 1 FROM pg_type WHERE typname = :n"), {"n": name}).scalar()
+        if not exists:
+            labels = ", ".join(f"'{v}'" for v in values)
+            conn.execute(text(f"CREATE TYPE {name} AS ENUM ({labels})"))
+
+    for ddl in TABLES:
+        conn.execute(text(ddl))
+
+    for name, table, column, unique in INDEXES:
+        kind = "UNIQUE INDEX" if unique else "INDEX"
+        conn.execute(text(f'CREATE {kind} IF NOT EXISTS {name} ON {table} ("{column}")'))
+    for name, table, column in SPATIAL_INDEXES:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gist ("{column}")'))
@@ -0,0 +1,13 @@
+"""
+Columns previously added by hand with update_db_schema.py and
+update_attendance_schema.py.
+"""
+from ..migrate import add_column_if_missing
+
+transactional = True
+
+
+def upgrade(conn):
+    add_column_if_missing(conn, "users", "enrollment_number", "VARCHAR(64)")
+    add_column_if_missing(conn, "attendance", "name", "VARCHAR(255)")
+    add_column_if_missing(conn, "attendance", "enrollment_number", "VARCHAR(64)")
@@ -0,0 +1,16 @@
+"""
+Time-range indexes for the attendance tables, built without blocking writes.
+Works both before and after `python -m app.partitions migrate`.
+"""
+from ..migrate import create_index_concurrently
+
+transactional = False
+
+
+def upgrade(conn):
+    create_index_concurrently(conn, "ix_attendance_timestamp", "attendance", ["timestamp"])
+    create_index_concurrently(conn, "ix_attendance_user_id_timestamp", "attendance", ["user_id", "timestamp"])
+    create_index_concurrently(conn, "ix_attendance_records_punch_in", "attendance_records", ["punch_in"])
+    create_index_concurrently(
+        conn, "ix_attendance_records_student_id_punch_in", "attendance_records", ["student_id", "punch_in"]
+    )
@@ -0,0 +1,67 @@
+"""
+NOTIFY gallery_changes whenever a face embedding is inserted, changed or
+deleted (users, students, faculty) and when enrollments change, so every
+worker can patch its in-memory galleries without polling.
+Payload: {"table": ..., "op": "INSERT" | "UPDATE" | "DELETE", "id": ...}
+"""
+from sqlalchemy import text
+
+transactional = True
+
+CHANNEL = "gallery_changes"
+
+# table -> column whose value is sent as "id"
+EMBEDDING_TABLES = {
+    "users": "id",
+    "students": "student_id",
+    "faculty": "faculty_id",
+}
+
+
+def upgrade(conn):
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION notify_gallery_change() RETURNS trigger AS $$
+        DECLARE
+            row_data jsonb;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+            PERFORM pg_notify('{CHANNEL}', json_build_object(
+                'table', TG_TABLE_NAME,
+                'op', TG_OP,
+                'id', (row_data ->> TG_ARGV[0])::bigint
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
+
+    for table, id_column in EMBEDDING_TABLES.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS "{table}_gallery_insert" ON "{table}"'))
+        conn.execute(text(f'DROP TRIGGER IF EXISTS "{table}_gallery_update" ON "{table}"'))
+        conn.execute(text(f'DROP TRIGGER IF EXISTS "{table}_gallery_delete" ON "{table}"'))
+        conn.execute(text(
+            f'CREATE TRIGGER "{table}_gallery_insert" AFTER INSERT ON "{table}" '
+            f"FOR EACH ROW WHEN (NEW.embedding IS NOT NULL) "
+            f"EXECUTE FUNCTION notify_gallery_change('{id_column}')"
+        ))
+        conn.execute(text(
+            f'CREATE TRIGGER "{table}_gallery_update" AFTER UPDATE OF embedding ON "{table}" '
+            f"FOR EACH ROW WHEN (OLD.embedding IS DISTINCT FROM NEW.embedding) "
+            f"EXECUTE FUNCTION notify_gallery_change('{id_column}')"
+        ))
+        conn.execute(text(
+            f'CREATE TRIGGER "{table}_gallery_delete" AFTER DELETE ON "{table}" '
+            f"FOR EACH ROW WHEN (OLD.embedding IS NOT NULL) "
+            f"EXECUTE FUNCTION notify_gallery_change('{id_column}')"
+        ))
+
+    # Roster membership: the offering id is what matters to the listeners.
+    conn.execute(text('DROP TRIGGER IF EXISTS "enrollments_gallery_change" ON "enrollments"'))
+    conn.execute(text(
+        'CREATE TRIGGER "enrollments_gallery_change" AFTER INSERT OR UPDATE OR DELETE ON "enrollments" '
+        "FOR EACH ROW EXECUTE FUNCTION notify_gallery_change('offering_id')"
+    ))
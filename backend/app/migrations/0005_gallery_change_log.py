@@ -0,0 +1,55 @@
+"""
+Persist gallery change notifications in gallery_change_log so a worker that
+loads a snapshot (or reconnects) can replay everything after the snapshot's
+sequence number instead of reloading every embedding. The NOTIFY payload
+gains the log "seq".
+"""
+from sqlalchemy import text
+
+transactional = True
+
+CHANNEL = "gallery_changes"
+
+
+def upgrade(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS gallery_change_log (
+            seq BIGSERIAL PRIMARY KEY,
+            table_name VARCHAR(64) NOT NULL,
+            identity_id BIGINT NOT NULL,
+            op VARCHAR(8) NOT NULL,
+            changed_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+        )
+    """))
+    conn.execute(text(
+        "ALTER TABLE gallery_change_log ALTER COLUMN changed_at SET DEFAULT (NOW() AT TIME ZONE 'utc')"
+    ))
+
+    conn.execute(text(f"""
+        CREATE OR REPLACE FUNCTION notify_gallery_change() RETURNS trigger AS $$
+        DECLARE
+            row_data jsonb;
+            changed_id bigint;
+            change_seq bigint;
+        BEGIN
+            IF TG_OP = 'DELETE' THEN
+                row_data := to_jsonb(OLD);
+            ELSE
+                row_data := to_jsonb(NEW);
+            END IF;
+            changed_id := (row_data ->> TG_ARGV[0])::bigint;
+
+            INSERT INTO gallery_change_log (table_name, identity_id, op)
+            VALUES (TG_TABLE_NAME, changed_id, TG_OP)
+            RETURNING seq INTO change_seq;
+
+            PERFORM pg_notify('{CHANNEL}', json_build_object(
+                'table', TG_TABLE_NAME,
+                'op', TG_OP,
+                'id', changed_id,
+                'seq', change_seq
+            )::text);
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """))
@@ -0,0 +1,26 @@
+"""
+Per-user face templates. Existing users get their stored embedding as a
+single enrollment template, so two-stage search covers them immediately.
+"""
+from sqlalchemy import text
+
+transactional = True
+
+
+def upgrade(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS face_templates (
+            template_id SERIAL PRIMARY KEY,
+            user_id INTEGER NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            embedding vector(512) NOT NULL,
+            source VARCHAR(16) NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_face_templates_user_id ON face_templates (user_id)"))
+    conn.execute(text(
+        "INSERT INTO face_templates (user_id, embedding, source, created_at) "
+        "SELECT u.id, u.embedding, 'enroll', COALESCE(u.created_at, NOW() AT TIME ZONE 'utc') FROM users u "
+        "WHERE u.embedding IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM face_templates t WHERE t.user_id = u.id)"
+    ))
@@ -0,0 +1,12 @@
+"""
+Columns recording a suspected duplicate face found at registration.
+"""
+from ..migrate import add_column_if_missing
+
+transactional = True
+
+
+def upgrade(conn):
+    add_column_if_missing(conn, "users", "duplicate_of_type", "VARCHAR(16)")
+    add_column_if_missing(conn, "users", "duplicate_of_id", "INTEGER")
+    add_column_if_missing(conn, "users", "duplicate_similarity", "DOUBLE PRECISION")
@@ -0,0 +1,37 @@
+"""
+Bulk enrollment jobs and their per-student failures.
+"""
+from sqlalchemy import text
+
+transactional = True
+
+
+def upgrade(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS enrollment_jobs (
+            job_id SERIAL PRIMARY KEY,
+            target VARCHAR(16) NOT NULL,
+            source VARCHAR(512) NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            total INTEGER NOT NULL,
+            processed INTEGER NOT NULL,
+            succeeded INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            error TEXT,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            started_at TIMESTAMP WITHOUT TIME ZONE,
+            finished_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS enrollment_job_errors (
+            id SERIAL PRIMARY KEY,
+            job_id INTEGER NOT NULL REFERENCES enrollment_jobs (job_id) ON DELETE CASCADE,
+            enrollment_number VARCHAR(64),
+            error TEXT NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_enrollment_job_errors_job_id ON enrollment_job_errors (job_id)"
+    ))
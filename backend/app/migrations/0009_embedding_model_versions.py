@@ -0,0 +1,55 @@
+"""
+Embedding model versioning: a version column on every embedding, the
+active model in embedding_model_state, stored aligned crops and a staging
+table for re-embedding. Existing embeddings came from the default model.
+"""
+from sqlalchemy import text
+
+from .. import config
+from ..migrate import add_column_if_missing
+
+transactional = True
+
+VERSIONED_TABLES = ("users", "students", "faculty", "face_templates")
+
+
+def upgrade(conn):
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS face_crops (
+            crop_id SERIAL PRIMARY KEY,
+            identity_type VARCHAR(16) NOT NULL,
+            identity_id INTEGER NOT NULL,
+            image BYTEA NOT NULL,
+            created_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """))
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_face_crops_identity ON face_crops (identity_type, identity_id)"
+    ))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS embedding_model_state (
+            id SERIAL PRIMARY KEY,
+            active_version VARCHAR(64) NOT NULL,
+            updated_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """))
+    conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS embedding_staging (
+            model_version VARCHAR(64) NOT NULL,
+            crop_id INTEGER NOT NULL REFERENCES face_crops (crop_id) ON DELETE CASCADE,
+            embedding vector(512) NOT NULL,
+            PRIMARY KEY (model_version, crop_id)
+        )
+    """))
+
+    for table in VERSIONED_TABLES:
+        add_column_if_missing(conn, table, "embedding_model_version", "VARCHAR(64)")
+        conn.execute(text(
+            f'UPDATE "{table}" SET embedding_model_version = :v '
+            "WHERE embedding IS NOT NULL AND embedding_model_version IS NULL"
+        ), {"v": config.EDGEFACE_MODEL})
+
+    conn.execute(text(
+        "INSERT INTO embedding_model_state (id, active_version, updated_at) "
+        "VALUES (1, :v, NOW() AT TIME ZONE 'utc') ON CONFLICT (id) DO NOTHING"
+    ), {"v": config.EDGEFACE_MODEL})
@@ -0,0 +1,29 @@
+"""
+One attendance record per (session, student). Existing duplicates keep their
+earliest record. A partitioned attendance_records cannot carry a unique index
+without the partition key, so there the advisory lock taken when marking
+(crud_async.mark_attendance) is the only guard.
+"""
+from sqlalchemy import text
+
+from ..partitions import is_partitioned
+
+transactional = True
+
+
+def upgrade(conn):
+    if is_partitioned(conn, "attendance_records"):
+        print("attendance_records is partitioned; relying on the marking lock instead of a unique index.")
+        return
+    conn.execute(text("LOCK TABLE attendance_records IN SHARE ROW EXCLUSIVE MODE"))
+    removed = conn.execute(text(
+        "DELETE FROM attendance_records r USING attendance_records keep "
+        "WHERE r.session_id = keep.session_id AND r.student_id = keep.student_id "
+        "AND r.record_id > keep.record_id"
+    )).rowcount
+    if removed:
+        print(f"Removed {removed} duplicate attendance records.")
+    conn.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_attendance_records_session_student "
+        "ON attendance_records (session_id, student_id)"
+    ))
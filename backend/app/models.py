@@ -1,6 +1,6 @@
 from sqlalchemy import (
-    Column, Integer, String, DateTime, Boolean, ForeignKey, SmallInteger, 
-    Text, Enum as SAEnum, CheckConstraint, Float
+    Column, Integer, BigInteger, String, DateTime, Boolean, ForeignKey, SmallInteger, 
+    Text, Enum as SAEnum, CheckConstraint, Float, Index, LargeBinary
 )
 from sqlalchemy.orm import relationship
 from pgvector.sqlalchemy import Vector
@@ -54,6 +54,7 @@ class Student(Base):
     program_id = Column(Integer, ForeignKey("programs.program_id"))
     admission_year = Column(SmallInteger)
     embedding = Column(Vector(512)) # face embedding
+    embedding_model_version = Column(String(64))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     # Relationships
@@ -75,6 +76,7 @@ class Faculty(Base):
     non_teaching_role = Column(SAEnum(NonTeachingRole, name="non_teaching_role"), nullable=True)
     department_id = Column(Integer) # Can link to a Departments table if normalized further
     embedding = Column(Vector(512)) # face embedding
+    embedding_model_version = Column(String(64))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     __table_args__ = (
@@ -212,6 +214,13 @@ class AttendanceRecord(Base):
     device_info = Column(String(255))
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+    # Range-partitioned by month on punch_in (see partitions.py); these become
+    # local indexes on every partition.
+    __table_args__ = (
+        Index("ix_attendance_records_punch_in", "punch_in"),
+        Index("ix_attendance_records_student_id_punch_in", "student_id", "punch_in"),
+    )
+
     # Relationships
     session = relationship("AttendanceSession", back_populates="attendance_records")
     student = relationship("Student", back_populates="attendance_records")
@@ -227,8 +236,67 @@ class User(Base):
     name = Column(String(255), index=True)
     enrollment_number = Column(String(64), unique=True, index=True)
     embedding = Column(Vector(512))
+    embedding_model_version = Column(String(64))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    # Set when registration found a near-identical face (DUPLICATE_ACTION=flag)
+    duplicate_of_type = Column(String(16))
+    duplicate_of_id = Column(Integer)
+    duplicate_similarity = Column(Float)
+
+class FaceTemplate(Base):
+    """
+    One embedding per enrollment capture or confident recognition. The
+    user's `embedding` is the normalized mean of their templates and serves
+    as the centroid for the first search stage.
+    """
+    __tablename__ = "face_templates"
+
+    template_id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    embedding = Column(Vector(512), nullable=False)
+    source = Column(String(16), nullable=False, default="enroll")  # enroll | recognition
+    embedding_model_version = Column(String(64))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class FaceCrop(Base):
+    """
+    Compressed aligned 112x112 face (JPEG) from an enrollment, so every
+    identity can be re-embedded when the embedding model changes.
+    """
+    __tablename__ = "face_crops"
+
+    crop_id = Column(Integer, primary_key=True)
+    identity_type = Column(String(16), nullable=False)  # user | student | faculty
+    identity_id = Column(Integer, nullable=False)
+    image = Column(LargeBinary, nullable=False)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_face_crops_identity", "identity_type", "identity_id"),
+    )
+
+class EmbeddingModelState(Base):
+    """
+    Single row naming the embedding model every worker must use.
+    """
+    __tablename__ = "embedding_model_state"
+
+    id = Column(Integer, primary_key=True)
+    active_version = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class EmbeddingStaging(Base):
+    """
+    Normalized embeddings of face_crops under a model that is not active
+    yet, written by reembed.py and applied on switch.
+    """
+    __tablename__ = "embedding_staging"
+
+    model_version = Column(String(64), primary_key=True)
+    crop_id = Column(Integer, ForeignKey("face_crops.crop_id", ondelete="CASCADE"), primary_key=True)
+    embedding = Column(Vector(512), nullable=False)
+
 class Admin(Base):
     __tablename__ = "admins"
 
@@ -252,4 +320,52 @@ class Attendance(Base):
     
     timestamp = Column(DateTime, default=get_ist_time)
 
+    # Range-partitioned by month on timestamp (see partitions.py); these become
+    # local indexes on every partition.
+    __table_args__ = (
+        Index("ix_attendance_timestamp", "timestamp"),
+        Index("ix_attendance_user_id_timestamp", "user_id", "timestamp"),
+    )
+
     user = relationship("User")
+
+class GalleryChange(Base):
+    """
+    Append-only log of embedding changes, written by the gallery_changes
+    trigger. Lets a worker catch a gallery snapshot up to the present.
+    """
+    __tablename__ = "gallery_change_log"
+
+    seq = Column(BigInteger, primary_key=True)
+    table_name = Column(String(64), nullable=False)
+    identity_id = Column(BigInteger, nullable=False)
+    op = Column(String(8), nullable=False)
+    changed_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class EnrollmentJob(Base):
+    """
+    A bulk enrollment import (see bulk_enroll.py) and its progress.
+    """
+    __tablename__ = "enrollment_jobs"
+
+    job_id = Column(Integer, primary_key=True)
+    target = Column(String(16), nullable=False)  # student | user
+    source = Column(String(512), nullable=False)
+    status = Column(String(16), nullable=False, default="queued")  # queued | running | done | failed
+    total = Column(Integer, nullable=False, default=0)
+    processed = Column(Integer, nullable=False, default=0)
+    succeeded = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class EnrollmentJobError(Base):
+    __tablename__ = "enrollment_job_errors"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("enrollment_jobs.job_id", ondelete="CASCADE"), nullable=False, index=True)
+    enrollment_number = Column(String(64))
+    error = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
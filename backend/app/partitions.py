@@ -0,0 +1,287 @@
+"""
+Monthly range partitioning for the attendance tables.
+
+Usage (from the backend directory):
+    python -m app.partitions migrate              # one-off: convert tables to partitioned
+    python -m app.partitions create-ahead -m 3    # make sure upcoming months exist
+    python -m app.partitions archive -k 12        # detach + archive months older than 12
+
+`python -m app.migrate` also runs create-ahead on every deploy. Deploys can be
+further apart than the months created ahead, so schedule create-ahead monthly
+as well, e.g. from cron:
+    0 3 1 * *  cd /app/backend && python -m app.partitions create-ahead -m 3
+Rows for a month without a partition land in the default partition;
+create_partition moves them out when that month is created.
+"""
+import argparse
+import datetime
+import gzip
+import os
+import re
+
+from sqlalchemy import text
+
+from .db import engine
+
+# table -> (partition key, primary key column, owner column)
+PARTITIONED_TABLES = {
+    "attendance": ("timestamp", "id", "user_id"),
+    "attendance_records": ("punch_in", "record_id", "student_id"),
+}
+
+ARCHIVE_SCHEMA = "attendance_archive"
+PARTITION_RE = re.compile(r"^(?P<table>.+)_p(?P<year>\d{4})_(?P<month>\d{2})$")
+
+
+def _month_start(d: datetime.date) -> datetime.date:
+    return d.replace(day=1)
+
+
+def _add_months(d: datetime.date, months: int) -> datetime.date:
+    month = d.month - 1 + months
+    return datetime.date(d.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime.date) -> str:
+    return f"{table}_p{month.year:04d}_{month.month:02d}"
+
+
+def is_partitioned(conn, table: str) -> bool:
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :t)"
+    ), {"t": table}).scalar()
+
+
+def _exists(conn, name: str) -> bool:
+    return conn.execute(text("SELECT to_regclass(:n) IS NOT NULL"), {"n": name}).scalar()
+
+
+def create_partition(conn, table: str, month: datetime.date):
+    """
+    Creates the partition for `month` unless it exists. Postgres refuses to
+    create it while the default partition holds rows for that month, so the
+    default is detached, those rows are moved into the new partition and the
+    default is attached again, all in the caller's transaction.
+    """
+    key = PARTITIONED_TABLES[table][0]
+    start = _month_start(month)
+    end = _add_months(start, 1)
+    name = partition_name(table, start)
+    if _exists(conn, name):
+        return
+
+    default = f"{table}_default"
+    has_default = _exists(conn, default)
+    if has_default:
+        conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"'))
+    conn.execute(text(
+        f'CREATE TABLE "{name}" PARTITION OF "{table}" FOR VALUES FROM (\'{start}\') TO (\'{end}\')'
+    ))
+    if has_default:
+        moved = conn.execute(text(
+            f'WITH moved AS (DELETE FROM "{default}" WHERE "{key}" >= :start AND "{key}" < :end RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved'
+        ), {"start": start, "end": end}).rowcount
+        conn.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT'))
+        if moved:
+            print(f"Moved {moved} rows of '{table}' from {default} into {name}.")
+
+
+def create_partitions_ahead(conn, table: str, months_ahead: int = 3):
+    this_month = _month_start(datetime.date.today())
+    for i in range(months_ahead + 1):
+        create_partition(conn, table, _add_months(this_month, i))
+
+
+def migrate_table(conn, table: str, months_ahead: int = 3):
+    """
+    Rebuilds `table` as a RANGE-partitioned table on its time column.
+    Runs inside the caller's transaction; the old table is locked for the copy.
+    """
+    key, pk, owner = PARTITIONED_TABLES[table]
+    if is_partitioned(conn, table):
+        print(f"'{table}' is already partitioned, skipping.")
+        return
+
+    legacy = f"{table}_unpartitioned"
+    conn.execute(text(f'LOCK TABLE "{table}" IN ACCESS EXCLUSIVE MODE'))
+
+    # The partition key becomes part of the primary key, so it cannot hold
+    # NULLs; stop rather than inventing timestamps for those rows.
+    missing = conn.execute(text(f'SELECT COUNT(*) FROM "{table}" WHERE "{key}" IS NULL')).scalar()
+    if missing:
+        raise RuntimeError(
+            f"'{table}' has {missing} rows with NULL {key}; set their {key} before partitioning"
+        )
+
+    conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{legacy}"'))
+
+    # Free the primary key name for the new table.
+    pkey = conn.execute(text(
+        "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:t AS regclass) AND contype = 'p'"
+    ), {"t": legacy}).scalar()
+    if pkey:
+        conn.execute(text(f'ALTER TABLE "{legacy}" RENAME CONSTRAINT "{pkey}" TO "{legacy}_pkey"'))
+
+    # Foreign keys and secondary indexes are not copied by LIKE, so carry them
+    # over by definition. Unique indexes are skipped: on a partitioned table they
+    # would have to include the partition key.
+    fks = conn.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = CAST(:t AS regclass) AND contype = 'f'"
+    ), {"t": legacy}).fetchall()
+    index_defs = [r[0] for r in conn.execute(text(
+        "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i "
+        "WHERE i.indrelid = CAST(:t AS regclass) AND NOT i.indisunique"
+    ), {"t": legacy})]
+
+    conn.execute(text(
+        f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE ("{key}")'
+    ))
+    conn.execute(text(f'ALTER TABLE "{table}" ALTER COLUMN "{key}" SET NOT NULL'))
+    conn.execute(text(f'ALTER TABLE "{table}" ADD PRIMARY KEY ("{pk}", "{key}")'))
+    for name, definition in fks:
+        conn.execute(text(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}'))
+
+    # Keep the id sequence alive once the legacy table is dropped.
+    seq = conn.execute(text("SELECT pg_get_serial_sequence(:t, :c)"), {"t": legacy, "c": pk}).scalar()
+    if seq:
+        conn.execute(text(f'ALTER SEQUENCE {seq} OWNED BY "{table}"."{pk}"'))
+
+    # Monthly partitions covering existing data plus a few months ahead;
+    # anything outside that (e.g. bad clocks) lands in the default partition.
+    first = conn.execute(text(f'SELECT MIN("{key}") FROM "{legacy}"')).scalar()
+    month = _month_start(first.date()) if first else _month_start(datetime.date.today())
+    last = _add_months(_month_start(datetime.date.today()), months_ahead)
+    while month <= last:
+        create_partition(conn, table, month)
+        month = _add_months(month, 1)
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+
+    columns = [r[0] for r in conn.execute(text(
+        "SELECT attname FROM pg_attribute WHERE attrelid = CAST(:t AS regclass) "
+        "AND attnum > 0 AND NOT attisdropped ORDER BY attnum"
+    ), {"t": legacy})]
+    col_list = ", ".join(f'"{c}"' for c in columns)
+    copied = conn.execute(text(
+        f'INSERT INTO "{table}" ({col_list}) SELECT {col_list} FROM "{legacy}"'
+    )).rowcount
+    conn.execute(text(f'DROP TABLE "{legacy}"'))
+
+    # Indexes on the parent are created on every partition (local indexes).
+    for definition in index_defs:
+        definition = re.sub(rf'ON (\S+\.)?"?{legacy}"? ', f'ON "{table}" ', definition, count=1)
+        conn.execute(text(definition.replace("CREATE INDEX ", "CREATE INDEX IF NOT EXISTS ", 1)))
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "ix_{table}_{pk}" ON "{table}" ("{pk}")'))
+    conn.execute(text(f'CREATE INDEX IF NOT EXISTS "ix_{table}_{key}" ON "{table}" ("{key}")'))
+    conn.execute(text(
+        f'CREATE INDEX IF NOT EXISTS "ix_{table}_{owner}_{key}" ON "{table}" ("{owner}", "{key}")'
+    ))
+    conn.execute(text(f'ANALYZE "{table}"'))
+    print(f"Partitioned '{table}' by month on '{key}' ({copied} rows copied).")
+
+
+def list_partitions(conn, table: str):
+    """
+    Returns [(partition_name, month_start)] for the monthly partitions of `table`.
+    """
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:t AS regclass) ORDER BY c.relname"
+    ), {"t": table}).fetchall()
+
+    partitions = []
+    for (name,) in rows:
+        m = PARTITION_RE.match(name)
+        if m and m.group("table") == table:
+            partitions.append((name, datetime.date(int(m.group("year")), int(m.group("month")), 1)))
+    return partitions
+
+
+def _export_partition(name: str, export_dir: str) -> str:
+    path = os.path.join(export_dir, f"{name}.csv.gz")
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        with gzip.open(path, "wb") as f:
+            cur.copy_expert(f'COPY "{name}" TO STDOUT WITH CSV HEADER', f)
+        cur.close()
+    finally:
+        raw.close()
+    return path
+
+
+def archive_partitions(table: str, keep_months: int = 12, export_dir: str = None, dry_run: bool = False):
+    """
+    Detaches monthly partitions older than `keep_months`. Detached partitions are
+    moved to the archive schema, or exported to gzipped CSV and dropped when
+    `export_dir` is given.
+    """
+    cutoff = _add_months(_month_start(datetime.date.today()), -keep_months)
+
+    with engine.connect() as conn:
+        old = [(n, m) for n, m in list_partitions(conn, table) if m < cutoff]
+
+    if not old:
+        print(f"No partitions of '{table}' older than {cutoff}.")
+        return []
+
+    archived = []
+    for name, month in old:
+        if dry_run:
+            print(f"Would archive {name} ({month:%Y-%m}).")
+            continue
+
+        # Short transaction per partition so the parent lock is held only briefly.
+        with engine.begin() as conn:
+            conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+            conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+            if not export_dir:
+                conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"'))
+                conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"'))
+
+        if export_dir:
+            path = _export_partition(name, export_dir)
+            with engine.begin() as conn:
+                conn.execute(text(f'DROP TABLE "{name}"'))
+            print(f"Archived {name} to {path}.")
+        else:
+            print(f"Archived {name} to schema '{ARCHIVE_SCHEMA}'.")
+        archived.append(name)
+    return archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance partition maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("migrate", help="Convert attendance tables to monthly partitions")
+    p.add_argument("-m", "--months-ahead", type=int, default=3)
+
+    p = sub.add_parser("create-ahead", help="Create partitions for the coming months")
+    p.add_argument("-m", "--months-ahead", type=int, default=3)
+
+    p = sub.add_parser("archive", help="Detach and archive old partitions")
+    p.add_argument("-k", "--keep-months", type=int, default=12)
+    p.add_argument("--export-dir", help="Export to gzipped CSV here and drop, instead of moving to the archive schema")
+    p.add_argument("--dry-run", action="store_true")
+
+    p_args = parser.parse_args()
+
+    for table in PARTITIONED_TABLES:
+        if p_args.command == "migrate":
+            with engine.begin() as conn:
+                migrate_table(conn, table, p_args.months_ahead)
+        elif p_args.command == "create-ahead":
+            with engine.begin() as conn:
+                create_partitions_ahead(conn, table, p_args.months_ahead)
+            print(f"Partitions for '{table}' exist through {p_args.months_ahead} months ahead.")
+        elif p_args.command == "archive":
+            archive_partitions(table, p_args.keep_months, p_args.export_dir, p_args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Cheap per-face quality score from what detection already gives us (box,
+MTCNN probability, 5 landmarks) plus the sharpness of a small grey crop.
+It is computed before alignment and embedding, so low-quality frames
+(blurred, tiny, turned away) are never embedded.
+
+Each factor is in [0, 1] and the score is their product:
+    detection  MTCNN probability
+    size       face width relative to QUALITY_FULL_SIZE pixels
+    sharpness  variance of the Laplacian, saturating around QUALITY_SHARPNESS
+    pose       penalties for yaw, roll and pitch estimated from the landmarks
+"""
+import numpy as np
+from PIL import Image
+
+from . import config
+
+# Side of the grey crop sharpness is measured on
+SHARPNESS_SIZE = 64
+
+class FaceQuality:
+    def __init__(self, score, prob, size, sharpness, yaw, roll, pitch):
+        self.score = score
+        self.prob = prob
+        self.size = size
+        self.sharpness = sharpness
+        self.yaw = yaw
+        self.roll = roll
+        self.pitch = pitch
+
+    def as_dict(self):
+        return {name: round(float(value), 4) for name, value in vars(self).items()}
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """
+    Variance of the 4-neighbour Laplacian; low for blurred images.
+    """
+    gray = np.asarray(gray, dtype=np.float32)
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4.0 * gray[1:-1, 1:-1]
+    return float(lap.var())
+
+def sharpness(image: Image.Image, box) -> float:
+    face = image.crop(tuple(int(v) for v in box)).convert("L").resize((SHARPNESS_SIZE, SHARPNESS_SIZE))
+    return laplacian_variance(np.asarray(face))
+
+def pose(points):
+    """
+    Rough (yaw, roll, pitch) from MTCNN's landmarks (left eye, right eye,
+    nose, mouth left, mouth right). Roll is the eye-line angle in degrees;
+    yaw is the nose offset from the eye midpoint in eye distances (0 when
+    frontal, about +-0.5 in profile); pitch is how far the nose sits from
+    halfway between the eyes and the mouth (0 when level).
+    """
+    points = np.asarray(points, dtype=np.float32)
+    left_eye, right_eye, nose = points[0], points[1], points[2]
+    eye_vector = right_eye - left_eye
+    eye_distance = float(np.linalg.norm(eye_vector))
+    if eye_distance == 0:
+        return 1.0, 0.0, 1.0
+    roll = float(np.degrees(np.arctan2(eye_vector[1], eye_vector[0])))
+
+    # Undo the roll so yaw and pitch are measured along the face axes
+    c, s = eye_vector / eye_distance
+    rotate = np.array([[c, s], [-s, c]], dtype=np.float32)
+    eye_mid = (left_eye + right_eye) / 2
+    upright = (points - eye_mid) @ rotate.T
+    yaw = float(upright[2, 0] / eye_distance)
+    mouth_y = float(upright[3:, 1].mean())
+    pitch = float(upright[2, 1] / mouth_y - 0.5) if mouth_y > 0 else 1.0
+    return yaw, roll, pitch
+
+def score_face(image: Image.Image, box, prob: float, points) -> FaceQuality:
+    width = box[2] - box[0]
+    sharp = sharpness(image, box)
+    yaw, roll, pitch = pose(points)
+
+    size_factor = min(1.0, width / config.QUALITY_FULL_SIZE)
+    sharp_factor = sharp / (sharp + config.QUALITY_SHARPNESS)
+    pose_factor = (
+        max(0.0, 1.0 - abs(yaw) / config.QUALITY_MAX_YAW)
+        * max(0.0, 1.0 - abs(roll) / config.QUALITY_MAX_ROLL)
+        * max(0.0, 1.0 - abs(pitch) / config.QUALITY_MAX_PITCH)
+    )
+    score = prob * size_factor * sharp_factor * pose_factor
+    return FaceQuality(score, prob, width, sharp, yaw, roll, pitch)
+
+def best_k(candidates, k: int, min_score: float = 0.0):
+    """
+    The k highest-quality (quality, ...) candidates scoring at least
+    `min_score`, best first.
+    """
+    ranked = sorted((c for c in candidates if c[0].score >= min_score), key=lambda c: c[0].score, reverse=True)
+    return ranked[:k]
+
+def weighted_centroid(embeddings, weights) -> np.ndarray:
+    """
+    Quality-weighted mean of normalized embeddings, normalized.
+    """
+    from .gallery import normalize_rows
+
+    weights = np.asarray(weights, dtype=np.float32)
+    if weights.sum() <= 0:
+        weights = np.ones_like(weights)
+    return normalize_rows((normalize_rows(embeddings) * weights[:, None]).sum(axis=0) / weights.sum())
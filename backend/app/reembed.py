@@ -0,0 +1,239 @@
+"""
+Re-embedding every stored face with a new embedding model.
+
+Enrollments keep their aligned crops in face_crops. Moving to a new model
+is done in two steps so recognition keeps running on the old one meanwhile:
+
+    run     embeds crops in batches into embedding_staging under the new
+            model version. Resumable: crops already staged are skipped, so
+            it can be stopped and restarted, and re-run for stragglers.
+    switch  in one transaction, checks every crop is staged, replaces each
+            identity's embedding (and users' templates) with the staged
+            ones, one UPDATE ... FROM per batch of identities, and makes
+            the new model active. Workers are notified, load
+            the new model and reload their galleries. Identities already on
+            the new model are left alone, so run + switch again picks up
+            anyone enrolled with the old model in the meantime.
+
+Identities without crops (enrolled before crops were kept) cannot be
+re-embedded; switch refuses unless --force, which clears their embedding so
+they have to enroll again.
+
+Usage (from the backend directory):
+    python -m app.reembed run --model NAME [--batch 256] [--device cpu]
+    python -m app.reembed status --model NAME
+    python -m app.reembed switch --model NAME [--force] [--batch 1000]
+"""
+import argparse
+import json
+from collections import defaultdict
+from datetime import datetime
+
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import Column, Integer, MetaData, Table, delete, func, insert, select, text, update
+
+from . import config, crud, db, models
+from .gallery import centroid, normalize_rows, EMBEDDING_DIM, IDENTITY_TYPES
+
+CHANNEL = "gallery_changes"
+
+def _unstaged(model_version: str):
+    staged = select(models.EmbeddingStaging.crop_id).where(models.EmbeddingStaging.model_version == model_version)
+    return models.FaceCrop.crop_id.not_in(staged)
+
+def run(model_version: str, batch: int = 256, device: str = "cpu"):
+    from .edgeface import EdgeFaceWrapper, decode_crop
+
+    embedder = EdgeFaceWrapper(device=device, model_name=model_version)
+    done = 0
+    with db.SessionLocal() as session:
+        remaining = session.execute(select(func.count()).where(_unstaged(model_version))).scalar()
+        print(f"{remaining} crops to embed with {model_version}.")
+        last_id = 0
+        while True:
+            rows = session.execute(
+                select(models.FaceCrop.crop_id, models.FaceCrop.image)
+                .where(models.FaceCrop.crop_id > last_id, _unstaged(model_version))
+                .order_by(models.FaceCrop.crop_id)
+                .limit(batch)
+            ).all()
+            if not rows:
+                break
+            embeddings = normalize_rows(embedder.get_embeddings([decode_crop(image) for _, image in rows]))
+            session.execute(insert(models.EmbeddingStaging), [
+                {"model_version": model_version, "crop_id": crop_id, "embedding": embedding}
+                for (crop_id, _), embedding in zip(rows, embeddings)
+            ])
+            # Commit per batch so an interrupted run resumes where it stopped
+            session.commit()
+            last_id = rows[-1][0]
+            done += len(rows)
+            print(f"  {done}/{remaining}")
+    print(f"Staged {done} embeddings for {model_version}.")
+
+def _stale_ids(session, identity_type: str, model_version: str):
+    """
+    Ids of identities with an embedding from another model.
+    """
+    id_column, embedding_column = crud.IDENTITY_COLUMNS[identity_type]
+    version_column = id_column.class_.embedding_model_version
+    return set(session.execute(
+        select(id_column).where(
+            embedding_column.isnot(None),
+            version_column.is_distinct_from(model_version),
+        )
+    ).scalars())
+
+def status(model_version: str):
+    with db.SessionLocal() as session:
+        active = crud.get_active_model_version(session)
+        crops = session.execute(select(func.count()).select_from(models.FaceCrop)).scalar()
+        unstaged = session.execute(select(func.count()).where(_unstaged(model_version))).scalar()
+        print(f"Active model: {active}")
+        print(f"{model_version}: {crops - unstaged}/{crops} crops staged")
+        for identity_type in IDENTITY_TYPES:
+            stale = _stale_ids(session, identity_type, model_version)
+            with_crops = set(session.execute(
+                select(models.FaceCrop.identity_id).where(models.FaceCrop.identity_type == identity_type).distinct()
+            ).scalars())
+            print(f"  {identity_type}: {len(stale)} to replace, {len(stale - with_crops)} without crops")
+
+def _staged_by_identity(session, identity_type: str, model_version: str, identity_ids):
+    """
+    {identity_id: [staged embeddings]} in crop order, for some identities.
+    """
+    rows = session.execute(
+        select(models.FaceCrop.identity_id, models.EmbeddingStaging.embedding)
+        .join(models.EmbeddingStaging, models.EmbeddingStaging.crop_id == models.FaceCrop.crop_id)
+        .where(models.FaceCrop.identity_type == identity_type, models.EmbeddingStaging.model_version == model_version,
+               models.FaceCrop.identity_id.in_(identity_ids))
+        .order_by(models.FaceCrop.crop_id)
+    )
+    staged = defaultdict(list)
+    for identity_id, embedding in rows:
+        staged[identity_id].append(embedding)
+    return staged
+
+def _staged_ids(session, identity_type: str, model_version: str):
+    """
+    Ids of identities with at least one crop staged under `model_version`.
+    """
+    return set(session.execute(
+        select(models.FaceCrop.identity_id)
+        .join(models.EmbeddingStaging, models.EmbeddingStaging.crop_id == models.FaceCrop.crop_id)
+        .where(models.FaceCrop.identity_type == identity_type, models.EmbeddingStaging.model_version == model_version)
+        .distinct()
+    ).scalars())
+
+# New centroids for one batch of identities, applied with one UPDATE ... FROM
+centroids = Table(
+    "reembed_centroids", MetaData(),
+    Column("identity_id", Integer, primary_key=True, autoincrement=False),
+    Column("embedding", Vector(EMBEDDING_DIM)),
+    prefixes=["TEMPORARY"], postgresql_on_commit="DROP",
+)
+
+def _replace(session, identity_type: str, model_version: str, identity_ids):
+    """
+    Replaces a batch of identities' embeddings (and users' templates) with
+    their staged ones: centroids go to the temp table, then one UPDATE.
+    """
+    id_column, embedding_column = crud.IDENTITY_COLUMNS[identity_type]
+    model = id_column.class_
+    staged = _staged_by_identity(session, identity_type, model_version, identity_ids)
+    session.execute(insert(centroids), [
+        {"identity_id": identity_id, "embedding": centroid(embeddings)} for identity_id, embeddings in staged.items()
+    ])
+    session.execute(
+        update(model).where(id_column == centroids.c.identity_id)
+        .values({embedding_column: centroids.c.embedding, model.embedding_model_version: model_version})
+    )
+    session.execute(delete(centroids))
+
+    if identity_type == "user":
+        # Learned templates have no crop; the enrollment crops become the templates
+        session.execute(delete(models.FaceTemplate).where(models.FaceTemplate.user_id.in_(identity_ids)))
+        session.execute(insert(models.FaceTemplate), [
+            {"user_id": identity_id, "embedding": embedding, "source": "enroll",
+             "embedding_model_version": model_version, "created_at": datetime.utcnow()}
+            for identity_id, embeddings in staged.items() for embedding in embeddings
+        ])
+
+def _clear(session, identity_type: str, identity_ids):
+    id_column, embedding_column = crud.IDENTITY_COLUMNS[identity_type]
+    model = id_column.class_
+    session.execute(
+        update(model).where(id_column.in_(identity_ids))
+        .values({embedding_column: None, model.embedding_model_version: None})
+    )
+    if identity_type == "user":
+        session.execute(delete(models.FaceTemplate).where(models.FaceTemplate.user_id.in_(identity_ids)))
+
+def _batches(ids, size: int):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def switch(model_version: str, force: bool = False, batch: int = 1000):
+    with db.SessionLocal() as session:
+        session.execute(select(models.EmbeddingModelState).where(models.EmbeddingModelState.id == 1).with_for_update())
+        # No new crops (enrollments) until this commits
+        session.execute(text("LOCK TABLE face_crops IN SHARE MODE"))
+
+        unstaged = session.execute(select(func.count()).where(_unstaged(model_version))).scalar()
+        if unstaged:
+            raise SystemExit(f"{unstaged} crops are not staged yet; run `python -m app.reembed run --model {model_version}`")
+
+        plan, missing = {}, 0
+        for identity_type in IDENTITY_TYPES:
+            stale = _stale_ids(session, identity_type, model_version)
+            staged = _staged_ids(session, identity_type, model_version)
+            plan[identity_type] = (stale & staged, stale - staged)
+            missing += len(stale - staged)
+        if missing and not force:
+            raise SystemExit(f"{missing} identities have no stored crops; re-enroll them or pass --force to clear them")
+
+        centroids.create(session.connection())
+        for identity_type, (replaced, cleared) in plan.items():
+            # Set-based in bounded batches: memory and statement size stay
+            # flat however many identities there are
+            for identity_ids in _batches(replaced, batch):
+                _replace(session, identity_type, model_version, identity_ids)
+            for identity_ids in _batches(cleared, batch):
+                _clear(session, identity_type, identity_ids)
+            print(f"{identity_type}: {len(replaced)} re-embedded, {len(cleared)} cleared")
+
+        session.execute(
+            update(models.EmbeddingModelState).where(models.EmbeddingModelState.id == 1)
+            .values(active_version=model_version, updated_at=datetime.utcnow())
+        )
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {
+            "channel": CHANNEL,
+            "payload": json.dumps({"table": "embedding_model_state", "op": "UPDATE", "id": 1}),
+        })
+        session.commit()
+
+        # Staging for the active model is kept so a later run/switch only has
+        # to handle stragglers; other models' staging is stale
+        session.execute(delete(models.EmbeddingStaging).where(models.EmbeddingStaging.model_version != model_version))
+        session.commit()
+    print(f"Active embedding model is now {model_version}.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed stored faces with a new model")
+    parser.add_argument("command", choices=["run", "status", "switch"])
+    parser.add_argument("--model", default=config.EDGEFACE_MODEL, help="embedding model (torch hub name)")
+    parser.add_argument("--batch", type=int, help="crops per forward pass (run, default 256) or identities per UPDATE (switch, default 1000)")
+    parser.add_argument("--device", default="cpu", help="torch device (run)")
+    parser.add_argument("--force", action="store_true", help="clear identities without crops (switch)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run(args.model, args.batch or 256, args.device)
+    elif args.command == "status":
+        status(args.model)
+    else:
+        switch(args.model, args.force, args.batch or 1000)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+from fastapi.responses import JSONResponse, StreamingResponse
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Fast JSON for the large list endpoints. Rows come straight from column
+# selects (tuples), are zipped with their keys and encoded in one call, which
+# skips both ORM object construction and per-field Pydantic validation.
+
+NDJSON_BATCH_ROWS = 500
+
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+def _ndjson(keys, rows):
+    # Encode in batches so big pages stream without building one huge buffer
+    for i in range(0, len(rows), NDJSON_BATCH_ROWS):
+        batch = rows[i:i + NDJSON_BATCH_ROWS]
+        yield b"".join(dumps(dict(zip(keys, row))) + b"\n" for row in batch)
+
+def rows_response(keys, rows, format: str = "json"):
+    """
+    Serializes column-select rows as a JSON array of objects, or as
+    newline-delimited JSON streamed in batches when format == "ndjson".
+    """
+    if format == "ndjson":
+        return StreamingResponse(_ndjson(keys, rows), media_type="application/x-ndjson")
+    return FastJSONResponse([dict(zip(keys, row)) for row in rows])
@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List
 from .. import crud, models, schemas
-from ..db import get_db
+from ..db import get_db, get_read_db
+from ..responses import rows_response
 
 router = APIRouter(
     prefix="/admin",
@@ -18,8 +19,9 @@ def create_department(department: schemas.DepartmentCreate, db: Session = Depend
     return crud.create_department(db=db, department=department)
 
 @router.get("/departments", response_model=List[schemas.Department])
-def read_departments(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_departments(db, skip=skip, limit=limit)
+def read_departments(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(get_read_db)):
+    keys, rows = crud.get_rows(db, models.Department, skip=skip, limit=limit)
+    return rows_response(keys, rows, format)
 
 @router.delete("/departments/{dept_id}", response_model=schemas.Department)
 def delete_department(dept_id: int, db: Session = Depends(get_db)):
@@ -36,8 +38,9 @@ def create_program(program: schemas.ProgramCreate, db: Session = Depends(get_db)
     return crud.create_program(db=db, program=program)
 
 @router.get("/programs", response_model=List[schemas.Program])
-def read_programs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_programs(db, skip=skip, limit=limit)
+def read_programs(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(get_read_db)):
+    keys, rows = crud.get_rows(db, models.Program, skip=skip, limit=limit)
+    return rows_response(keys, rows, format)
 
 @router.delete("/programs/{program_id}", response_model=schemas.Program)
 def delete_program(program_id: int, db: Session = Depends(get_db)):
@@ -54,8 +57,9 @@ def create_subject(subject: schemas.SubjectCreate, db: Session = Depends(get_db)
     return crud.create_subject(db=db, subject=subject)
 
 @router.get("/subjects", response_model=List[schemas.Subject])
-def read_subjects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_subjects(db, skip=skip, limit=limit)
+def read_subjects(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(get_read_db)):
+    keys, rows = crud.get_rows(db, models.Subject, skip=skip, limit=limit)
+    return rows_response(keys, rows, format)
 
 @router.delete("/subjects/{subject_id}", response_model=schemas.Subject)
 def delete_subject(subject_id: int, db: Session = Depends(get_db)):
@@ -72,8 +76,9 @@ def create_location(location: schemas.LocationCreate, db: Session = Depends(get_
     return crud.create_location(db=db, location=location)
 
 @router.get("/locations", response_model=List[schemas.Location])
-def read_locations(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_locations(db, skip=skip, limit=limit)
+def read_locations(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(get_read_db)):
+    keys, rows = crud.get_rows(db, models.Location, skip=skip, limit=limit)
+    return rows_response(keys, rows, format)
 
 @router.delete("/locations/{location_id}", response_model=schemas.Location)
 def delete_location(location_id: int, db: Session = Depends(get_db)):
@@ -90,8 +95,9 @@ def create_faculty(faculty: schemas.FacultyCreate, db: Session = Depends(get_db)
     return crud.create_faculty(db=db, faculty=faculty)
 
 @router.get("/faculty", response_model=List[schemas.Faculty])
-def read_faculty(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_faculty(db, skip=skip, limit=limit)
+def read_faculty(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(get_read_db)):
+    keys, rows = crud.get_rows(db, models.Faculty, skip=skip, limit=limit)
+    return rows_response(keys, rows, format)
 
 @router.delete("/faculty/{faculty_id}", response_model=schemas.Faculty)
 def delete_faculty(faculty_id: int, db: Session = Depends(get_db)):
@@ -108,8 +114,9 @@ def create_offering(offering: schemas.OfferingCreate, db: Session = Depends(get_
     return crud.create_offering(db=db, offering=offering)
 
 @router.get("/offerings", response_model=List[schemas.CourseOffering])
-def read_offerings(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_offerings(db, skip=skip, limit=limit)
+def read_offerings(skip: int = 0, limit: int = 100, format: str = "json", db: Session = Depends(get_read_db)):
+    keys, rows = crud.get_rows(db, models.CourseOffering, skip=skip, limit=limit)
+    return rows_response(keys, rows, format)
 
 @router.delete("/offerings/{offering_id}", response_model=schemas.CourseOffering)
 def delete_offering(offering_id: int, db: Session = Depends(get_db)):
@@ -184,6 +184,9 @@ class User(UserBase):
     id: int
     created_at: datetime
     # embedding is internal, usually not exposed in Pydantic unless needed
+    duplicate_of_type: Optional[str] = None
+    duplicate_of_id: Optional[int] = None
+    duplicate_similarity: Optional[float] = None
     
     class Config:
         orm_mode = True
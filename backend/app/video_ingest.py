@@ -0,0 +1,379 @@
+"""
+Attendance from a recorded lecture: a local video file (needs opencv-python)
+or a directory of frames named in playback order.
+
+Frames are sampled adaptively: every VIDEO_MIN_INTERVAL seconds while a face
+track still wants crops or the scene moves, backing off to VIDEO_MAX_INTERVAL
+when it is static. Skipped video frames are only grabbed, never decoded.
+Detections are linked across frames by box overlap (IoU), and each track
+keeps just its best few aligned crops by quality.py score. A track is
+embedded once, when it ends, in a batch with other finished tracks. Its
+crops' centroid is then matched, and each identity gets one decision: its
+best track.
+
+Memory is bounded by the faces on screen: no frames are retained, and a
+track holds at most VIDEO_CROPS_PER_TRACK 112x112 crops.
+
+Usage (from the backend directory):
+    python -m app.video_ingest PATH --session ID [--dry-run]
+    python -m app.video_ingest PATH [--types user,student,faculty|all]
+    (frame directories: --fps, the rate the frames were extracted at)
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+from . import config
+from .quality import score_face
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Mean absolute change of a 64x36 grey thumbnail (0-255) counted as motion
+MOTION_THRESHOLD = 4.0
+
+# ------------------------------------------------------------
+# Frame sources
+# ------------------------------------------------------------
+
+class VideoFrames:
+    def __init__(self, path: str):
+        if cv2 is None:
+            raise SystemExit("Reading video files needs opencv-python (or pass a directory of frames)")
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise SystemExit(f"Cannot open video {path}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 25.0
+        self.index = -1
+
+    def read_at(self, t: float):
+        """
+        (timestamp, RGB image) of the first frame at or after `t` seconds,
+        or None at the end. Frames in between are grabbed without decoding.
+        """
+        target = max(self.index + 1, int(round(t * self.fps)))
+        while self.index < target:
+            if not self.capture.grab():
+                return None
+            self.index += 1
+        ok, frame = self.capture.retrieve()
+        if not ok:
+            return None
+        return self.index / self.fps, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    def close(self):
+        self.capture.release()
+
+class FrameDirectory:
+    def __init__(self, path: str, fps: float):
+        self.paths = sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        self.fps = fps
+        self.index = -1
+
+    def read_at(self, t: float):
+        self.index = max(self.index + 1, int(round(t * self.fps)))
+        if self.index >= len(self.paths):
+            return None
+        return self.index / self.fps, Image.open(self.paths[self.index]).convert("RGB")
+
+    def close(self):
+        pass
+
+def open_frames(path: str, fps: float):
+    return FrameDirectory(path, fps) if os.path.isdir(path) else VideoFrames(path)
+
+class AdaptiveSampler:
+    """
+    Picks the next sample time: fast while tracks still want crops or the
+    scene changes, doubling the interval up to the maximum otherwise.
+    """
+    def __init__(self, min_interval: float, max_interval: float):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._thumbnail = None
+
+    def motion(self, image: Image.Image) -> float:
+        thumbnail = np.asarray(image.convert("L").resize((64, 36)), dtype=np.float32)
+        previous, self._thumbnail = self._thumbnail, thumbnail
+        return float(np.abs(thumbnail - previous).mean()) if previous is not None else np.inf
+
+    def next_time(self, t: float, busy: bool, motion: float) -> float:
+        if busy or motion > MOTION_THRESHOLD:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * 2)
+        return t + self.interval
+
+# ------------------------------------------------------------
+# Tracking
+# ------------------------------------------------------------
+
+def iou(box, boxes: np.ndarray) -> np.ndarray:
+    """
+    Overlap of one (x1, y1, x2, y2) box with each row of `boxes`.
+    """
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+class Track:
+    def __init__(self, track_id: int, box, t: float):
+        self.track_id = track_id
+        self.box = box
+        self.first_seen = self.last_seen = t
+        self.hits = 0
+        self.crops = []  # (quality, crop), best first
+
+    def wants(self, quality: float, keep: int) -> bool:
+        return len(self.crops) < keep or quality > self.crops[-1][0]
+
+    def add_crop(self, quality: float, crop, keep: int):
+        self.crops.append((quality, crop))
+        self.crops.sort(key=lambda c: c[0], reverse=True)
+        del self.crops[keep:]
+
+class IoUTracker:
+    """
+    Greedy IoU association: each detection continues the overlapping track
+    it matches best, or starts a new one. Tracks unseen for `max_age`
+    seconds are closed.
+    """
+    def __init__(self, iou_threshold: float, max_age: float, keep: int):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.keep = keep
+        self.tracks = []
+        self._next_id = 1
+
+    def busy(self) -> bool:
+        return any(len(track.crops) < self.keep for track in self.tracks)
+
+    def update(self, t: float, detections):
+        """
+        detections: [(box, quality, align)] where align() returns the crop.
+        Returns the tracks that closed.
+        """
+        pairs = []
+        if self.tracks and detections:
+            boxes = np.array([d[0] for d in detections], dtype=np.float32)
+            for ti, track in enumerate(self.tracks):
+                for di, overlap in enumerate(iou(np.asarray(track.box, dtype=np.float32), boxes)):
+                    if overlap >= self.iou_threshold:
+                        pairs.append((overlap, ti, di))
+        pairs.sort(reverse=True)
+
+        matched_tracks, matched = set(), {}
+        for _, ti, di in pairs:
+            if ti in matched_tracks or di in matched:
+                continue
+            matched_tracks.add(ti)
+            matched[di] = self.tracks[ti]
+        for di, (box, quality, align) in enumerate(detections):
+            track = matched.get(di)
+            if track is None:
+                track = Track(self._next_id, box, t)
+                self._next_id += 1
+                self.tracks.append(track)
+            track.box, track.last_seen = box, t
+            track.hits += 1
+            # Only align faces that make it into the track's best crops
+            if track.wants(quality, self.keep):
+                crop = align()
+                if crop is not None:
+                    track.add_crop(quality, crop, self.keep)
+
+        closed = [track for track in self.tracks if t - track.last_seen > self.max_age]
+        self.tracks = [track for track in self.tracks if t - track.last_seen <= self.max_age]
+        return closed
+
+    def close_all(self):
+        closed, self.tracks = self.tracks, []
+        return closed
+
+# ------------------------------------------------------------
+# Pipeline
+# ------------------------------------------------------------
+
+class VideoIngest:
+    """
+    Runs a recording through detection, tracking and matching. `index` is
+    a Gallery (or ShardedGallery); `embedder.get_embeddings` embeds crops.
+    Faces are aligned with `landmarks.align_detection` (an AntiSpoofing) as
+    at enrollment, or with MTCNN's points when it is None.
+    """
+    def __init__(self, detector, embedder, index, threshold: float, types=None, landmarks=None):
+        self.detector = detector
+        self.landmarks = landmarks
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self.types = types
+        self.decisions = {}  # identity id -> best track decision
+        self.tracks_seen = 0
+        self.unknown_tracks = 0
+        self._pending = []
+
+    def _detect(self, image: Image.Image):
+        scale = min(1.0, config.VIDEO_DETECT_WIDTH / image.width)
+        small = image.resize((round(image.width * scale), round(image.height * scale))) if scale < 1 else image
+        faces = self.detector.detect_all(
+            small, min_prob=config.CLASSROOM_MIN_DETECTION_PROB, min_size=config.CLASSROOM_MIN_FACE * scale
+        )
+        detections = []
+        for box, prob, points in faces:
+            # Align on the full-resolution frame
+            box = tuple(int(v / scale) for v in box)
+            points = np.asarray(points) / scale
+            detections.append((
+                box, score_face(image, box, prob, points).score,
+                lambda box=box, points=points: self._align(image, box, points),
+            ))
+        return detections
+
+    def _align(self, image: Image.Image, box, points):
+        if self.landmarks is None:
+            return self.detector.align_face_5(image, points)
+        return self.landmarks.align_detection(self.detector, image, box, points)
+
+    def _close(self, tracks, flush: bool = False):
+        self._pending += [t for t in tracks if t.crops and t.hits >= config.VIDEO_TRACK_MIN_HITS]
+        crops = sum(len(t.crops) for t in self._pending)
+        if self._pending and (flush or crops >= config.VIDEO_EMBED_BATCH):
+            self._resolve(self._pending)
+            self._pending = []
+
+    def _resolve(self, tracks):
+        """
+        One forward pass and one batch search for a group of closed tracks.
+        """
+        from .gallery import centroid
+
+        embeddings = self.embedder.get_embeddings([crop for t in tracks for _, crop in t.crops])
+        queries, offset = [], 0
+        for track in tracks:
+            queries.append(centroid(embeddings[offset:offset + len(track.crops)]))
+            offset += len(track.crops)
+        self.tracks_seen += len(tracks)
+        for track, matches in zip(tracks, self.index.search_batch(np.stack(queries), k=1, types=self.types)):
+            identity_id, sim = matches[0] if matches else (None, -1.0)
+            if identity_id is None or sim <= self.threshold:
+                self.unknown_tracks += 1
+                continue
+            decision = self.decisions.get(identity_id)
+            if decision is None or sim > decision["similarity"]:
+                self.decisions[identity_id] = {
+                    "similarity": float(sim), "first_seen": track.first_seen, "last_seen": track.last_seen,
+                    "tracks": decision["tracks"] if decision else 0,
+                }
+            self.decisions[identity_id]["tracks"] += 1
+
+    def run(self, frames):
+        tracker = IoUTracker(config.VIDEO_TRACK_IOU, config.VIDEO_TRACK_MAX_AGE, config.VIDEO_CROPS_PER_TRACK)
+        sampler = AdaptiveSampler(config.VIDEO_MIN_INTERVAL, config.VIDEO_MAX_INTERVAL)
+        t, sampled, duration = 0.0, 0, 0.0
+        while True:
+            frame = frames.read_at(t)
+            if frame is None:
+                break
+            duration, image = frame
+            sampled += 1
+            self._close(tracker.update(duration, self._detect(image)))
+            t = sampler.next_time(duration, tracker.busy(), sampler.motion(image))
+        self._close(tracker.close_all(), flush=True)
+        return sampled, duration
+
+def load_index(session_id, types):
+    """
+    The roster of an attendance session, or the identity index.
+    """
+    from . import db, identities
+    from .gallery import Gallery
+
+    options = config.GALLERY_OPTIONS
+    with db.SessionLocal() as session:
+        if session_id is not None:
+            from . import crud
+
+            rows = crud.get_session_roster(session, session_id)
+            if rows is None:
+                raise SystemExit(f"Attendance session {session_id} not found")
+            return Gallery.from_rows(rows, **options)
+        return identities.load(session, **options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Mark attendance from a recorded video")
+    parser.add_argument("path", help="video file, or a directory of frames")
+    parser.add_argument("--session", type=int, help="attendance session: match its roster and mark attendance")
+    parser.add_argument("--types", default=config.RECOGNITION_IDENTITY_TYPES,
+                        help="identity types to match without --session (comma separated or all)")
+    parser.add_argument("--fps", type=float, default=25.0, help="frame rate of a frame directory")
+    parser.add_argument("--dry-run", action="store_true", help="report decisions without marking attendance")
+    parser.add_argument("--json", action="store_true", help="print decisions as JSON")
+    args = parser.parse_args()
+
+    from . import crud, db
+    from .antispoofing import AntiSpoofing
+    from .detector import FaceDetector
+    from .edgeface import EdgeFaceWrapper
+    from .gallery import split_key, type_codes
+
+    types = None
+    if args.session is None and args.types != "all":
+        types = tuple(t.strip() for t in args.types.split(",") if t.strip())
+        type_codes(types)
+
+    with db.SessionLocal() as session:
+        model_name = crud.get_active_model_version(session)
+    pipeline = VideoIngest(FaceDetector(), EdgeFaceWrapper(model_name=model_name),
+                           load_index(args.session, types), config.RECOGNITION_THRESHOLD, types, AntiSpoofing())
+    frames = open_frames(args.path, args.fps)
+    started = time.perf_counter()
+    try:
+        sampled, duration = pipeline.run(frames)
+    finally:
+        frames.close()
+    elapsed = time.perf_counter() - started
+
+    decisions = []
+    for identity_id, decision in sorted(pipeline.decisions.items(), key=lambda d: d[1]["first_seen"]):
+        if args.session is None:
+            identity_type, identity_id = split_key(identity_id)
+            decision = {"identity_type": identity_type, **decision}
+        decisions.append({"identity_id": identity_id, **decision})
+
+    created, already = {}, {}
+    if args.session is not None and not args.dry_run:
+        with db.SessionLocal() as session:
+            created, already = crud.create_attendance_records(
+                session, args.session, [(d["identity_id"], d["similarity"]) for d in decisions]
+            )
+
+    if args.json:
+        print(json.dumps({"decisions": decisions, "marked": len(created), "already_marked": len(already)}))
+        return
+    for d in decisions:
+        who = f"{d.get('identity_type', 'student')} {d['identity_id']}"
+        status = "marked" if d["identity_id"] in created else "already marked" if d["identity_id"] in already else "seen"
+        print(f"{who}: {status}, similarity {d['similarity']:.3f}, "
+              f"{d['first_seen']:.1f}s-{d['last_seen']:.1f}s, {d['tracks']} tracks")
+    print(f"{duration:.0f}s of video in {elapsed:.1f}s ({duration / max(elapsed, 1e-9):.1f}x real time), "
+          f"{sampled} frames sampled, {pipeline.tracks_seen} tracks, {pipeline.unknown_tracks} unknown, "
+          f"{len(created)} marked.")
+
+if __name__ == "__main__":
+    main()
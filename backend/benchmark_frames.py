@@ -0,0 +1,74 @@
+"""
+Compares a login burst sent as multipart file parts (/recognize) with the
+FRM1 binary payload (/recognize/frames): request size and server-side
+parsing time. Frames are random bytes of the given sizes; pass the sizes
+of real JPEGs (e.g. full 640x480 screenshots vs 256x256 centre crops).
+
+Usage (from the backend directory):
+    python benchmark_frames.py [--frames 8] [--multipart-bytes 60000]
+        [--frm1-bytes 15000] [--chunk 65536] [--repeat 200]
+"""
+import argparse
+import os
+import time
+
+from app import frames
+
+BOUNDARY = b"----benchmarkboundary"
+
+def multipart_body(parts):
+    body = []
+    for index, data in enumerate(parts):
+        body.append(b"--" + BOUNDARY + b"\r\n")
+        body.append(b'Content-Disposition: form-data; name="files"; filename="login_%d.jpg"\r\n' % index)
+        body.append(b"Content-Type: image/jpeg\r\n\r\n")
+        body.append(data + b"\r\n")
+    body.append(b'--' + BOUNDARY + b'\r\nContent-Disposition: form-data; name="liveness"\r\n\r\ntrue\r\n')
+    body.append(b"--" + BOUNDARY + b"--\r\n")
+    return b"".join(body)
+
+def time_multipart(body, chunk, repeat):
+    try:
+        from python_multipart import MultipartParser
+    except ImportError:
+        try:
+            from multipart import MultipartParser
+        except ImportError:
+            return None
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parser = MultipartParser(BOUNDARY, {})
+        for i in range(0, len(body), chunk):
+            parser.write(body[i:i + chunk])
+        parser.finalize()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+def time_frm1(body, count, chunk, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        parser = frames.FrameParser(count, len(body), len(body))
+        for i in range(0, len(body), chunk):
+            parser.feed(body[i:i + chunk])
+        parser.close()
+    return (time.perf_counter() - started) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multipart vs FRM1 burst uploads")
+    parser.add_argument("--frames", type=int, default=8)
+    parser.add_argument("--multipart-bytes", type=int, default=60000, help="JPEG size of a full screenshot")
+    parser.add_argument("--frm1-bytes", type=int, default=15000, help="JPEG size of a centre crop")
+    parser.add_argument("--chunk", type=int, default=65536)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    multipart = multipart_body([os.urandom(args.multipart_bytes) for _ in range(args.frames)])
+    frm1 = frames.encode_frames([os.urandom(args.frm1_bytes) for _ in range(args.frames)], (256, 256))
+
+    multipart_ms = time_multipart(multipart, args.chunk, args.repeat)
+    frm1_ms = time_frm1(frm1, args.frames, args.chunk, args.repeat)
+    parse = f"{multipart_ms:.3f} ms parse" if multipart_ms is not None else "parse not timed (python-multipart missing)"
+    print(f"multipart: {len(multipart)} bytes, {parse}")
+    print(f"FRM1:      {len(frm1)} bytes, {frm1_ms:.3f} ms parse")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compares gallery precisions on a synthetic test set.
+
+Builds float32 and int8 galleries from the same embeddings the way the app
+loads them from the database (Gallery.from_rows) and checks that every query
+gets the same top-1 match and the same accept/reject decision as float32, then
+reports scan memory, resident (heap) memory and search latency. The int8
+gallery's float32 rerank rows live in a temporary file, so its resident
+memory only shrinks when TMPDIR is disk backed.
+
+Usage (from the backend directory):
+    python benchmark_gallery.py [--identities 50000] [--queries 1000]
+"""
+import argparse
+import time
+import numpy as np
+
+from app.gallery import Gallery, PRECISIONS, normalize_rows
+
+def make_test_set(identities: int, queries: int, dim: int, noise: float, seed: int):
+    rng = np.random.default_rng(seed)
+    gallery = normalize_rows(rng.standard_normal((identities, dim)))
+    # Half genuine (noisy captures of enrolled faces), half impostors
+    genuine_ids = rng.integers(0, identities, queries // 2)
+    genuine = gallery[genuine_ids] + noise * rng.standard_normal((len(genuine_ids), dim)) / np.sqrt(dim)
+    impostors = rng.standard_normal((queries - len(genuine_ids), dim))
+    return gallery, normalize_rows(np.vstack([genuine, impostors]))
+
+def run(gallery: Gallery, queries: np.ndarray, threshold: float):
+    decisions = []
+    started = time.perf_counter()
+    for q in queries:
+        matches = gallery.search(q, k=1)
+        best_id, sim = matches[0] if matches else (None, -1.0)
+        decisions.append((best_id, sim > threshold))
+    return decisions, (time.perf_counter() - started) / len(queries)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reduced-precision galleries")
+    parser.add_argument("--identities", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--noise", type=float, default=1.0)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--rerank-k", type=int, default=32)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    embeddings, queries = make_test_set(args.identities, args.queries, args.dim, args.noise, args.seed)
+    ids = np.arange(1, args.identities + 1)
+
+    reference = None
+    for precision in PRECISIONS:
+        gallery = Gallery.from_rows(zip(ids, embeddings), dim=args.dim, precision=precision, rerank_k=args.rerank_k)
+        decisions, latency = run(gallery, queries, args.threshold)
+        if reference is None:
+            reference = decisions
+        same = sum(a == b for a, b in zip(decisions, reference))
+        print(f"{precision:8s} scan {gallery.nbytes / 1e6:8.1f} MB  "
+              f"resident {gallery.resident_bytes / 1e6:8.1f} MB  "
+              f"{latency * 1000:7.2f} ms/query  "
+              f"decisions matching float32: {same}/{len(decisions)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from app import config, gallery_snapshot
+from app.gallery import Gallery, identity_key
+
+
+def write_gallery(directory, count=50, precision="float32"):
+    rng = np.random.default_rng(0)
+    ids = [identity_key("user", i) for i in range(1, count + 1)]
+    vectors = rng.standard_normal((count, 512)).astype(np.float32)
+    path = gallery_snapshot.write_snapshot(str(directory), zip(ids, vectors), 1, 0, precision=precision)
+    gallery_snapshot.publish(str(directory), path)
+    return ids, vectors
+
+
+def test_load_current_with_app_gallery_options(tmp_path):
+    # The exact keyword arguments main.py passes when loading the snapshot
+    ids, vectors = write_gallery(tmp_path)
+    snapshot = gallery_snapshot.load_current(str(tmp_path), **config.GALLERY_OPTIONS)
+
+    assert snapshot is not None
+    assert len(snapshot) == len(ids)
+    assert snapshot.template_shortlist == config.GALLERY_OPTIONS["template_shortlist"]
+    best_id, similarity = snapshot.search(vectors[7], k=1)[0]
+    assert best_id == ids[7]
+    assert similarity > 0.99
+
+
+def test_open_empty_snapshot_with_app_gallery_options(tmp_path):
+    path = gallery_snapshot.write_snapshot(str(tmp_path), [], 1, 0)
+    snapshot = gallery_snapshot.open_snapshot(path, **config.GALLERY_OPTIONS)
+
+    assert len(snapshot) == 0
+    assert snapshot.template_shortlist == config.GALLERY_OPTIONS["template_shortlist"]
+
+
+def test_snapshot_keeps_templates_after_reset(tmp_path):
+    ids, vectors = write_gallery(tmp_path, precision="int8")
+    snapshot = gallery_snapshot.load_current(str(tmp_path), precision="int8", rerank_k=8, template_shortlist=4)
+    live = Gallery(**config.GALLERY_OPTIONS)
+    live.reset(snapshot)
+
+    assert live.template_shortlist == 4
+    assert live.search(vectors[3], k=1)[0][0] == ids[3]
@@ -1,11 +1,17 @@
 import requests
 import bz2
 import os
+import sys
 
-URL = "http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2"
-FILE_NAME = "backend/app/shape_predictor_68_face_landmarks.dat"
+# 68: full landmark model (alignment + blink), 5: small model for LANDMARK_PROFILE=5
+MODELS = {
+    "68": "shape_predictor_68_face_landmarks.dat",
+    "5": "shape_predictor_5_face_landmarks.dat",
+}
 
-def download_and_extract():
+def download_and_extract(points="68"):
+    URL = f"http://dlib.net/files/{MODELS[points]}.bz2"
+    FILE_NAME = f"backend/app/{MODELS[points]}"
     print(f"Downloading {URL}...")
     response = requests.get(URL, stream=True)
     if response.status_code == 200:
@@ -23,4 +29,6 @@ def download_and_extract():
         print("Failed to download model.")
 
 if __name__ == "__main__":
-    download_and_extract()
+    # Usage: python download_dlib_model.py [68|5 ...]
+    for points in sys.argv[1:] or ["68"]:
+        download_and_extract(points)
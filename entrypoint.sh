@@ -0,0 +1,10 @@
+#!/bin/sh
+set -e
+
+# Apply pending schema migrations once per container start, before any worker
+# boots. Set RUN_MIGRATIONS=0 when a separate release step runs them.
+if [ "${RUN_MIGRATIONS:-1}" = "1" ]; then
+    python -m backend.app.migrate
+fi
+
+exec "$@"
@@ -29,9 +29,11 @@ export const registerStudent = async (studentData, images) => {
     return response.data;
 };
 
-export const recognizeStudent = async (images, sessionId = null) => {
+export const recognizeStudent = async (images, sessionId = null, liveness = false) => {
     const formData = new FormData();
     if (sessionId) formData.append('session_id', sessionId);
+    // Server checks blink / face motion across the same frames
+    if (liveness) formData.append('liveness', 'true');
 
     images.forEach((image, index) => {
         formData.append('files', image, `login_${index}.jpg`);
@@ -45,6 +47,42 @@ export const recognizeStudent = async (images, sessionId = null) => {
     return response.data;
 };
 
+// FRM1 burst payload (backend app/frames.py): "FRM1", frame count (uint8),
+// frame width and height (uint16, 0 = any size), then each JPEG prefixed
+// with its uint32 length. All big-endian.
+const encodeFrames = (blobs, width = 0, height = 0) => {
+    const header = new DataView(new ArrayBuffer(9));
+    [...'FRM1'].forEach((c, i) => header.setUint8(i, c.charCodeAt(0)));
+    header.setUint8(4, blobs.length);
+    header.setUint16(5, width);
+    header.setUint16(7, height);
+
+    const parts = [header];
+    blobs.forEach((blob) => {
+        const length = new DataView(new ArrayBuffer(4));
+        length.setUint32(0, blob.size);
+        parts.push(length, blob);
+    });
+    return new Blob(parts, { type: 'application/octet-stream' });
+};
+
+// Same as recognizeStudent, with the whole burst in one binary body.
+// `size` is the [width, height] of pre-cropped frames, if fixed.
+export const recognizeFrames = async (blobs, sessionId = null, liveness = false, size = null) => {
+    const params = {};
+    if (sessionId) params.session_id = sessionId;
+    if (liveness) params.liveness = true;
+
+    const body = encodeFrames(blobs, ...(size || [0, 0]));
+    const response = await api.post('/recognize/frames', body, {
+        params,
+        headers: {
+            'Content-Type': 'application/octet-stream',
+        },
+    });
+    return response.data;
+};
+
 export const detectBlink = async (imageBlob) => {
     const formData = new FormData();
     formData.append("file", imageBlob, "blink_check.jpg");
@@ -1,83 +1,77 @@
-import React, { useState, useRef, useCallback, useEffect } from 'react';
+import React, { useState, useRef, useCallback } from 'react';
 import Webcam from 'react-webcam';
-import { recognizeStudent, detectBlink } from '../api';
+import { recognizeFrames } from '../api';
 import { Link } from 'react-router-dom';
 
+// One burst covers a natural blink (~300ms); liveness is checked server-side
+// on the same frames used for recognition.
+const BURST_FRAMES = 8;
+const FRAME_INTERVAL_MS = 200;
+// Frames are the centre square of the video scaled to CROP_SIZE px: the face
+// fills most of it and each JPEG is a fraction of a full screenshot.
+const CROP_SIZE = 256;
+const JPEG_QUALITY = 0.85;
+
+// Draws the centre square of the current video frame and encodes it
+// straight to a JPEG Blob (null if the camera is not ready).
+const captureFrame = (video, canvas) => new Promise((resolve) => {
+    if (!video || !video.videoWidth) {
+        resolve(null);
+        return;
+    }
+    const side = Math.min(video.videoWidth, video.videoHeight);
+    canvas.getContext('2d').drawImage(
+        video,
+        (video.videoWidth - side) / 2, (video.videoHeight - side) / 2, side, side,
+        0, 0, CROP_SIZE, CROP_SIZE
+    );
+    canvas.toBlob(resolve, 'image/jpeg', JPEG_QUALITY);
+});
+
 const Login = () => {
     const webcamRef = useRef(null);
-    const [message, setMessage] = useState('Blink 3 times to verify you are real.');
+    const [message, setMessage] = useState('Look at the camera and blink once while we capture.');
     const [status, setStatus] = useState('verifying'); // verifying, success, error, login_processing
-
-    const [blinkCount, setBlinkCount] = useState(0);
-    const [isBlinking, setIsBlinking] = useState(false); // Track state to avoid double counting
-
-    // Blink Detection Loop
-    useEffect(() => {
-        let interval;
-        if (status === 'verifying' && blinkCount < 3) {
-            interval = setInterval(async () => {
-                if (webcamRef.current) {
-                    const imageSrc = webcamRef.current.getScreenshot();
-                    if (imageSrc) {
-                        try {
-                            const blob = await (await fetch(imageSrc)).blob();
-                            const res = await detectBlink(blob);
-
-                            if (res.blink) {
-                                if (!isBlinking) {
-                                    setIsBlinking(true); // Eyes closed
-                                }
-                            } else {
-                                if (isBlinking) {
-                                    // Eyes opened after closing -> Blink completed
-                                    setIsBlinking(false);
-                                    setBlinkCount(c => c + 1);
-                                }
-                            }
-                        } catch (err) {
-                            console.error("Blink error", err);
-                        }
-                    }
-                }
-            }, 500); // Check every 500ms
-        } else if (blinkCount >= 3 && status === 'verifying') {
-            // Blinks complete
-            setMessage("Verification Complete. Marking Attendance...");
-            setStatus('login_processing');
-            autoLogin();
-        }
-        return () => clearInterval(interval);
-    }, [status, blinkCount, isBlinking]);
+    const [captured, setCaptured] = useState(0);
 
     const autoLogin = useCallback(async () => {
-        setMessage("Capturing multi-frame samples for accuracy...");
+        setMessage("Capturing frames... please blink once.");
         setStatus('login_processing');
 
+        const canvas = document.createElement('canvas');
+        canvas.width = CROP_SIZE;
+        canvas.height = CROP_SIZE;
+
         const frames = [];
-        for (let i = 0; i < 5; i++) {
-            const imageSrc = webcamRef.current.getScreenshot();
-            if (imageSrc) {
-                const blob = await (await fetch(imageSrc)).blob();
+        for (let i = 0; i < BURST_FRAMES; i++) {
+            const blob = await captureFrame(webcamRef.current?.video, canvas);
+            if (blob) {
                 frames.push(blob);
+                setCaptured(frames.length);
             }
-            await new Promise(resolve => setTimeout(resolve, 200)); // 200ms between frames
+            await new Promise(resolve => setTimeout(resolve, FRAME_INTERVAL_MS));
         }
 
         try {
-            // Updated to use recognizeStudent
-            const data = await recognizeStudent(frames);
+            // liveness=true: the server refuses (and marks nothing) unless live,
+            // so `status` alone is the result
+            const data = await recognizeFrames(frames, null, true, [CROP_SIZE, CROP_SIZE]);
             if (data.status === 'success') {
                 setStatus('success');
                 // Backend returns: status, student, enrollment_number, similarity, session_id
                 setMessage(`Welcome, ${data.student} (${data.enrollment_number})! Attendance Marked.`);
+                return;
+            } else if (data.liveness && !data.liveness.live) {
+                setStatus('error');
+                setMessage('Liveness check failed: please blink naturally and try again.');
             } else {
                 setStatus('error');
                 setMessage('Recognition failed: Student not recognized.');
-                setTimeout(() => {
-                    setStatus('verifying');
-                    setBlinkCount(0); // Reset blinks to retry
-                }, 3000);
             }
+            setTimeout(() => {
+                setStatus('verifying');
+                setCaptured(0); // Ready to retry
+            }, 3000);
         } catch (error) {
             setStatus('error');
             setMessage('Error: ' + (error.response?.data?.detail || error.message));
@@ -98,14 +92,14 @@ const Login = () => {
                     videoConstraints={{ facingMode: "user" }}
                 />
 
-                {/* Liveness Overlay */}
+                {/* Capture Overlay */}
                 <div className="absolute top-4 right-4 bg-black/60 px-3 py-1 rounded-full text-xs font-mono border border-white/20">
-                    Blinks: {blinkCount} / 3
+                    Frames: {captured} / {BURST_FRAMES}
                 </div>
 
-                {status === 'verifying' && (
+                {status === 'login_processing' && (
                     <div className="absolute bottom-4 left-0 right-0 text-center text-[var(--accent-color)] font-bold drop-shadow-md animate-pulse">
-                        {blinkCount < 3 ? "PLEASE BLINK EYES" : "VERIFIED"}
+                        PLEASE BLINK EYES
                     </div>
                 )}
             </div>
@@ -114,16 +108,16 @@ const Login = () => {
                 <div className="h-2 bg-gray-700 rounded-full overflow-hidden">
                     <div
                         className="h-full bg-[var(--success)] transition-all duration-300"
-                        style={{ width: `${(blinkCount / 3) * 100}%` }}
+                        style={{ width: `${(captured / BURST_FRAMES) * 100}%` }}
                     ></div>
                 </div>
             </div>
 
-            {/* Manual Trigger (Fallback or after liveness) */}
+            {/* Capture burst: recognition and liveness in one request */}
             <button
                 onClick={autoLogin}
-                disabled={blinkCount < 3 || status === 'login_processing'}
-                className={`btn-primary mb-6 flex items-center justify-center gap-2 ${blinkCount < 3 ? 'opacity-50 cursor-not-allowed' : ''}`}
+                disabled={status === 'login_processing'}
+                className={`btn-primary mb-6 flex items-center justify-center gap-2 ${status === 'login_processing' ? 'opacity-50 cursor-not-allowed' : ''}`}
             >
                 {status === 'login_processing' ? 'Authenticating...' : 'Mark Attendance'}
             </button>